@@ -0,0 +1,369 @@
+"""
+Customer and product analytics for the admin reports.
+
+Sold orders (sales_rollup.SOLD_STATUSES) and their items are bulk-loaded into
+NumPy column arrays once per ANALYTICS_CACHE_TTL seconds; every report is then
+computed over those arrays with grouped reductions (bincount, ufunc.at,
+sorting) instead of row-by-row SQL or Python loops:
+
+- rfm_segments: recency / frequency / monetary quintile scores per customer,
+  rolled up into segments
+- cohort_retention: share of each first-order-month cohort that ordered again
+  N months later
+- basket_sizes: units per order distribution and order value percentiles
+- category_revenue: revenue, units and orders per category
+
+The snapshot is shared between requests and must not be mutated. Reports lag
+order writes by up to ANALYTICS_CACHE_TTL seconds.
+"""
+
+import threading
+from datetime import date, datetime
+
+import numpy as np
+
+from config import Config
+from cache import TTLCache
+from database import get_db
+from app_logging import get_logger
+import sales_rollup
+
+logger = get_logger('analytics')
+
+dataset_cache = TTLCache(maxsize=1, ttl=Config.ANALYTICS_CACHE_TTL)
+
+# Only one request rebuilds an expired snapshot; the others wait for it
+_load_lock = threading.Lock()
+
+FETCH_BATCH_SIZE = 50000
+
+# (segment, condition on recency score r and frequency/monetary score fm); first match wins
+RFM_SEGMENTS = [
+    ('champions', lambda r, fm: (r >= 4) & (fm >= 4)),
+    ('loyal', lambda r, fm: (r >= 3) & (fm >= 3)),
+    ('new', lambda r, fm: r >= 4),
+    ('promising', lambda r, fm: r == 3),
+    ('at_risk', lambda r, fm: fm >= 3),
+    ('hibernating', lambda r, fm: r >= 1)  # everyone else
+]
+
+
+# ========== LOADING ==========
+def _fetch_columns(cursor, query, params, dtypes):
+    """Run a query on a tuple cursor and return its columns as arrays of ``dtypes``"""
+    cursor.execute(query, params)
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.float64))
+
+    data = np.concatenate(chunks) if chunks else np.empty((0, len(dtypes)))
+    return [data[:, i].astype(dtype) for i, dtype in enumerate(dtypes)]
+
+
+def load_dataset():
+    """Column arrays of every sold order and its items; None if the DB is unavailable"""
+    conn = get_db()
+    if not conn:
+        return None
+
+    statuses = sorted(sales_rollup.SOLD_STATUSES)
+    status_placeholders = ','.join(['%s'] * len(statuses))
+
+    # Plain (tuple) cursor: numeric columns only, DECIMALs cast to DOUBLE in SQL
+    cursor = conn.cursor()
+    try:
+        order_id, order_user, order_day, order_amount = _fetch_columns(cursor, f"""
+            SELECT id, user_id, DATEDIFF(created_at, '1970-01-01'), total_amount * 1e0
+            FROM orders
+            WHERE status IN ({status_placeholders})
+            ORDER BY id
+        """, statuses, (np.int64, np.int64, np.int64, np.float64))
+
+        item_order, item_product, item_quantity, item_revenue = _fetch_columns(cursor, f"""
+            SELECT oi.order_id, oi.product_id, oi.quantity, oi.quantity * oi.price_at_time * 1e0
+            FROM order_items oi
+            JOIN orders o ON o.id = oi.order_id
+            WHERE o.status IN ({status_placeholders})
+        """, statuses, (np.int64, np.int64, np.int64, np.float64))
+
+        product_id, product_category = _fetch_columns(cursor, """
+            SELECT id, COALESCE(category_id, 0) FROM products
+        """, (), (np.int64, np.int64))
+
+        cursor.execute("SELECT id, name FROM categories")
+        category_names = dict(cursor.fetchall())
+    finally:
+        cursor.close()
+        conn.close()
+
+    # Dense product id -> category id lookup (0 = uncategorized)
+    category_of = np.zeros(int(max(product_id.max(initial=0), item_product.max(initial=0))) + 1, dtype=np.int64)
+    category_of[product_id] = product_category
+
+    return {
+        'order_user': order_user,
+        'order_day': order_day,
+        'order_amount': order_amount,
+        # Row of each item's order in the order arrays (orders are sorted by id)
+        'item_row': np.searchsorted(order_id, item_order),
+        'item_quantity': item_quantity,
+        'item_revenue': item_revenue,
+        'item_category': category_of[item_product],
+        'category_names': category_names,
+        'loaded_at': datetime.now().isoformat(timespec='seconds')
+    }
+
+
+def get_dataset():
+    """Cached column snapshot; None if the DB is unavailable"""
+    data = dataset_cache.get('dataset')
+    if data is not None:
+        return data
+
+    with _load_lock:
+        data = dataset_cache.get('dataset')
+        if data is None:
+            started = datetime.now()
+            data = load_dataset()
+            if data is not None:
+                dataset_cache.set('dataset', data)
+                logger.info("Analytics snapshot loaded", extra={'fields': {
+                    'orders': int(data['order_user'].size),
+                    'items': int(data['item_row'].size),
+                    'ms': round((datetime.now() - started).total_seconds() * 1000, 1)
+                }})
+    return data
+
+
+# ========== HELPERS ==========
+def _day(value):
+    """YYYY-MM-DD -> days since 1970-01-01; raises ValueError on a bad date"""
+    return (datetime.strptime(value, '%Y-%m-%d').date() - date(1970, 1, 1)).days
+
+
+def _today():
+    return (date.today() - date(1970, 1, 1)).days
+
+
+def validate_dates(start_date, end_date):
+    """Raise ValueError unless both dates are empty or YYYY-MM-DD"""
+    for value in (start_date, end_date):
+        if value:
+            _day(value)
+
+
+def _order_mask(data, start_date, end_date):
+    """Boolean mask of the orders placed in the inclusive date range"""
+    mask = np.ones(data['order_day'].size, dtype=bool)
+    if start_date:
+        mask &= data['order_day'] >= _day(start_date)
+    if end_date:
+        mask &= data['order_day'] <= _day(end_date)
+    return mask
+
+
+def _group_extreme(ufunc, inverse, size, values, initial):
+    """Per-group maximum/minimum of ``values`` (ufunc is np.maximum or np.minimum)"""
+    result = np.full(size, initial, dtype=values.dtype)
+    ufunc.at(result, inverse, values)
+    return result
+
+
+def _distinct(keys):
+    """Sorted distinct values (a plain sort is much faster than np.unique on large int keys)"""
+    keys = np.sort(keys)
+    if keys.size == 0:
+        return keys
+    return keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+
+
+def _quintiles(values):
+    """Score 1-5 by quintile of ``values`` (higher is better); ties share a score"""
+    ranks = np.searchsorted(np.sort(values), values, side='left')
+    return 1 + ranks * 5 // values.size
+
+
+def _month(value):
+    """YYYY-MM-DD or a date -> months since 1970-01"""
+    return int(np.datetime64(value, 'D').astype('datetime64[M]').astype(np.int64))
+
+
+def _month_label(month_index):
+    return str(np.datetime64(int(month_index), 'M'))
+
+
+# ========== REPORTS ==========
+def rfm_segments(data, start_date=None, end_date=None):
+    """Customers scored on recency, frequency and monetary value, summarized per segment"""
+    mask = _order_mask(data, start_date, end_date)
+    users = data['order_user'][mask]
+    days = data['order_day'][mask]
+    amounts = data['order_amount'][mask]
+    as_of = _day(end_date) if end_date else _today()
+
+    if users.size == 0:
+        return {'as_of': str(np.datetime64(as_of, 'D')), 'customers': 0, 'segments': []}
+
+    customers, inverse = np.unique(users, return_inverse=True)
+    frequency = np.bincount(inverse)
+    monetary = np.bincount(inverse, weights=amounts)
+    recency = as_of - _group_extreme(np.maximum, inverse, customers.size, days, np.iinfo(np.int64).min)
+
+    r_score = _quintiles(-recency)
+    fm_score = (_quintiles(frequency) + _quintiles(monetary) + 1) // 2
+    segment = np.select(
+        [condition(r_score, fm_score) for _, condition in RFM_SEGMENTS],
+        np.arange(len(RFM_SEGMENTS)))
+
+    counts = np.bincount(segment, minlength=len(RFM_SEGMENTS))
+    revenue = np.bincount(segment, weights=monetary, minlength=len(RFM_SEGMENTS))
+    recency_sum = np.bincount(segment, weights=recency, minlength=len(RFM_SEGMENTS))
+    frequency_sum = np.bincount(segment, weights=frequency, minlength=len(RFM_SEGMENTS))
+    total_revenue = monetary.sum()
+
+    segments = []
+    for idx, (name, _) in enumerate(RFM_SEGMENTS):
+        count = int(counts[idx])
+        segments.append({
+            'segment': name,
+            'customers': count,
+            'share': round(count / customers.size, 4),
+            'revenue': round(float(revenue[idx]), 2),
+            'revenue_share': round(float(revenue[idx] / total_revenue), 4) if total_revenue else 0.0,
+            'avg_recency_days': round(float(recency_sum[idx] / count), 1) if count else None,
+            'avg_frequency': round(float(frequency_sum[idx] / count), 2) if count else None,
+            'avg_monetary': round(float(revenue[idx] / count), 2) if count else None
+        })
+
+    return {
+        'as_of': str(np.datetime64(as_of, 'D')),
+        'customers': int(customers.size),
+        'segments': segments
+    }
+
+
+def cohort_retention(data, start_date=None, end_date=None, months=12):
+    """
+    Customers grouped by the month of their first order; for each cohort the
+    share still ordering 0..months-1 months later (None for months still ahead).
+    The date range selects cohorts, not orders.
+    """
+    users = data['order_user']
+    if users.size == 0:
+        return {'months': months, 'cohorts': []}
+
+    month = data['order_day'].astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    customers, inverse = np.unique(users, return_inverse=True)
+    first_month = _group_extreme(np.minimum, inverse, customers.size, month, np.iinfo(np.int64).max)
+
+    # One entry per (customer, months since first order) with at least one order
+    offset = month - first_month[inverse]
+    recent = offset < months
+    active = _distinct(inverse[recent] * months + offset[recent])
+    active_customer = active // months
+
+    cohorts, cohort_of_customer = np.unique(first_month, return_inverse=True)
+    cells = cohort_of_customer[active_customer] * months + active % months
+    matrix = np.bincount(cells, minlength=cohorts.size * months).reshape(cohorts.size, months)
+
+    selected = np.ones(cohorts.size, dtype=bool)
+    if start_date:
+        selected &= cohorts >= _month(start_date)
+    if end_date:
+        selected &= cohorts <= _month(end_date)
+
+    current_month = _month(date.today())
+    result = []
+    for idx in np.flatnonzero(selected):
+        size = int(matrix[idx, 0])
+        elapsed = int(current_month - cohorts[idx])
+        result.append({
+            'cohort': _month_label(cohorts[idx]),
+            'customers': size,
+            'retention': [
+                round(float(matrix[idx, k] / size), 4) if k <= elapsed else None
+                for k in range(months)
+            ]
+        })
+
+    return {'months': months, 'cohorts': result}
+
+
+def basket_sizes(data, start_date=None, end_date=None, max_units=20):
+    """Distribution of units per order (last bucket is max_units or more) and order value percentiles"""
+    mask = _order_mask(data, start_date, end_date)
+    order_count = int(mask.sum())
+    if order_count == 0:
+        return {'orders': 0, 'distribution': [], 'units': None, 'lines': None, 'order_value': None}
+
+    item_mask = mask[data['item_row']]
+    rows = data['item_row'][item_mask]
+    units = np.bincount(rows, weights=data['item_quantity'][item_mask],
+                        minlength=mask.size)[mask].astype(np.int64)
+    lines = np.bincount(rows, minlength=mask.size)[mask]
+    values = data['order_amount'][mask]
+
+    histogram = np.bincount(np.minimum(units, max_units), minlength=max_units + 1)
+    distribution = [
+        {
+            'units': f'{size}+' if size == max_units else str(size),
+            'orders': int(histogram[size]),
+            'share': round(float(histogram[size] / order_count), 4)
+        }
+        for size in range(1, max_units + 1)
+    ]
+
+    def summary(array):
+        p50, p90, p99 = np.percentile(array, [50, 90, 99])
+        return {
+            'mean': round(float(array.mean()), 2),
+            'p50': round(float(p50), 2),
+            'p90': round(float(p90), 2),
+            'p99': round(float(p99), 2)
+        }
+
+    return {
+        'orders': order_count,
+        'distribution': distribution,
+        'units': summary(units),
+        'lines': summary(lines),
+        'order_value': summary(values)
+    }
+
+
+def category_revenue(data, start_date=None, end_date=None):
+    """Revenue, units and orders per category, highest revenue first"""
+    mask = _order_mask(data, start_date, end_date)
+    item_mask = mask[data['item_row']]
+    categories = data['item_category'][item_mask]
+    if categories.size == 0:
+        return {'total_revenue': 0.0, 'categories': []}
+
+    # Category ids are small integers, so they index the per-category totals directly
+    revenue = np.bincount(categories, weights=data['item_revenue'][item_mask])
+    units = np.bincount(categories, weights=data['item_quantity'][item_mask], minlength=revenue.size)
+
+    # Orders per category: distinct (category, order) pairs
+    order_rows = data['item_row'][item_mask]
+    pairs = _distinct(categories * mask.size + order_rows)
+    orders = np.bincount(pairs // mask.size, minlength=revenue.size)
+
+    total_revenue = revenue.sum()
+    names = data['category_names']
+    result = []
+    for category_id in np.argsort(-revenue, kind='stable').tolist():
+        if not orders[category_id]:
+            continue
+        result.append({
+            'category_id': category_id or None,
+            'category_name': names.get(category_id, 'Uncategorized'),
+            'revenue': round(float(revenue[category_id]), 2),
+            'revenue_share': round(float(revenue[category_id] / total_revenue), 4) if total_revenue else 0.0,
+            'units_sold': int(units[category_id]),
+            'orders': int(orders[category_id])
+        })
+
+    return {'total_revenue': round(float(total_revenue), 2), 'categories': result}
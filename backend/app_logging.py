@@ -0,0 +1,138 @@
+"""
+Structured, non-blocking logging for the backend.
+
+Request threads only resolve the message and enqueue the record; a background
+QueueListener thread turns records into JSON lines and writes them to stdout.
+When the queue is full records are dropped (and counted) rather than making
+the request wait on the terminal.
+
+The ``ecommerce.query`` logger carries per-statement diagnostics (at DEBUG).
+It has its own level, LOG_QUERY_LEVEL (DEBUG by default, independent of
+LOG_LEVEL), and is sampled per level via LOG_QUERY_SAMPLE_RATES
+(e.g. "DEBUG=0.01,INFO=0.1"). Set LOG_QUERY_LEVEL=INFO to turn it off.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from config import Config
+
+ROOT_LOGGER = 'ecommerce'
+QUERY_LOGGER = 'ecommerce.query'
+
+_setup_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, any ``fields`` extras and exc"""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+                  + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: records are dropped when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback on the caller's thread (cheap), but leave
+        # JSON encoding and the write itself to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LevelSamplingFilter(logging.Filter):
+    """Keep each record with the probability configured for its level (1.0 if unset)"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+def parse_sample_rates(spec):
+    """Parse "DEBUG=0.01,INFO=0.5" into {logging.DEBUG: 0.01, logging.INFO: 0.5}"""
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        level_name, _, rate = part.partition('=')
+        level = logging.getLevelName(level_name.strip().upper())
+        if isinstance(level, int):
+            rates[level] = max(0.0, min(float(rate), 1.0))
+    return rates
+
+
+def setup_logging():
+    """Install the queue-backed JSON handler on the ``ecommerce`` logger (idempotent)"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter())
+
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=Config.LOG_QUEUE_SIZE))
+        _listener = QueueListener(_queue_handler.queue, stream_handler, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(Config.LOG_LEVEL)
+        root.addHandler(_queue_handler)
+        root.propagate = False
+
+        query_logger = logging.getLogger(QUERY_LOGGER)
+        query_logger.setLevel(Config.LOG_QUERY_LEVEL)
+        query_logger.addFilter(LevelSamplingFilter(parse_sample_rates(Config.LOG_QUERY_SAMPLE_RATES)))
+
+
+def get_logger(name):
+    """Logger under the ``ecommerce`` hierarchy, e.g. get_logger('routes.cart')"""
+    setup_logging()
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+
+def dropped_records():
+    """Number of log records discarded because the queue was full"""
+    return _queue_handler.dropped if _queue_handler else 0
@@ -0,0 +1,202 @@
+"""
+Bloom filters of taken usernames and emails for the registration form.
+
+The availability checks run on every keystroke. A Bloom filter never misses
+a value that was added, so a negative answer means "definitely available" and
+needs no query; only possible hits (taken, or a false positive at
+AVAILABILITY_FILTER_FP_RATE) fall back to the indexed lookup.
+
+Filters are built from the users table at startup, updated on register and
+rebuilt in the background every AVAILABILITY_FILTER_REFRESH seconds, which
+also picks up accounts registered through other worker processes. Memory per
+filter is capped at AVAILABILITY_FILTER_MAX_BYTES; a capped filter has a
+higher false-positive rate, never false negatives.
+
+The users columns use a case-insensitive collation, so keys are lower-cased
+with trailing spaces removed. Values with non-ASCII characters (which the
+collation may fold in other ways) are always checked against the database.
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from config import Config
+from database import get_db
+from app_logging import get_logger
+
+logger = get_logger('availability')
+
+FIELDS = ('username', 'email')
+
+# Room for registrations between rebuilds
+CAPACITY_HEADROOM = 2
+MIN_CAPACITY = 1024
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (k hashes by double hashing one blake2b digest)"""
+
+    def __init__(self, capacity, fp_rate, max_bytes):
+        ideal_bits = -capacity * math.log(fp_rate) / (math.log(2) ** 2)
+        self.size = max(64, min(int(ideal_bits), max_bytes * 8))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def estimated_fp_rate(self):
+        """False-positive probability at the current fill"""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+    def stats(self):
+        return {
+            'entries': self.count,
+            'capacity': self.capacity,
+            'bytes': len(self._bits),
+            'hashes': self.hashes,
+            'estimated_fp_rate': round(self.estimated_fp_rate(), 6)
+        }
+
+
+_filters = {}
+_built_at = 0.0
+_rebuilding = threading.Lock()
+
+# Registrations recorded while a rebuild runs, replayed onto the new filters before the swap
+_swap_lock = threading.Lock()
+_added_during_build = []
+
+_counters = {'skipped_queries': 0, 'possible_hits': 0, 'unfiltered': 0}
+
+
+def normalize(value):
+    """Filter key for a username/email, or None if it cannot be keyed safely"""
+    if not value or not value.isascii():
+        return None
+    return value.rstrip(' ').lower()
+
+
+def build():
+    """Load every username and email into fresh filters and swap them in; False if the DB is unavailable"""
+    global _filters, _built_at
+
+    conn = get_db()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM users")
+        capacity = max(MIN_CAPACITY, cursor.fetchone()[0] * CAPACITY_HEADROOM)
+        filters = {
+            field: BloomFilter(capacity, Config.AVAILABILITY_FILTER_FP_RATE,
+                               Config.AVAILABILITY_FILTER_MAX_BYTES)
+            for field in FIELDS
+        }
+
+        cursor.execute("SELECT username, email FROM users")
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            for row in rows:
+                for field, value in zip(FIELDS, row):
+                    key = normalize(value)
+                    if key is not None:
+                        filters[field].add(key)
+    finally:
+        cursor.close()
+        conn.close()
+
+    with _swap_lock:
+        for username, email in _added_during_build:
+            _add_to(filters, username, email)
+        _added_during_build.clear()
+        _filters = filters
+        _built_at = time.monotonic()
+    logger.info("Availability filters built", extra={'fields': {
+        field: bloom.stats() for field, bloom in filters.items()}})
+    return True
+
+
+def _rebuild_in_background():
+    if not _rebuilding.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            build()
+        except Exception as e:
+            logger.exception("Availability filter rebuild failed: %s", e)
+        finally:
+            _rebuilding.release()
+
+    threading.Thread(target=run, name='availability-rebuild', daemon=True).start()
+
+
+def start():
+    """Build the filters at startup (off the main thread)"""
+    _rebuild_in_background()
+
+
+def definitely_available(field, value):
+    """True only when the filter proves no user has this username/email"""
+    bloom = _filters.get(field)
+    stale = time.monotonic() - _built_at > Config.AVAILABILITY_FILTER_REFRESH
+    if bloom is None or stale or (bloom and bloom.count > bloom.capacity):
+        _rebuild_in_background()
+
+    key = normalize(value)
+    if bloom is None or key is None:
+        _counters['unfiltered'] += 1
+        return False
+    if key in bloom:
+        _counters['possible_hits'] += 1
+        return False
+    _counters['skipped_queries'] += 1
+    return True
+
+
+def _add_to(filters, username, email):
+    for field, value in zip(FIELDS, (username, email)):
+        bloom = filters.get(field)
+        key = normalize(value)
+        if bloom is not None and key is not None:
+            bloom.add(key)
+
+
+def add(username, email):
+    """Record a newly registered user (call after the insert commits)"""
+    with _swap_lock:
+        _add_to(_filters, username, email)
+        if _rebuilding.locked():
+            _added_during_build.append((username, email))
+
+
+def stats():
+    """Filter sizes and how many availability checks skipped the database"""
+    result = dict(_counters)
+    result['age_seconds'] = round(time.monotonic() - _built_at, 1) if _filters else None
+    for field, bloom in _filters.items():
+        result[field] = bloom.stats()
+    return result
@@ -1,29 +1,43 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import mysql.connector
-from mysql.connector import Error
-import bcrypt
 import re
 import os
+import multiprocessing
+from config import Config
+from database import get_db, get_pool, release_request_connections
+import instrumentation
+import inventory
+import user_stats
+import availability
+import sessions
+import passwords
+from passwords import PasswordHasherBusy
+from app_logging import get_logger
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
+logger = get_logger('backend')
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': '', 
-    'database': 'ecommerce_db'
-}
+# Hand pooled connections back at the end of every request
+app.teardown_appcontext(release_request_connections)
 
-def get_db():
-    """Get database connection"""
-    try:
-        return mysql.connector.connect(**DB_CONFIG)
-    except Error as e:
-        print(f" Database error: {e}")
-        return None
+# Count and time every SQL statement per request (X-DB-* response headers)
+instrumentation.init_app(app)
+
+def start_background_tasks():
+    """Start the background threads of the serving process"""
+    # Report workers are spawned processes, which re-import this module when it is
+    # run as a script; they serve no requests, so nothing is started there
+    if multiprocessing.parent_process() is not None:
+        return
+
+    # Rebalance hot-product inventory slots and mirror their totals into products.stock_quantity
+    inventory.start_reconciler()
+
+    # Load the taken usernames/emails into Bloom filters for the availability checks
+    availability.start()
+
+start_background_tasks()
 
 # Configure Flask for file uploads
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
@@ -44,10 +58,46 @@ def home():
 def health_check():
     return jsonify({'status': 'healthy', 'message': 'Backend is running'})
 
+@app.route('/api/health/db', methods=['GET'])
+def db_pool_stats():
+    """Connection pool usage (in-use, idle, waiters, wait time)"""
+    return jsonify(get_pool().stats()), 200
+
+@app.route('/api/health/passwords', methods=['GET'])
+def password_hasher_stats():
+    """Password hashing pool: queue depth, rejections, rehashes and latency"""
+    return jsonify(passwords.stats()), 200
+
+@app.route('/api/health/cache', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters of the in-process catalog and report caches"""
+    from routes.products import cache_stats as catalog_cache_stats
+    from reports import report_cache
+    from analytics import dataset_cache
+    from models.user import user_cache
+    stats = catalog_cache_stats()
+    stats['reports'] = report_cache.stats()
+    stats['analytics'] = dataset_cache.stats()
+    stats['availability'] = availability.stats()
+    stats['sessions'] = sessions.stats()
+    stats['users'] = user_cache.stats()
+    return jsonify(stats), 200
+
+@app.route('/api/debug/queries', methods=['GET'])
+@sessions.require_session(admin=True)
+def recent_query_stats():
+    """SQL statement count, DB time, slowest statement and suspected N+1 per recent request (admins only)"""
+    if not Config.QUERY_INSTRUMENTATION:
+        return jsonify({'error': 'Query instrumentation is disabled'}), 404
+    return jsonify(instrumentation.recent_requests()), 200
+
 # ========== AUTH ENDPOINTS ==========
 @app.route('/api/auth/check-username/<username>', methods=['GET'])
 def check_username(username):
     """Check if username is available"""
+    if availability.definitely_available('username', username):
+        return jsonify({'available': True}), 200
+    
     conn = get_db()
     if not conn:
         return jsonify({'available': False, 'error': 'Database error'}), 500
@@ -66,6 +116,9 @@ def check_email(email):
     if not re.match(r'^[^\s@]+@[^\s@]+\.[^\s@]+$', email):
         return jsonify({'available': False, 'error': 'Invalid email'}), 400
     
+    if availability.definitely_available('email', email):
+        return jsonify({'available': True}), 200
+    
     conn = get_db()
     if not conn:
         return jsonify({'available': False, 'error': 'Database error'}), 500
@@ -83,7 +136,8 @@ def register():
     """Simple register endpoint"""
     try:
         data = request.get_json()
-        print(f"📝 Register request: {data}")
+        logger.info("Register request", extra={'fields': {
+            'username': data.get('username'), 'email': data.get('email')}})
         
         required = ['username', 'email', 'password', 'first_name', 'last_name']
         for field in required:
@@ -96,6 +150,9 @@ def register():
         if len(data['password']) < 6:
             return jsonify({'error': 'Password too short'}), 400
         
+        # Hash before borrowing a connection so it is not held for the bcrypt round
+        hashed = passwords.hash_password(data['password'])
+        
         conn = get_db()
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
@@ -109,15 +166,13 @@ def register():
             conn.close()
             return jsonify({'error': 'User already exists'}), 400
         
-        hashed = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
-        
         cursor.execute("""
             INSERT INTO users (username, email, password_hash, first_name, last_name, address, phone)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
         """, (
             data['username'],
             data['email'],
-            hashed.decode('utf-8'),
+            hashed,
             data['first_name'],
             data['last_name'],
             data.get('address', ''),
@@ -125,6 +180,7 @@ def register():
         ))
         
         user_id = cursor.lastrowid
+        user_stats.create_user_stats(cursor, user_id)
         
         cursor.execute("SELECT id, username, email, first_name, last_name, is_active, is_admin FROM users WHERE id = %s", (user_id,))
         user = cursor.fetchone()
@@ -133,13 +189,17 @@ def register():
         cursor.close()
         conn.close()
         
+        availability.add(data['username'], data['email'])
+        
         return jsonify({
             'message': 'Registration successful!',
             'user': user
         }), 201
         
+    except PasswordHasherBusy:
+        return passwords.busy_response()
     except Exception as e:
-        print(f" Register error: {e}")
+        logger.exception("Register error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/auth/login', methods=['POST'])
@@ -147,7 +207,7 @@ def login():
     """Simple login endpoint"""
     try:
         data = request.get_json()
-        print(f"📝 Login request: {data.get('email')}")
+        logger.info("Login request", extra={'fields': {'email': data.get('email')}})
         
         if not data.get('email') or not data.get('password'):
             return jsonify({'error': 'Email and password required'}), 400
@@ -167,47 +227,52 @@ def login():
         if not user:
             return jsonify({'error': 'Invalid credentials'}), 401
         
-        if not bcrypt.checkpw(data['password'].encode('utf-8'), user['password_hash'].encode('utf-8')):
+        if not passwords.check_password(data['password'], user['password_hash']):
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        passwords.rehash_if_needed(user['id'], data['password'], user['password_hash'])
+        
         # Check if account is deactivated
         if not user.get('is_active', True):
             return jsonify({'error': 'Your account has been deactivated. Please contact support.'}), 403
         
         user.pop('password_hash', None)
+        token = sessions.issue(user)
         
-        return jsonify({
+        response = jsonify({
             'message': 'Login successful',
-            'user': user
-        }), 200
+            'user': user,
+            'token': token
+        })
+        return sessions.set_cookie(response, token), 200
         
+    except PasswordHasherBusy:
+        return passwords.busy_response()
     except Exception as e:
-        print(f" Login error: {e}")
+        logger.exception("Login error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/auth/me', methods=['GET'])
+@sessions.require_session()
 def get_current_user():
-    """Get current user - THIS NEEDS SESSION MANAGEMENT"""
-    conn = get_db()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    cursor.execute("SELECT id, username, email, first_name, last_name, is_active, is_admin FROM users ORDER BY id DESC LIMIT 1")
-    user = cursor.fetchone()
-    
-    cursor.close()
-    conn.close()
-    
-    if user:
+    """Get the user of the session token (profile served from the principal cache)"""
+    try:
+        user = sessions.principal(sessions.current_session())
+        if not user:
+            return jsonify({'error': 'Authentication required'}), 401
         return jsonify({'user': user}), 200
-    return jsonify({'error': 'No users found'}), 404
+    except Exception as e:
+        logger.exception("Get current user error: %s", e)
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/auth/logout', methods=['POST'])
 def logout():
-    """Logout endpoint"""
-    return jsonify({'message': 'Logged out successfully'}), 200
+    """Logout endpoint (revokes the session token)"""
+    claims = sessions.current_session()
+    if claims:
+        sessions.revoke(claims)
+    response = jsonify({'message': 'Logged out successfully'})
+    return sessions.clear_cookie(response), 200
 
 # Register all blueprints (excluding auth since we handle it above)
 from routes import register_blueprints
@@ -215,18 +280,23 @@ register_blueprints(app)
 
 if __name__ == '__main__':
     print("🚀 Starting E-commerce Backend...")
-    print("📊 Database config:", DB_CONFIG)
+    print(f"📊 Database: {Config.MYSQL_USER}@{Config.MYSQL_HOST}/{Config.MYSQL_DB} "
+          f"(pool size {Config.MYSQL_POOL_SIZE}, timeout {Config.MYSQL_POOL_TIMEOUT}s)")
     print("🌐 Available endpoints:")
     print("\n=== CORE ENDPOINTS ===")
     print("   GET  /                                  - Home")
     print("   GET  /api/health                        - Health check")
+    print("   GET  /api/health/db                     - Connection pool stats")
+    print("   GET  /api/health/cache                  - Catalog/report caches, availability filters, sessions")
+    print("   GET  /api/health/passwords              - Password hashing pool stats")
+    print("   GET  /api/debug/queries                 - Per-request SQL stats / N+1 suspects (admin)")
     
     print("\n=== AUTH ENDPOINTS ===")
     print("   GET  /api/auth/check-username/<username>")
     print("   GET  /api/auth/check-email/<email>")
     print("   POST /api/auth/register                 - Register")
     print("   POST /api/auth/login                    - Login")
-    print("   GET  /api/auth/me                       - Get current user")
+    print("   GET  /api/auth/me                       - Get current user (session token)")
     print("   POST /api/auth/logout                   - Logout")
     
     print("\n=== PRODUCT ENDPOINTS ===")
@@ -243,21 +313,25 @@ if __name__ == '__main__':
     print("   DELETE /api/cart/clear/<user_id>        - Clear cart")
     
     print("\n=== ORDER ENDPOINTS ===")
-    print("   POST /api/orders                        - Create order")
+    print("   POST /api/orders                        - Create order (Idempotency-Key aware)")
     print("   GET  /api/orders/user/<user_id>         - Get user orders")
     print("   GET  /api/orders/<order_id>             - Get order details")
     print("   PUT  /api/orders/<id>/status            - Update order status")
-    print("   POST /api/orders/<id>/payment-proof     - Upload payment proof")
+    print("   POST /api/orders/<id>/payment-proof     - Upload payment proof (Idempotency-Key aware)")
     print("   PUT  /api/orders/<id>/cancel            - Cancel order (customer)")
     
     print("\n=== ADMIN ENDPOINTS ===")
-    print("   GET  /api/admin/orders                  - Get all orders")
+    print("   GET  /api/admin/orders                  - Get orders (status/date/search filters, cursor paging)")
     print("   PUT  /api/admin/orders/<id>/approve     - Approve order")
     print("   PUT  /api/admin/orders/<id>/decline     - Decline order with reason")
     print("   POST /api/admin/products                - Create product")
     print("   PUT  /api/admin/products/<id>           - Update product")
     print("   DELETE /api/admin/products/<id>         - Delete product")
     print("   POST /api/admin/products/<id>/upload-image - Upload product image")
+    print("   PUT  /api/admin/products/<id>/inventory-slots - Split hot product stock into slots")
+    print("   DELETE /api/admin/products/<id>/inventory-slots - Merge slots back into stock")
+    print("   GET  /api/admin/inventory/hot           - Hot products and their slots")
+    print("   POST /api/admin/inventory/reconcile     - Rebalance/reconcile slots now")
     print("   POST /api/admin/categories              - Create category")
     print("   PUT  /api/admin/categories/<id>         - Update category")
     print("   DELETE /api/admin/categories/<id>       - Delete category")
@@ -265,9 +339,17 @@ if __name__ == '__main__':
     print("\n=== ADMIN REPORTS ENDPOINTS ===")
     print("   GET  /api/admin/reports/sales           - Get sales reports (daily/weekly/monthly)")
     print("   POST /api/admin/reports/sales/generate  - Generate sales report (PDF/DOCX)")
+    print("   POST /api/admin/reports/sales/jobs      - Queue a PDF/DOCX report job")
+    print("   GET  /api/admin/reports/sales/jobs/<id> - Report job status")
+    print("   GET  /api/admin/reports/sales/jobs/<id>/download - Download finished report")
+    print("   GET  /api/admin/reports/sales/export    - Stream full sales report (CSV/NDJSON/PDF)")
+    print("   GET  /api/admin/reports/rfm             - Customer RFM segments")
+    print("   GET  /api/admin/reports/cohorts         - Monthly cohort retention")
+    print("   GET  /api/admin/reports/basket-size     - Basket size distribution")
+    print("   GET  /api/admin/reports/category-revenue - Revenue per category")
     
     print("\n=== ADMIN USER MANAGEMENT ENDPOINTS ===")
-    print("   GET  /api/admin/users                   - Get all users")
+    print("   GET  /api/admin/users                   - Get users (sort, search, limit/cursor)")
     print("   PUT  /api/admin/users/<id>/reset-password - Reset user password")
     print("   PUT  /api/admin/users/<id>/deactivate   - Deactivate user account")
     print("   PUT  /api/admin/users/<id>/activate     - Activate user account")
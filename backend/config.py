@@ -11,6 +11,78 @@ class Config:
     MYSQL_USER = os.getenv('MYSQL_USER', 'root')
     MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD', '')
     MYSQL_DB = os.getenv('MYSQL_DB', 'ecommerce_db')
+
+    # Connection pool shared by every blueprint
+    MYSQL_POOL_SIZE = int(os.getenv('MYSQL_POOL_SIZE', '10'))
+    MYSQL_POOL_TIMEOUT = float(os.getenv('MYSQL_POOL_TIMEOUT', '5'))
+    MYSQL_POOL_PING_AFTER = float(os.getenv('MYSQL_POOL_PING_AFTER', '30'))
+
+    # Homepage featured products: pool size, refresh interval (seconds), weighting (none, stock, sales)
+    FEATURED_POOL_SIZE = int(os.getenv('FEATURED_POOL_SIZE', '100'))
+    FEATURED_POOL_TTL = float(os.getenv('FEATURED_POOL_TTL', '300'))
+    FEATURED_WEIGHTING = os.getenv('FEATURED_WEIGHTING', 'none')
+
+    # Category list cache lifetime in seconds (admin category changes also clear it)
+    CATEGORY_CACHE_TTL = float(os.getenv('CATEGORY_CACHE_TTL', '3600'))
+
+    # Product detail cache: max entries and lifetime in seconds
+    PRODUCT_CACHE_SIZE = int(os.getenv('PRODUCT_CACHE_SIZE', '1000'))
+    PRODUCT_CACHE_TTL = float(os.getenv('PRODUCT_CACHE_TTL', '60'))
+
+    # Per-request SQL instrumentation (X-DB-* headers and the admin-only /api/debug/queries); off by default
+    QUERY_INSTRUMENTATION = os.getenv('QUERY_INSTRUMENTATION', 'false').lower() == 'true'
+    QUERY_N_PLUS_ONE_THRESHOLD = int(os.getenv('QUERY_N_PLUS_ONE_THRESHOLD', '5'))
+    QUERY_STATS_HISTORY = int(os.getenv('QUERY_STATS_HISTORY', '100'))
+
+    # Structured logging: level, background queue size, level and per-level sampling of query logs
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_QUERY_LEVEL = os.getenv('LOG_QUERY_LEVEL', 'DEBUG').upper()
+    LOG_QUERY_SAMPLE_RATES = os.getenv('LOG_QUERY_SAMPLE_RATES', 'DEBUG=0.01,INFO=0.1')
+
+    # Hot-product inventory slots: default slot count, hot-set refresh and reconcile interval (seconds, 0 disables)
+    INVENTORY_DEFAULT_SLOTS = int(os.getenv('INVENTORY_DEFAULT_SLOTS', '8'))
+    INVENTORY_HOT_REFRESH = float(os.getenv('INVENTORY_HOT_REFRESH', '5'))
+    INVENTORY_RECONCILE_INTERVAL = float(os.getenv('INVENTORY_RECONCILE_INTERVAL', '5'))
+
+    # Idempotency-Key store: how long keys are kept, and when an unfinished claim may be taken over (seconds)
+    IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '86400'))
+    IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '60'))
+
+    # Sales report results memoized per (period, start_date, end_date): max entries and lifetime in seconds
+    REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', '64'))
+    REPORT_CACHE_TTL = float(os.getenv('REPORT_CACHE_TTL', '30'))
+
+    # PDF/DOCX report jobs: worker processes, output directory, how long finished files are kept
+    # and how long the synchronous generate endpoint waits before answering with the job instead
+    REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', '2'))
+    REPORT_JOB_DIR = os.getenv('REPORT_JOB_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generated_reports'))
+    REPORT_JOB_TTL = float(os.getenv('REPORT_JOB_TTL', '3600'))
+    REPORT_JOB_SYNC_TIMEOUT = float(os.getenv('REPORT_JOB_SYNC_TIMEOUT', '60'))
+
+    # Analytics reports: lifetime in seconds of the in-memory snapshot of sold orders and items
+    ANALYTICS_CACHE_TTL = float(os.getenv('ANALYTICS_CACHE_TTL', '300'))
+
+    # Password hashing: bcrypt cost, hashing threads and how many more jobs may wait before 503
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', '2'))
+    BCRYPT_QUEUE_LIMIT = int(os.getenv('BCRYPT_QUEUE_LIMIT', '16'))
+
+    # Username/email availability Bloom filters: target false-positive rate, memory cap per filter
+    # (bytes; caps raise the false-positive rate) and background rebuild interval in seconds
+    AVAILABILITY_FILTER_FP_RATE = float(os.getenv('AVAILABILITY_FILTER_FP_RATE', '0.01'))
+    AVAILABILITY_FILTER_MAX_BYTES = int(os.getenv('AVAILABILITY_FILTER_MAX_BYTES', str(4 * 1024 * 1024)))
+    AVAILABILITY_FILTER_REFRESH = float(os.getenv('AVAILABILITY_FILTER_REFRESH', '300'))
+
+    # Session tokens: lifetime in seconds, Secure cookie flag, cached principals (max entries, lifetime in seconds)
+    SESSION_TTL = float(os.getenv('SESSION_TTL', str(7 * 24 * 3600)))
+    SESSION_COOKIE_SECURE = os.getenv('SESSION_COOKIE_SECURE', 'false').lower() == 'true'
+    SESSION_PRINCIPAL_CACHE_SIZE = int(os.getenv('SESSION_PRINCIPAL_CACHE_SIZE', '10000'))
+    SESSION_PRINCIPAL_CACHE_TTL = float(os.getenv('SESSION_PRINCIPAL_CACHE_TTL', '60'))
+
+    # models.user.User lookups by id/email/username: max cached entries and lifetime in seconds
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+    USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))
     
 
     UPLOAD_FOLDER = 'static/uploads'
@@ -1,65 +1,382 @@
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector.errors import PoolError
+from flask import g, has_app_context
 from config import Config
+from instrumentation import InstrumentedCursor, statement_shape
+from app_logging import get_logger, QUERY_LOGGER
+
+logger = get_logger('database')
+query_logger = logging.getLogger(QUERY_LOGGER)
+
+
+class PoolTimeoutError(PoolError):
+    """Raised when no pooled connection frees up within the checkout timeout"""
+
+
+class PooledConnection:
+    """Thin proxy around a MySQL connection that belongs to a ConnectionPool.
+
+    Everything is forwarded to the real connection except close(), which hands
+    the connection back to the pool instead of tearing down the socket, so the
+    existing ``cursor.close(); conn.close()`` pattern in the blueprints keeps working,
+    and cursor(), which wraps cursors for per-request query instrumentation.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise Error(msg="Connection has already been returned to the pool")
+        return getattr(raw, name)
+
+    def cursor(self, *args, **kwargs):
+        """Open a cursor whose statements are counted and timed per request"""
+        if self._raw is None:
+            raise Error(msg="Connection has already been returned to the pool")
+        return InstrumentedCursor(self._raw.cursor(*args, **kwargs))
+
+    @property
+    def closed(self):
+        return self._raw is None
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)"""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+    def discard(self):
+        """Close the underlying connection instead of returning it to the pool"""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.discard(raw)
+
+    def __del__(self):
+        # Last line of defence for handlers that bail out on an exception
+        # without closing their connection
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of MySQL connections.
+
+    - at most ``max_size`` connections are open at once
+    - callers block for up to ``timeout`` seconds when the pool is exhausted
+    - connections idle for ``ping_after`` seconds or more are pinged before reuse
+    - any transaction left open by the borrower is rolled back on release
+    """
+
+    def __init__(self, connect_args, max_size=10, timeout=5.0, ping_after=30.0):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect_args = dict(connect_args)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, returned_at) pairs, most recent on the right
+        self._in_use = 0
+        self._waiters = 0
+
+        # Counters for monitoring
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _connect(self):
+        connection = mysql.connector.connect(**self._connect_args)
+        with self._cond:
+            self._created += 1
+        return connection
+
+    def _discard(self, raw):
+        with self._cond:
+            self._discarded += 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _is_alive(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout=None):
+        """Borrow a connection, waiting up to ``timeout`` seconds for a free slot"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, returned_at = self._idle.pop()
+                    break
+                if self._in_use < self.max_size:
+                    raw, returned_at = None, None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        msg=f"Timed out after {timeout}s waiting for a database connection "
+                            f"(pool size {self.max_size})"
+                    )
+                self._waiters += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+
+            self._in_use += 1
+            self._checkouts += 1
+            waited = time.monotonic() - started
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+        # Connecting and pinging happen outside the lock so one slow handshake
+        # doesn't stall every other borrower
+        try:
+            if raw is None:
+                raw = self._connect()
+            elif time.monotonic() - returned_at >= self.ping_after and not self._is_alive(raw):
+                self._discard(raw)
+                raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw)
+
+    def release(self, raw):
+        """Take a connection back, resetting any transaction the borrower left open"""
+        healthy = True
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            healthy = False
+
+        if not healthy:
+            self._discard(raw)
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, raw):
+        """Close a borrowed connection rather than taking it back (frees its slot)"""
+        self._discard(raw)
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection (borrowed ones are closed as they come back)"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for raw, _ in idle:
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        """Snapshot of pool usage for monitoring"""
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiters': self._waiters,
+                'checkouts': checkouts,
+                'timeouts': self._timeouts,
+                'connections_created': self._created,
+                'connections_discarded': self._discarded,
+                'avg_wait_ms': round(self._total_wait / checkouts * 1000, 3) if checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 3),
+                'total_wait_ms': round(self._total_wait * 1000, 3)
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    {
+                        'host': Config.MYSQL_HOST,
+                        'user': Config.MYSQL_USER,
+                        'password': Config.MYSQL_PASSWORD,
+                        'database': Config.MYSQL_DB
+                    },
+                    max_size=Config.MYSQL_POOL_SIZE,
+                    timeout=Config.MYSQL_POOL_TIMEOUT,
+                    ping_after=Config.MYSQL_POOL_PING_AFTER
+                )
+    return _pool
+
+
+def get_db(request_scoped=True):
+    """Borrow a pooled database connection (returns None if none is available).
+
+    With ``request_scoped=False`` the teardown hook does not hand the connection
+    back; the caller must close it. Streamed responses need this, because their
+    body is read after the request context has been torn down.
+    """
+    try:
+        conn = get_pool().acquire()
+    except Error as e:
+        logger.error("Database error: %s", e, extra={'fields': {
+            'host': Config.MYSQL_HOST,
+            'user': Config.MYSQL_USER,
+            'db': Config.MYSQL_DB,
+            'pool': get_pool().stats()
+        }})
+        return None
+
+    # Remember the connection so it is handed back even if the handler forgets
+    if request_scoped and has_app_context():
+        g.setdefault('_db_connections', []).append(conn)
+    return conn
+
+
+def release_request_connections(exc=None):
+    """Teardown hook: return any connection the request did not close itself"""
+    for conn in g.pop('_db_connections', []):
+        conn.close()
+
+
+def close_streaming_cursor(cursor, conn):
+    """
+    Close an unbuffered cursor and hand back its connection.
+
+    If rows are still unread (the client went away mid-export) the connection
+    is closed instead: reading the rest only to throw it away could pull the
+    whole remaining result into memory.
+    """
+    if getattr(conn, 'unread_result', False):
+        conn.discard()
+        return
+    try:
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def escape_like(value):
+    """Escape LIKE wildcards so user input is matched literally"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def get_date_range_filter(column, start_date, end_date):
+    """
+    Build an index-friendly date range filter on a DATETIME/TIMESTAMP column.
+    Returns a tuple of (sql, params); raises ValueError on a malformed date.
+
+    Compares the raw column against [start_date 00:00, end_date + 1 day 00:00)
+    instead of wrapping it in DATE(), so MySQL can range-scan its index.
+    """
+    sql = ""
+    params = []
+
+    if start_date:
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        sql += f" AND {column} >= %s"
+        params.append(start)
+    if end_date:
+        end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+        sql += f" AND {column} < %s"
+        params.append(end)
+
+    return sql, params
+
 
 class Database:
     @staticmethod
     def get_connection():
-        """Create and return a database connection"""
-        try:
-            connection = mysql.connector.connect(
-                host=Config.MYSQL_HOST,
-                user=Config.MYSQL_USER,
-                password=Config.MYSQL_PASSWORD,
-                database=Config.MYSQL_DB
-            )
-            return connection
-        except Error as e:
-            print(f" Error connecting to MySQL: {e}")
-            print(f"   Host: {Config.MYSQL_HOST}")
-            print(f"   User: {Config.MYSQL_USER}")
-            print(f"   DB: {Config.MYSQL_DB}")
-            return None
-    
+        """Borrow a connection from the shared pool"""
+        return get_db()
+
     @staticmethod
     def execute_query(query, params=None, fetch_one=False, fetch_all=False, lastrowid=False):
         """Execute a SQL query with parameters"""
         connection = Database.get_connection()
         if not connection:
-            print(" No database connection")
+            logger.error("No database connection")
             return None
-        
+
         cursor = None
         try:
             cursor = connection.cursor(dictionary=True)
-            print(f" Executing query: {query}")
-            print(f"   Params: {params}")
-            
+            started = time.perf_counter()
+
             cursor.execute(query, params or ())
-            
+
             if fetch_one:
                 result = cursor.fetchone()
-                print(f"   Fetch one result: {result}")
+                rows = 1 if result else 0
             elif fetch_all:
                 result = cursor.fetchall()
-                print(f"   Fetch all results: {len(result)} rows")
+                rows = len(result)
             elif lastrowid:
                 result = cursor.lastrowid
-                print(f"   Last row ID: {result}")
+                rows = cursor.rowcount
             else:
                 result = None
-            
+                rows = cursor.rowcount
+
+            # Gated by LOG_QUERY_LEVEL, sampled per LOG_QUERY_SAMPLE_RATES; parameters and results are never logged
+            if query_logger.isEnabledFor(logging.DEBUG):
+                query_logger.debug("Executed query", extra={'fields': {
+                    'statement': statement_shape(query),
+                    'rows': rows,
+                    'ms': round((time.perf_counter() - started) * 1000, 3)
+                }})
+
             connection.commit()
             return result
-            
+
         except Error as e:
-            print(f" Error executing query: {e}")
-            print(f"   Query: {query}")
-            print(f"   Params: {params}")
+            logger.error("Error executing query: %s", e, extra={'fields': {
+                'statement': statement_shape(query)
+            }})
             connection.rollback()
             return None
         finally:
             if cursor:
                 cursor.close()
-            if connection and connection.is_connected():
-                connection.close()
\ No newline at end of file
+            connection.close()
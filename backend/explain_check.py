@@ -0,0 +1,126 @@
+"""
+EXPLAIN check for the hot queries.
+
+Runs EXPLAIN on each query of hot_queries() and fails (exit status 1) when one
+of its guarded tables is read with a full table scan (type ALL), e.g. after a
+date predicate lost its sargable form or an index went missing. The statements
+come from the same query helpers the endpoints call, so a change to a listing
+query is checked as shipped.
+
+    python explain_check.py [--min-rows N]
+
+tests/test_explain_check.py runs the same check as part of the test suite
+(skipped when no database is configured).
+
+Run it against a database with realistic data: on a near-empty table the
+optimizer rightly prefers a scan, so scans estimated at fewer than --min-rows
+rows (default 100) are reported but not counted as failures.
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from database import get_db
+import sales_rollup
+from routes.admin import build_admin_orders_query, build_user_directory_query
+from routes.cart import cart_items_query
+from routes.orders import order_items_query, user_orders_query
+from routes.products import build_product_filters, build_product_list_query
+
+
+def sample_values(cursor):
+    """Representative ids to plug into the hot queries (1 on an empty table)"""
+    def first(query):
+        cursor.execute(query)
+        row = cursor.fetchone()
+        return row['value'] if row and row['value'] is not None else 1
+
+    return {
+        'user_id': first("SELECT user_id as value FROM orders ORDER BY id DESC LIMIT 1"),
+        'order_id': first("SELECT MAX(id) as value FROM orders"),
+        'category_id': first("SELECT category_id as value FROM products WHERE category_id IS NOT NULL LIMIT 1")
+    }
+
+
+def hot_queries(values):
+    """(name, sql, params, guarded tables) for every hot query, built by the handlers' own helpers"""
+    end = datetime.now().strftime('%Y-%m-%d')
+    start = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    category_filter, category_params = build_product_filters(
+        category_id=values['category_id'], min_price=10, max_price=100)
+
+    return [
+        ('customer orders', *user_orders_query(values['user_id']), {'o', 'oi'}),
+        ('admin orders by date range',
+         *build_admin_orders_query(start_date=start, end_date=end, limit=51), {'o', 'oi', 'u'}),
+        ('admin orders by status and date range',
+         *build_admin_orders_query(['pending', 'processing'], start, end, limit=51), {'o', 'oi', 'u'}),
+        ('order items of a page of orders',
+         *order_items_query([values['order_id'], values['order_id'] - 1], include_description=True),
+         {'oi', 'p'}),
+        ('order items for the sales rollups',
+         *sales_rollup.product_sales_query(values['order_id'], 1), {'o', 'oi'}),
+        ('products by category and price',
+         *build_product_list_query(category_filter, category_params, 'price_low', limit=13), {'p'}),
+        ('newest products (first page with total)',
+         *build_product_list_query('', [], 'newest', limit=12, count_total=True), {'p'}),
+        ('cart', *cart_items_query(values['user_id']), {'c', 'p'}),
+        ('admin users by spend', *build_user_directory_query('spent', limit=51), {'u', 's'}),
+        ('admin users newest', *build_user_directory_query('newest', limit=51), {'u', 's'}),
+        ('admin users by username/email prefix',
+         *build_user_directory_query('newest', search='jo', limit=51), {'u', 's', 'users'}),
+        ('sales report periods',
+         *sales_rollup.period_totals_query('daily', start, end), {'sales_daily', 'sales_customer_daily'})
+    ]
+
+
+def check(cursor, min_rows):
+    """Print the plan of every hot query; returns the number of failing queries"""
+    failures = 0
+    for name, query, params, guarded in hot_queries(sample_values(cursor)):
+        cursor.execute(f"EXPLAIN {query}", params)
+        plan = cursor.fetchall()
+
+        problems = []
+        for row in plan:
+            if row['type'] != 'ALL' or row['table'] not in guarded:
+                continue
+            if (row['rows'] or 0) >= min_rows:
+                problems.append(f"full scan of {row['table']} (~{row['rows']} rows)")
+            else:
+                print(f"   note: {row['table']} scanned, only ~{row['rows']} rows")
+
+        keys = ', '.join(f"{row['table']}:{row['key'] or '-'}" for row in plan if row['table'])
+        print(f"{'FAIL' if problems else 'ok  '} {name:<40} {keys}")
+        for problem in problems:
+            print(f"   {problem}")
+        failures += bool(problems)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail when a hot query falls back to a full table scan')
+    parser.add_argument('--min-rows', type=int, default=100,
+                        help='Ignore scans of tables estimated below this many rows')
+    args = parser.parse_args()
+
+    conn = get_db()
+    if not conn:
+        raise SystemExit('Database connection failed')
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        failures = check(cursor, args.min_rows)
+    finally:
+        cursor.close()
+        conn.close()
+
+    if failures:
+        print(f"{failures} hot query(s) fall back to a full table scan")
+        sys.exit(1)
+    print("All hot queries use an index")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+Idempotency-Key support for POST endpoints that must not run twice.
+
+A client sends ``Idempotency-Key: <unique string>`` with the request. The
+first request claims the key in the idempotency_keys table, runs the view and
+stores its status and JSON body. Retries with the same key replay the stored
+response (with ``Idempotent-Replayed: true``) without running the view again.
+
+Keys are scoped by method, path and caller (the session user, else the
+``user_id`` sent in the body), so two clients that pick the same key do not
+see each other's responses.
+
+- The same key with a different request body gets 422.
+- A retry while the first request is still running gets 409.
+- Only successful responses (below 400) are stored. After an error the key is
+  released, so a corrected retry with the same key runs the view.
+- Keys expire after IDEMPOTENCY_TTL seconds. A claim whose request died
+  is taken over after IDEMPOTENCY_LOCK_TIMEOUT seconds.
+"""
+
+import functools
+import hashlib
+import json
+import random
+
+from flask import request, jsonify, make_response, current_app
+from config import Config
+from database import get_db
+import sessions
+from app_logging import get_logger
+
+logger = get_logger('idempotency')
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+MAX_SCOPE_LENGTH = 200
+
+# Fraction of claims that also purge a batch of expired keys
+PURGE_PROBABILITY = 0.01
+PURGE_BATCH_SIZE = 500
+
+
+def request_fingerprint():
+    """SHA-256 of the request body (JSON, or form fields plus uploaded file contents)"""
+    digest = hashlib.sha256()
+    if request.is_json:
+        body = request.get_json(silent=True)
+        digest.update(json.dumps(body, sort_keys=True, default=str).encode('utf-8'))
+    else:
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f'{name}={value}\n'.encode('utf-8'))
+        for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(f'{name}:{upload.filename}\n'.encode('utf-8'))
+            for chunk in iter(lambda: upload.stream.read(64 * 1024), b''):
+                digest.update(chunk)
+            upload.stream.seek(0)
+    return digest.hexdigest()
+
+
+def caller():
+    """Who is making the request: ``user:<id>`` from the session, else from the body's user_id"""
+    claims = sessions.current_session()
+    if claims is not None:
+        return f"user:{claims['uid']}"
+
+    if request.is_json:
+        body = request.get_json(silent=True)
+        user_id = body.get('user_id') if isinstance(body, dict) else None
+    else:
+        user_id = request.form.get('user_id')
+    return f'user:{user_id}' if user_id not in (None, '') else 'anonymous'
+
+
+def claim_key(cursor, scope, key, fingerprint):
+    """Claim a key for this request; returns None if claimed, else the existing row"""
+    cursor.execute("""
+        INSERT IGNORE INTO idempotency_keys (scope, idem_key, request_hash, status, expires_at)
+        VALUES (%s, %s, %s, 'in_progress', NOW() + INTERVAL %s SECOND)
+    """, (scope, key, fingerprint, int(Config.IDEMPOTENCY_TTL)))
+    if cursor.rowcount == 1:
+        return None
+
+    # Take over keys that expired or whose request never finished
+    cursor.execute("""
+        UPDATE idempotency_keys
+        SET request_hash = %s, status = 'in_progress', response_status = NULL, response_body = NULL,
+            created_at = NOW(), expires_at = NOW() + INTERVAL %s SECOND
+        WHERE scope = %s AND idem_key = %s
+          AND (expires_at < NOW()
+               OR (status = 'in_progress' AND created_at < NOW() - INTERVAL %s SECOND))
+    """, (fingerprint, int(Config.IDEMPOTENCY_TTL), scope, key, int(Config.IDEMPOTENCY_LOCK_TIMEOUT)))
+    if cursor.rowcount == 1:
+        return None
+
+    cursor.execute("""
+        SELECT request_hash, status, response_status, response_body
+        FROM idempotency_keys
+        WHERE scope = %s AND idem_key = %s
+    """, (scope, key))
+    return cursor.fetchone()
+
+
+def purge_expired(cursor):
+    """Delete a batch of expired keys"""
+    cursor.execute("""
+        DELETE FROM idempotency_keys
+        WHERE expires_at < NOW()
+        LIMIT %s
+    """, (PURGE_BATCH_SIZE,))
+    return cursor.rowcount
+
+
+def _finish(scope, key, response=None):
+    """Store the response for a claimed key, or release the key when ``response`` is None"""
+    conn = get_db()
+    if not conn:
+        logger.error("Could not record idempotency key outcome: database connection failed",
+                     extra={'fields': {'scope': scope}})
+        return
+
+    cursor = conn.cursor()
+    try:
+        if response is None:
+            cursor.execute("DELETE FROM idempotency_keys WHERE scope = %s AND idem_key = %s", (scope, key))
+        else:
+            cursor.execute("""
+                UPDATE idempotency_keys
+                SET status = 'completed', response_status = %s, response_body = %s
+                WHERE scope = %s AND idem_key = %s
+            """, (response.status_code, response.get_data(as_text=True), scope, key))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def replay(row, fingerprint):
+    """Response for a retry of an already claimed key"""
+    if row['request_hash'] != fingerprint:
+        return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+
+    if row['status'] != 'completed':
+        response = jsonify({'error': f'A request with this {HEADER} is still being processed'})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+        return response
+
+    response = current_app.response_class(
+        row['response_body'], status=row['response_status'], mimetype='application/json')
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Make a view honour the Idempotency-Key header (requests without it run as usual)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be 1-{MAX_KEY_LENGTH} characters'}), 400
+
+        scope = f'{request.method} {request.path} {caller()}'[:MAX_SCOPE_LENGTH]
+        fingerprint = request_fingerprint()
+
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+
+        cursor = conn.cursor(dictionary=True)
+        try:
+            existing = claim_key(cursor, scope, key, fingerprint)
+            if random.random() < PURGE_PROBABILITY:
+                purge_expired(cursor)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+        if existing:
+            logger.info("Idempotent request replayed", extra={'fields': {
+                'scope': scope, 'status': existing['status']}})
+            return replay(existing, fingerprint)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _finish(scope, key)
+            raise
+
+        # The view already ran; failing to record its outcome must not fail the response
+        try:
+            if response.status_code >= 400:
+                _finish(scope, key)
+            else:
+                _finish(scope, key, response)
+        except Exception as e:
+            logger.exception("Could not record idempotency key outcome: %s", e)
+
+        return response
+    return wrapper
@@ -0,0 +1,165 @@
+"""
+Per-request SQL instrumentation.
+
+Every cursor handed out by the connection pool is wrapped in an
+InstrumentedCursor, which reports each statement and its duration here.
+For each request we keep the statement count, total DB time, the slowest
+statement and how often each statement shape ran; shapes repeated
+QUERY_N_PLUS_ONE_THRESHOLD times or more are flagged as suspected N+1 loops.
+
+The summary is returned in X-DB-* response headers and the last
+QUERY_STATS_HISTORY summaries are kept for GET /api/debug/queries.
+"""
+
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, has_request_context, request
+from config import Config
+from app_logging import get_logger
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*(?:%s\s*,\s*)*%s\s*\)', re.IGNORECASE)
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+logger = get_logger('instrumentation')
+
+_history = deque(maxlen=Config.QUERY_STATS_HISTORY)
+_history_lock = threading.Lock()
+
+
+def statement_shape(statement):
+    """Normalize a statement so executions that differ only in values compare equal"""
+    if isinstance(statement, (bytes, bytearray)):
+        statement = statement.decode('utf-8', 'replace')
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _IN_LIST.sub('IN (...)', shape)
+    shape = _STRING_LITERAL.sub('?', shape)
+    return _NUMBER_LITERAL.sub('?', shape)
+
+
+class QueryStats:
+    """Statements executed during one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        shape = statement_shape(statement)
+        self.count += 1
+        self.total_time += seconds
+        self.shapes[shape] += 1
+        if seconds >= self.slowest_time:
+            self.slowest_time = seconds
+            self.slowest_statement = shape
+
+    def suspected_n_plus_one(self, threshold=None):
+        threshold = threshold or Config.QUERY_N_PLUS_ONE_THRESHOLD
+        return [
+            {'statement': shape[:300], 'count': count}
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+    def summary(self):
+        return {
+            'query_count': self.count,
+            'db_time_ms': round(self.total_time * 1000, 3),
+            'slowest': {
+                'statement': self.slowest_statement[:300],
+                'ms': round(self.slowest_time * 1000, 3)
+            } if self.slowest_statement else None,
+            'n_plus_one': self.suspected_n_plus_one()
+        }
+
+
+def current_stats():
+    """QueryStats for the active request, or None outside a request"""
+    if not Config.QUERY_INSTRUMENTATION or not has_request_context():
+        return None
+    if '_query_stats' not in g:
+        g._query_stats = QueryStats()
+    return g._query_stats
+
+
+def record_query(statement, seconds):
+    stats = current_stats()
+    if stats is not None:
+        stats.record(statement, seconds)
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute()/executemany() and reports to the request stats"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+
+def add_query_headers(response):
+    """after_request hook: expose this request's query summary"""
+    stats = g.pop('_query_stats', None)
+    if stats is None or stats.count == 0:
+        return response
+
+    summary = stats.summary()
+    response.headers['X-DB-Queries'] = str(summary['query_count'])
+    response.headers['X-DB-Time-Ms'] = str(summary['db_time_ms'])
+    if summary['slowest']:
+        response.headers['X-DB-Slowest-Ms'] = str(summary['slowest']['ms'])
+    if summary['n_plus_one']:
+        response.headers['X-DB-N-Plus-One'] = str(len(summary['n_plus_one']))
+        logger.warning("Suspected N+1 query pattern", extra={'fields': {
+            'method': request.method,
+            'path': request.path,
+            'n_plus_one': summary['n_plus_one']
+        }})
+
+    summary.update({
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'timestamp': time.time()
+    })
+    with _history_lock:
+        _history.append(summary)
+
+    return response
+
+
+def recent_requests():
+    """Query summaries of the most recent requests, newest first"""
+    with _history_lock:
+        return list(reversed(_history))
+
+
+def init_app(app):
+    """Attach the per-request query summary to every response"""
+    if Config.QUERY_INSTRUMENTATION:
+        app.after_request(add_query_headers)
@@ -0,0 +1,343 @@
+"""
+Inventory reservation ledger for hot (flash-sale) products.
+
+A product put on the ledger has its stock split across several rows of
+inventory_slots. Checkouts claim from whichever slot is not locked by another
+transaction (FOR UPDATE SKIP LOCKED), so concurrent buyers of the same SKU
+update different rows instead of queueing on one products row.
+
+For ledger products the slots are the source of truth; products.stock_quantity
+is a mirror that the reconciler refreshes (SUM of the slots) every
+INVENTORY_RECONCILE_INTERVAL seconds, when it also evens out skewed slots.
+
+All functions take a dictionary cursor and run inside the caller's
+transaction; the caller commits.
+"""
+
+import threading
+import time
+
+from config import Config
+from cache import TTLCache
+from database import get_db
+from app_logging import get_logger
+
+logger = get_logger('inventory')
+
+MAX_SLOTS = 64
+
+# {product_id: slot_count} of ledger products, refreshed every INVENTORY_HOT_REFRESH seconds
+hot_cache = TTLCache(maxsize=1, ttl=Config.INVENTORY_HOT_REFRESH)
+
+_reconciler = None
+_reconciler_lock = threading.Lock()
+
+
+def hot_products(cursor):
+    """{product_id: slot_count} for every product whose stock lives in slots"""
+    def load():
+        cursor.execute("""
+            SELECT product_id, COUNT(*) as slots
+            FROM inventory_slots
+            GROUP BY product_id
+        """)
+        return {row['product_id']: row['slots'] for row in cursor.fetchall()}
+    return hot_cache.get_or_load('hot', load)
+
+
+def invalidate_hot():
+    """Reload the set of ledger products on next use"""
+    hot_cache.clear()
+
+
+def _write_slots(cursor, product_id, total, slots):
+    """Replace a product's slots with ``slots`` rows sharing ``total`` as evenly as possible"""
+    cursor.execute("DELETE FROM inventory_slots WHERE product_id = %s", (product_id,))
+    base, extra = divmod(max(total, 0), slots)
+    values_sql = ', '.join(['(%s, %s, %s)'] * slots)
+    params = [value for slot_no in range(slots)
+              for value in (product_id, slot_no, base + (1 if slot_no < extra else 0))]
+    cursor.execute(f"""
+        INSERT INTO inventory_slots (product_id, slot_no, quantity)
+        VALUES {values_sql}
+    """, params)
+
+
+def _lock_slots(cursor, product_id):
+    """Lock all slots of a product in slot order and return them"""
+    cursor.execute("""
+        SELECT slot_no, quantity
+        FROM inventory_slots
+        WHERE product_id = %s
+        ORDER BY slot_no
+        FOR UPDATE
+    """, (product_id,))
+    return cursor.fetchall()
+
+
+def split_stock(cursor, product_id, slots):
+    """
+    Put a product on the ledger (or change its slot count), spreading its stock over ``slots`` rows.
+    Returns the total stock, or None if the product does not exist.
+    """
+    cursor.execute("SELECT stock_quantity FROM products WHERE id = %s FOR UPDATE", (product_id,))
+    product = cursor.fetchone()
+    if not product:
+        return None
+
+    existing = _lock_slots(cursor, product_id)
+    total = sum(row['quantity'] for row in existing) if existing else product['stock_quantity']
+
+    _write_slots(cursor, product_id, total, slots)
+    cursor.execute("UPDATE products SET stock_quantity = %s WHERE id = %s", (total, product_id))
+    invalidate_hot()
+    return total
+
+
+def merge_stock(cursor, product_id):
+    """
+    Take a product off the ledger, folding its slots back into products.stock_quantity.
+    Returns the total stock, or None if the product was not on the ledger.
+    """
+    cursor.execute("SELECT id FROM products WHERE id = %s FOR UPDATE", (product_id,))
+    if not cursor.fetchone():
+        return None
+
+    existing = _lock_slots(cursor, product_id)
+    if not existing:
+        return None
+
+    total = sum(row['quantity'] for row in existing)
+    cursor.execute("UPDATE products SET stock_quantity = %s WHERE id = %s", (total, product_id))
+    cursor.execute("DELETE FROM inventory_slots WHERE product_id = %s", (product_id,))
+    invalidate_hot()
+    return total
+
+
+def set_stock(cursor, product_id, total):
+    """Set the absolute stock of a ledger product (admin edit); False if it is not on the ledger"""
+    existing = _lock_slots(cursor, product_id)
+    if not existing:
+        return False
+    _write_slots(cursor, product_id, total, len(existing))
+    return True
+
+
+def available_stock(cursor, product_id, stock_quantity):
+    """Current stock of a product: the slot total for ledger products, else ``stock_quantity``"""
+    if product_id not in hot_products(cursor):
+        return stock_quantity
+    cursor.execute("""
+        SELECT COALESCE(SUM(quantity), 0) as total
+        FROM inventory_slots
+        WHERE product_id = %s
+    """, (product_id,))
+    return int(cursor.fetchone()['total'])
+
+
+def claim(cursor, product_id, quantity):
+    """
+    Take ``quantity`` units of a ledger product.
+    Returns True on success, False if there is not enough stock, and None if the
+    product is no longer on the ledger (the caller's view of hot products is stale).
+    """
+    # Fast path: any slot no other checkout holds that covers the whole quantity
+    cursor.execute("""
+        SELECT slot_no
+        FROM inventory_slots
+        WHERE product_id = %s AND quantity >= %s
+        ORDER BY slot_no
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    """, (product_id, quantity))
+    slot = cursor.fetchone()
+    if slot:
+        cursor.execute("""
+            UPDATE inventory_slots
+            SET quantity = quantity - %s
+            WHERE product_id = %s AND slot_no = %s
+        """, (quantity, product_id, slot['slot_no']))
+        return True
+
+    # Slow path: wait for every slot and gather the quantity from several of them
+    slots = _lock_slots(cursor, product_id)
+    if not slots:
+        return None
+    if sum(row['quantity'] for row in slots) < quantity:
+        return False
+
+    remaining = quantity
+    for row in sorted(slots, key=lambda r: r['quantity'], reverse=True):
+        take = min(row['quantity'], remaining)
+        if take <= 0:
+            break
+        cursor.execute("""
+            UPDATE inventory_slots
+            SET quantity = quantity - %s
+            WHERE product_id = %s AND slot_no = %s
+        """, (take, product_id, row['slot_no']))
+        remaining -= take
+    return True
+
+
+def release(cursor, product_id, quantity):
+    """Give ``quantity`` units back to a ledger product (cancel/decline); False if not on the ledger"""
+    cursor.execute("""
+        SELECT slot_no
+        FROM inventory_slots
+        WHERE product_id = %s
+        ORDER BY quantity
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    """, (product_id,))
+    slot = cursor.fetchone()
+    if slot:
+        cursor.execute("""
+            UPDATE inventory_slots
+            SET quantity = quantity + %s
+            WHERE product_id = %s AND slot_no = %s
+        """, (quantity, product_id, slot['slot_no']))
+        return True
+
+    # Every slot is busy (or there are none): wait for the emptiest one
+    cursor.execute("""
+        UPDATE inventory_slots
+        SET quantity = quantity + %s
+        WHERE product_id = %s
+        ORDER BY quantity
+        LIMIT 1
+    """, (quantity, product_id))
+    return cursor.rowcount > 0
+
+
+def restock(cursor, quantities):
+    """
+    Give back {product_id: quantity} (cancel/decline): into the slots of ledger
+    products, onto products.stock_quantity for the rest.
+
+    Which products are on the ledger is read from inventory_slots under the
+    products row locks, not from the hot cache, so a product split or merged a
+    moment ago cannot have its units added to the wrong place (and then
+    overwritten by the reconciler).
+    """
+    product_ids = sorted(quantities)
+    if not product_ids:
+        return
+    in_clause = ','.join(['%s'] * len(product_ids))
+
+    # split_stock/merge_stock lock the products row too, so the ledger cannot change under us;
+    # id order and rows before slots keep the lock order of checkout
+    cursor.execute(f"""
+        SELECT id
+        FROM products
+        WHERE id IN ({in_clause})
+        ORDER BY id
+        FOR UPDATE
+    """, product_ids)
+    cursor.fetchall()
+    cursor.execute(f"""
+        SELECT DISTINCT product_id
+        FROM inventory_slots
+        WHERE product_id IN ({in_clause})
+    """, product_ids)
+    ledger_ids = {row['product_id'] for row in cursor.fetchall()}
+
+    for product_id in product_ids:
+        if product_id in ledger_ids:
+            release(cursor, product_id, quantities[product_id])
+        else:
+            cursor.execute("""
+                UPDATE products
+                SET stock_quantity = stock_quantity + %s
+                WHERE id = %s
+            """, (quantities[product_id], product_id))
+
+
+def rebalance(cursor, product_id):
+    """Even out a product's slots if the emptiest holds less than half its fair share"""
+    slots = _lock_slots(cursor, product_id)
+    if not slots:
+        return False
+    total = sum(row['quantity'] for row in slots)
+    fair_share = total // len(slots)
+    if min(row['quantity'] for row in slots) * 2 >= fair_share:
+        return False
+    _write_slots(cursor, product_id, total, len(slots))
+    return True
+
+
+def reconcile(cursor):
+    """Copy slot totals into products.stock_quantity; returns the ids whose stock changed"""
+    cursor.execute("""
+        SELECT s.product_id, SUM(s.quantity) as total
+        FROM inventory_slots s
+        JOIN products p ON p.id = s.product_id
+        GROUP BY s.product_id, p.stock_quantity
+        HAVING SUM(s.quantity) <> p.stock_quantity
+    """)
+    changed = cursor.fetchall()
+    if not changed:
+        return []
+
+    case_sql = ' '.join(['WHEN %s THEN %s'] * len(changed))
+    case_params = [value for row in changed for value in (row['product_id'], int(row['total']))]
+    ids = [row['product_id'] for row in changed]
+    cursor.execute(f"""
+        UPDATE products
+        SET stock_quantity = CASE id {case_sql} END
+        WHERE id IN ({','.join(['%s'] * len(ids))})
+    """, case_params + ids)
+    return ids
+
+
+def run_maintenance():
+    """Rebalance every ledger product, then reconcile; returns (rebalanced ids, reconciled ids)"""
+    conn = get_db()
+    if not conn:
+        return [], []
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        invalidate_hot()
+        rebalanced = []
+        for product_id in sorted(hot_products(cursor)):
+            if rebalance(cursor, product_id):
+                rebalanced.append(product_id)
+            # Commit per product so slot locks are held as briefly as possible
+            conn.commit()
+
+        reconciled = reconcile(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    if reconciled:
+        from routes.products import invalidate_products
+        invalidate_products(reconciled)
+    return rebalanced, reconciled
+
+
+def _reconcile_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            rebalanced, reconciled = run_maintenance()
+            if rebalanced or reconciled:
+                logger.info("Inventory ledger maintenance", extra={'fields': {
+                    'rebalanced': rebalanced, 'reconciled': reconciled}})
+        except Exception as e:
+            logger.exception("Inventory reconcile error: %s", e)
+
+
+def start_reconciler():
+    """Start the background rebalance/reconcile thread once per process"""
+    global _reconciler
+    interval = Config.INVENTORY_RECONCILE_INTERVAL
+    if interval <= 0:
+        return
+    with _reconciler_lock:
+        if _reconciler is None:
+            _reconciler = threading.Thread(
+                target=_reconcile_loop, args=(interval,), name='inventory-reconciler', daemon=True)
+            _reconciler.start()
@@ -0,0 +1,156 @@
+"""
+Versioned schema migrations.
+
+Files in database/migrations are named NNN_description.sql and applied in
+version order. Applied versions are recorded in the schema_migrations table,
+which schema.sql creates and fills for the migrations it already contains,
+so a fresh database starts up to date.
+
+    python migrate.py status                  # applied and pending versions
+    python migrate.py up [--to VERSION]       # apply pending migrations
+    python migrate.py baseline --to VERSION   # record versions as applied without running them
+
+Use baseline for a database created from an older schema.sql that has no
+schema_migrations table: record the versions it already has, then run up.
+MySQL commits DDL implicitly, so a migration that fails halfway is not
+recorded and has to be finished (or undone) by hand before running up again.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+
+from database import get_db
+from app_logging import get_logger
+
+logger = get_logger('migrate')
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'migrations')
+
+_MIGRATION_FILE = re.compile(r'^(\d+)_[\w-]+\.sql$')
+
+# The connection already points at Config.MYSQL_DB; migration files start with
+# "USE ecommerce_db;" so they can also be fed to the mysql client directly
+_USE_STATEMENT = re.compile(r'^USE\s+\S+$', re.IGNORECASE)
+
+
+def list_migrations():
+    """(version, filename, path) of every migration file, in version order"""
+    migrations = []
+    for name in os.listdir(MIGRATIONS_DIR):
+        match = _MIGRATION_FILE.match(name)
+        if match:
+            migrations.append((match.group(1), name, os.path.join(MIGRATIONS_DIR, name)))
+    migrations.sort(key=lambda migration: int(migration[0]))
+    return migrations
+
+
+def split_statements(sql):
+    """Statements of a migration file (comment lines and USE dropped)"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    statements = [statement.strip() for statement in '\n'.join(lines).split(';')]
+    return [statement for statement in statements if statement and not _USE_STATEMENT.match(statement)]
+
+
+def checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(20) PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            checksum CHAR(64),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+def applied_versions(cursor):
+    """version -> checksum recorded when it was applied (None if it came from schema.sql)"""
+    cursor.execute("SELECT version, checksum FROM schema_migrations")
+    return {row['version']: row['checksum'] for row in cursor.fetchall()}
+
+
+def record(cursor, version, name, file_checksum):
+    cursor.execute("""
+        INSERT INTO schema_migrations (version, name, checksum)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE name = VALUES(name), checksum = VALUES(checksum)
+    """, (version, name, file_checksum))
+
+
+def pending(cursor, to_version=None):
+    """Migrations not applied yet, up to and including ``to_version``"""
+    applied = applied_versions(cursor)
+    return [
+        migration for migration in list_migrations()
+        if migration[0] not in applied and (to_version is None or int(migration[0]) <= int(to_version))
+    ]
+
+
+def apply(cursor, conn, version, name, path):
+    """Run every statement of one migration file, then record it"""
+    with open(path) as f:
+        statements = split_statements(f.read())
+
+    for statement in statements:
+        cursor.execute(statement)
+    record(cursor, version, name, checksum(path))
+    conn.commit()
+    logger.info("Migration applied", extra={'fields': {'version': version, 'statements': len(statements)}})
+
+
+def status(cursor):
+    applied = applied_versions(cursor)
+    for version, name, path in list_migrations():
+        if version not in applied:
+            state = 'pending'
+        elif applied[version] and applied[version] != checksum(path):
+            state = 'applied (file changed since)'
+        else:
+            state = 'applied'
+        print(f"{version}  {state:<28} {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply versioned schema migrations')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    subcommands.add_parser('status', help='List applied and pending migrations')
+    up_parser = subcommands.add_parser('up', help='Apply pending migrations')
+    up_parser.add_argument('--to', help='Last version to apply (default: all)')
+    baseline_parser = subcommands.add_parser('baseline', help='Record migrations as applied without running them')
+    baseline_parser.add_argument('--to', required=True, help='Last version the database already has')
+    args = parser.parse_args()
+
+    conn = get_db()
+    if not conn:
+        raise SystemExit('Database connection failed')
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        ensure_migrations_table(cursor)
+
+        if args.command == 'status':
+            status(cursor)
+        elif args.command == 'baseline':
+            for version, name, path in pending(cursor, args.to):
+                record(cursor, version, name, checksum(path))
+                print(f"{version}  recorded  {name}")
+            conn.commit()
+        else:
+            migrations = pending(cursor, args.to)
+            for version, name, path in migrations:
+                print(f"{version}  applying  {name}")
+                apply(cursor, conn, version, name, path)
+            print(f"{len(migrations)} migration(s) applied")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,33 @@
-from flask_login import UserMixin
-from flask_bcrypt import Bcrypt
 from database import Database
+from cache import TTLCache
+from config import Config
+import passwords
+import availability
+import user_stats
+from passwords import PasswordHasherBusy
+from app_logging import get_logger
 import re
 from datetime import datetime
 
-bcrypt = Bcrypt()
+logger = get_logger('models.user')
 
-class User(UserMixin):
-    def __init__(self, id, username, email, password_hash, first_name, last_name, 
+# Columns a User is built from; password_hash is read only by verify_password
+USER_COLUMNS = ('id', 'username', 'email', 'first_name', 'last_name', 'address', 'phone',
+                'is_active', 'is_admin', 'created_at', 'updated_at')
+
+# Users by ('id', id); ('email', email) and ('username', username) map to the user id.
+# Cached instances are shared between requests, so treat them as read-only.
+user_cache = TTLCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+
+class User:
+    __slots__ = USER_COLUMNS
+    
+    def __init__(self, id, username, email, first_name, last_name, 
                  address=None, phone=None, is_active=1, is_admin=0, 
                  created_at=None, updated_at=None):
         self.id = id
         self.username = username
         self.email = email
-        self.password_hash = password_hash
         self.first_name = first_name
         self.last_name = last_name
         self.address = address
@@ -23,39 +37,64 @@ class User(UserMixin):
         self.created_at = created_at
         self.updated_at = updated_at
     
+    @staticmethod
+    def _load(column, value):
+        # Safe to use f-string: column is one of id/email/username, USER_COLUMNS is a constant
+        query = f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE {column} = %s"
+        user_data = Database.execute_query(query, (value,), fetch_one=True)
+        if not user_data:
+            return None
+        
+        user = User(**user_data)
+        user_cache.set(('id', user.id), user)
+        user_cache.set(('email', user.email.lower()), user.id)
+        user_cache.set(('username', user.username.lower()), user.id)
+        return user
+    
+    @staticmethod
+    def _get_by(column, value):
+        """Cached lookup by a unique column (case-insensitive, like the users collation)"""
+        if not value:
+            return None
+        
+        key = value.lower()
+        user_id = user_cache.get((column, key))
+        if user_id is not None:
+            user = user_cache.get(('id', user_id))
+            # The id entry may have been invalidated, or the value may now belong to someone else
+            if user is not None and getattr(user, column).lower() == key:
+                return user
+        return User._load(column, value)
+    
     @staticmethod
     def get_by_id(user_id):
         """Get user by ID"""
-        query = "SELECT * FROM users WHERE id = %s"
-        user_data = Database.execute_query(query, (user_id,), fetch_one=True)
-        if user_data:
-            return User(**user_data)
-        return None
+        user = user_cache.get(('id', user_id))
+        if user is not None:
+            return user
+        return User._load('id', user_id)
     
     @staticmethod
     def get_by_email(email):
         """Get user by email"""
-        query = "SELECT * FROM users WHERE email = %s"
-        user_data = Database.execute_query(query, (email,), fetch_one=True)
-        if user_data:
-            return User(**user_data)
-        return None
+        return User._get_by('email', email)
     
     @staticmethod
     def get_by_username(username):
         """Get user by username"""
-        query = "SELECT * FROM users WHERE username = %s"
-        user_data = Database.execute_query(query, (username,), fetch_one=True)
-        if user_data:
-            return User(**user_data)
-        return None
+        return User._get_by('username', username)
+    
+    @staticmethod
+    def invalidate(user_id):
+        """Drop a cached user whose row changed (admin activate/deactivate/reset-password)"""
+        user_cache.invalidate(('id', user_id))
     
     @staticmethod
     def create(username, email, password, first_name, last_name, address=None, phone=None):
         """Create a new user"""
         try:
             
-            password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+            password_hash = passwords.hash_password(password)
             
             query = """
             INSERT INTO users 
@@ -64,20 +103,48 @@ class User(UserMixin):
             """
             
             params = (username, email, password_hash, first_name, last_name, address, phone)
-            user_id = Database.execute_query(query, params, lastrowid=True)
+            
+            connection = Database.get_connection()
+            if not connection:
+                logger.error("No database connection")
+                return None
+            
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(query, params)
+                user_id = cursor.lastrowid
+                # Zeroed order counters for the admin user directory, in the same transaction
+                user_stats.create_user_stats(cursor, user_id)
+                connection.commit()
+            finally:
+                cursor.close()
+                connection.close()
             
             if user_id:
+                availability.add(username, email)
+                
                 #fetch mo ung new user 
                 return User.get_by_id(user_id)
             return None
             
+        except PasswordHasherBusy:
+            raise
         except Exception as e:
-            print(f"Error creating user: {e}")
+            logger.exception("Error creating user: %s", e)
             return None
     
     def verify_password(self, password):
-        """Verify password hash"""
-        return bcrypt.check_password_hash(self.password_hash, password)
+        """Verify password hash (raises PasswordHasherBusy when the hashing pool is full)
+        
+        The hash is read fresh on every call; it is never kept in the user cache.
+        """
+        row = Database.execute_query(
+            "SELECT password_hash FROM users WHERE id = %s", (self.id,), fetch_one=True)
+        password_hash = row['password_hash'] if row else None
+        if not passwords.check_password(password, password_hash):
+            return False
+        passwords.rehash_if_needed(self.id, password, password_hash)
+        return True
     
     @staticmethod
     def validate_email(email):
@@ -0,0 +1,87 @@
+"""
+Helpers for keyset (cursor) pagination.
+
+Cursors are opaque to clients: a URL-safe base64 encoding of the sort key
+values of the last row on the page. Handlers decode them back into the
+values they compare against in their WHERE clause, checking each value's type
+with the cursor_* helpers so a tampered cursor is a 400, not a database error.
+"""
+
+import base64
+import json
+from datetime import datetime, date
+from decimal import Decimal
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a client sends a cursor we did not issue"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(*values):
+    """Pack the sort key values of a row into an opaque cursor string"""
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Unpack a cursor created by encode_cursor() into a list of ``size`` values"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursorError('Invalid cursor') from e
+
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError('Invalid cursor')
+    return values
+
+
+def cursor_timestamp(value):
+    """A datetime value as encode_cursor() writes it ('YYYY-MM-DD HH:MM:SS')"""
+    try:
+        datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError) as e:
+        raise InvalidCursorError('Invalid cursor') from e
+    return value
+
+
+def cursor_int(value):
+    """An integer value (ids, counts)"""
+    # bool is a subclass of int
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise InvalidCursorError('Invalid cursor')
+    return value
+
+
+def cursor_decimal(value):
+    """A Decimal value as encode_cursor() writes it (a numeric string)"""
+    try:
+        number = Decimal(value) if isinstance(value, str) else None
+    except ArithmeticError as e:
+        raise InvalidCursorError('Invalid cursor') from e
+    if number is None or not number.is_finite():
+        raise InvalidCursorError('Invalid cursor')
+    return value
+
+
+def cursor_string(value):
+    """A text value"""
+    if not isinstance(value, str):
+        raise InvalidCursorError('Invalid cursor')
+    return value
+
+
+def get_limit(args, default=50, maximum=200, name='limit'):
+    """Read ``limit`` (or another page-size arg) from request args, clamped to 1..maximum"""
+    limit = args.get(name, default, type=int)
+    return max(1, min(limit, maximum))
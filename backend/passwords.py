@@ -0,0 +1,203 @@
+"""
+Password hashing on a dedicated, bounded thread pool.
+
+bcrypt at a realistic cost takes a few hundred milliseconds of CPU. Running it
+on the request thread lets a login burst occupy every worker, so health checks
+and every other endpoint stall behind it. Instead, hashes are computed by
+BCRYPT_WORKERS threads (bcrypt releases the GIL while it works). At most
+BCRYPT_QUEUE_LIMIT further jobs may wait for a thread. Beyond that, callers get
+PasswordHasherBusy right away and the endpoint answers 503 with Retry-After.
+
+Hashes made with a cost other than BCRYPT_ROUNDS are rehashed in the
+background after a successful login. Latency, queue depth and rejections are
+exposed at /api/health/passwords.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from flask import jsonify
+
+from config import Config
+from database import get_db
+from app_logging import get_logger
+
+logger = get_logger('passwords')
+
+_executor = ThreadPoolExecutor(max_workers=Config.BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+
+# Jobs submitted and not finished yet (running + queued)
+_pending = 0
+_pending_lock = threading.Lock()
+
+# Latency samples in milliseconds for the percentiles in stats()
+LATENCY_SAMPLES = 1000
+_stats_lock = threading.Lock()
+_stats = {
+    'hash': {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'samples': deque(maxlen=LATENCY_SAMPLES)},
+    'check': {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'samples': deque(maxlen=LATENCY_SAMPLES)}
+}
+_counters = {'rejected': 0, 'rehashed': 0, 'rehash_failed': 0, 'max_wait_ms': 0.0}
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool and its queue are full"""
+
+
+def busy_response():
+    """503 for a request rejected because the hashing pool is saturated"""
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+def _record(operation, elapsed_ms):
+    with _stats_lock:
+        entry = _stats[operation]
+        entry['count'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['samples'].append(elapsed_ms)
+
+
+def _done(_future):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+def _submit(operation, fn, *args):
+    """Run fn on the hashing pool; raises PasswordHasherBusy instead of queueing past the limit"""
+    global _pending
+    with _pending_lock:
+        full = _pending >= Config.BCRYPT_WORKERS + Config.BCRYPT_QUEUE_LIMIT
+        if not full:
+            _pending += 1
+    if full:
+        with _stats_lock:
+            _counters['rejected'] += 1
+        raise PasswordHasherBusy()
+
+    submitted = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            finished = time.perf_counter()
+            _record(operation, (finished - started) * 1000)
+            with _stats_lock:
+                _counters['max_wait_ms'] = max(_counters['max_wait_ms'], (started - submitted) * 1000)
+
+    try:
+        future = _executor.submit(job)
+    except Exception:
+        _done(None)
+        raise
+    future.add_done_callback(_done)
+    return future
+
+
+def _hash(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(Config.BCRYPT_ROUNDS)).decode('utf-8')
+
+
+def _check(password, password_hash):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed hash in the database
+        return False
+
+
+def hash_password(password):
+    """bcrypt hash (str) of a password at BCRYPT_ROUNDS; raises PasswordHasherBusy"""
+    return _submit('hash', _hash, password).result()
+
+
+def check_password(password, password_hash):
+    """Whether the password matches the stored hash; raises PasswordHasherBusy"""
+    if not password_hash:
+        return False
+    return _submit('check', _check, password, password_hash).result()
+
+
+def needs_rehash(password_hash):
+    """True if the hash was made with a cost other than BCRYPT_ROUNDS"""
+    try:
+        return int(password_hash.split('$')[2]) != Config.BCRYPT_ROUNDS
+    except (AttributeError, IndexError, ValueError):
+        return False
+
+
+def _rehash(user_id, password, old_hash):
+    new_hash = _hash(password)
+
+    conn = get_db()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+
+    cursor = conn.cursor()
+    try:
+        # Only replace the hash the password was verified against
+        cursor.execute(
+            "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+            (new_hash, user_id, old_hash))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _rehash_done(user_id, future):
+    error = future.exception()
+    with _stats_lock:
+        _counters['rehash_failed' if error else 'rehashed'] += 1
+    if error:
+        logger.warning("Password rehash failed: %s", error, extra={'fields': {'user_id': user_id}})
+
+
+def rehash_if_needed(user_id, password, password_hash):
+    """After a successful login, move the stored hash to BCRYPT_ROUNDS in the background"""
+    if not needs_rehash(password_hash):
+        return
+
+    try:
+        future = _submit('hash', _rehash, user_id, password, password_hash)
+    except PasswordHasherBusy:
+        # Not worth a 503; the next login tries again
+        return
+    future.add_done_callback(lambda f: _rehash_done(user_id, f))
+
+
+def stats():
+    """Hashing pool usage and latency for monitoring"""
+    with _pending_lock:
+        pending = _pending
+
+    with _stats_lock:
+        result = {
+            'workers': Config.BCRYPT_WORKERS,
+            'queue_limit': Config.BCRYPT_QUEUE_LIMIT,
+            'rounds': Config.BCRYPT_ROUNDS,
+            'in_flight': pending,
+            'queued': max(0, pending - Config.BCRYPT_WORKERS),
+            'rejected': _counters['rejected'],
+            'rehashed': _counters['rehashed'],
+            'rehash_failed': _counters['rehash_failed'],
+            'max_wait_ms': round(_counters['max_wait_ms'], 3)
+        }
+        for operation, entry in _stats.items():
+            samples = sorted(entry['samples'])
+            result[operation] = {
+                'count': entry['count'],
+                'avg_ms': round(entry['total_ms'] / entry['count'], 3) if entry['count'] else 0.0,
+                'p50_ms': round(samples[len(samples) // 2], 3) if samples else 0.0,
+                'p95_ms': round(samples[int(len(samples) * 0.95)], 3) if samples else 0.0,
+                'max_ms': round(entry['max_ms'], 3)
+            }
+    return result
@@ -0,0 +1,243 @@
+"""
+Sales report rendering jobs on a process pool.
+
+The request thread fetches the (memoized) report data and submits it here.
+reportlab/python-docx then build the document in a worker process, off the
+request thread and the GIL, and write it to REPORT_JOB_DIR. Each job has an
+id; its metadata lives next to the file as <id>.json, so any backend process
+can answer status polls and serve the download.
+
+Full-length PDF exports (every period, see submit_export_job) run on the same
+pool, but the worker reads the rows from the database itself so they never
+pass through the request process.
+
+Identical requests (same format, period and dates) submitted while a job is
+queued or running get that job back instead of a new one. Finished jobs are
+deleted after REPORT_JOB_TTL seconds.
+"""
+
+import functools
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from config import Config
+from app_logging import get_logger
+from report_render import render_report_file, write_paged_pdf
+
+logger = get_logger('report_jobs')
+
+MIMETYPES = {
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+}
+
+FINISHED_STATUSES = {'done', 'failed'}
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Jobs submitted by this process: job key -> job id, and job id -> Future
+_inflight = {}
+_futures = {}
+_jobs_lock = threading.Lock()
+
+
+def get_executor():
+    """Process pool shared by all report jobs of this process (created on first use)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn rather than fork: the parent has pool, logging and reconciler threads
+            _executor = ProcessPoolExecutor(
+                max_workers=Config.REPORT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def _meta_path(job_id):
+    return os.path.join(Config.REPORT_JOB_DIR, f'{job_id}.json')
+
+
+def file_path(job):
+    """Where the rendered document of a job is (or will be) stored"""
+    return os.path.join(Config.REPORT_JOB_DIR, f"{job['id']}.{job['format']}")
+
+
+def _write_meta(job):
+    path = _meta_path(job['id'])
+    tmp_path = f'{path}.part'
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, path)
+
+
+def _read_meta(job_id):
+    if not _JOB_ID.match(job_id or ''):
+        return None
+    try:
+        with open(_meta_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def get_job(job_id):
+    """Job metadata, or None for an unknown (or malformed) id"""
+    job = _read_meta(job_id)
+    if job is None:
+        return None
+
+    with _jobs_lock:
+        future = _futures.get(job_id)
+    if job['status'] == 'queued' and future is not None and future.running():
+        job['status'] = 'running'
+    return job
+
+
+def purge_expired_jobs():
+    """Delete finished jobs (metadata and file) older than REPORT_JOB_TTL"""
+    cutoff = time.time() - Config.REPORT_JOB_TTL
+    for name in os.listdir(Config.REPORT_JOB_DIR):
+        if not name.endswith('.json'):
+            continue
+        job = _read_meta(name[:-len('.json')])
+        if not job or job['status'] not in FINISHED_STATUSES or job['created_at'] >= cutoff:
+            continue
+        for path in (file_path(job), _meta_path(job['id'])):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _finish(key, job_id, future):
+    """Record the outcome of a job (runs once the worker process is done)"""
+    job = get_job(job_id)
+    if job and job['status'] not in FINISHED_STATUSES:
+        job['finished_at'] = time.time()
+        error = future.exception()
+        if error is None:
+            job['status'] = 'done'
+            job['size'] = future.result()
+        else:
+            job['status'] = 'failed'
+            job['error'] = str(error) or type(error).__name__
+            logger.error("Report job failed: %s", job['error'], extra={'fields': {'job_id': job_id}})
+            if isinstance(error, BrokenProcessPool):
+                _reset_executor()
+        _write_meta(job)
+
+    with _jobs_lock:
+        if _inflight.get(key) == job_id:
+            del _inflight[key]
+        _futures.pop(job_id, None)
+    return job
+
+
+def render_export_pdf(period, start_date, end_date, path):
+    """Worker: draw every period of the range into a paged PDF at ``path``; returns its size"""
+    # Imported here so only workers that run exports open database connections
+    from database import get_db, close_streaming_cursor
+    import sales_rollup
+
+    conn = get_db()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+
+    # Unbuffered: rows are fetched in batches while the pages are drawn
+    cursor = conn.cursor(dictionary=True)
+    try:
+        rows = sales_rollup.iter_period_totals(cursor, period, start_date, end_date)
+        tmp_path = f'{path}.part'
+        with open(tmp_path, 'wb') as f:
+            write_paged_pdf(rows, f, period, start_date, end_date)
+    finally:
+        close_streaming_cursor(cursor, conn)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def submit_report_job(format_type, period, start_date, end_date, report):
+    """Queue rendering of ``report``; returns the job (an existing one for an identical request)"""
+    key = (format_type, period, start_date or None, end_date or None)
+    return _submit(key, format_type, period, start_date, end_date,
+                   render_report_file, format_type, period, start_date, end_date, report)
+
+
+def submit_export_job(period, start_date, end_date):
+    """Queue a PDF of every period in the range; returns the job (an existing one for an identical request)"""
+    key = ('export', period, start_date or None, end_date or None)
+    return _submit(key, 'pdf', period, start_date, end_date,
+                   render_export_pdf, period, start_date, end_date)
+
+
+def _submit(key, format_type, period, start_date, end_date, render, *args):
+    """Create the job and run ``render(*args, path)`` on the pool"""
+    os.makedirs(Config.REPORT_JOB_DIR, exist_ok=True)
+
+    with _jobs_lock:
+        job_id = _inflight.get(key)
+        if job_id:
+            job = _read_meta(job_id)
+            if job:
+                return job
+
+        job_id = uuid.uuid4().hex
+        created_at = time.time()
+        job = {
+            'id': job_id,
+            'status': 'queued',
+            'format': format_type,
+            'period': period,
+            'start_date': start_date,
+            'end_date': end_date,
+            'filename': f"sales_report_{period}_{time.strftime('%Y%m%d_%H%M%S', time.localtime(created_at))}.{format_type}",
+            'created_at': created_at,
+            'finished_at': None,
+            'size': None,
+            'error': None
+        }
+        _write_meta(job)
+
+        future = get_executor().submit(render, *args, file_path(job))
+        _inflight[key] = job_id
+        _futures[job_id] = future
+
+    future.add_done_callback(functools.partial(_finish, key, job_id))
+
+    try:
+        purge_expired_jobs()
+    except OSError as e:
+        logger.warning("Could not purge expired report jobs: %s", e)
+
+    return job
+
+
+def wait_for_job(job, timeout):
+    """Wait up to ``timeout`` seconds for a job of this process to finish; returns its latest state"""
+    with _jobs_lock:
+        future = _futures.get(job['id'])
+        key = next((k for k, v in _inflight.items() if v == job['id']), None)
+    if future is None:
+        return get_job(job['id']) or job
+
+    wait([future], timeout=timeout)
+    if future.done():
+        # Done callbacks may run after waiters wake up; recording the outcome twice is harmless
+        return _finish(key, job['id'], future) or get_job(job['id'])
+    return get_job(job['id']) or job
@@ -0,0 +1,369 @@
+"""
+PDF and DOCX rendering of sales reports, plus streaming CSV/NDJSON/PDF writers.
+
+Pure functions of the report data (no Flask, no database), so report_jobs can
+run them in worker processes. reportlab and python-docx are imported lazily.
+
+The streaming writers take any iterable of period rows (e.g. from
+sales_rollup.iter_period_totals). The CSV/NDJSON writers hold one row at a
+time; the paged PDF writer does not keep the rows, but reportlab's canvas keeps
+every drawn page until save().
+"""
+
+import csv
+import io
+import json
+import os
+from io import BytesIO
+from datetime import datetime, date
+from decimal import Decimal
+
+
+def generate_pdf_report(period, start_date, end_date, sales_data, overall_stats, top_products):
+    """Generate PDF sales report using reportlab"""
+    from reportlab.lib.pagesizes import letter, A4
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT
+    
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+    styles = getSampleStyleSheet()
+    
+    # Title
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#2c3e50'),
+        spaceAfter=30,
+        alignment=TA_CENTER
+    )
+    elements.append(Paragraph("E-Commerce Sales Report", title_style))
+    elements.append(Spacer(1, 0.2*inch))
+    
+    # Report details
+    detail_style = styles['Normal']
+    elements.append(Paragraph(f"<b>Period:</b> {period.capitalize()}", detail_style))
+    if start_date:
+        elements.append(Paragraph(f"<b>Start Date:</b> {start_date}", detail_style))
+    if end_date:
+        elements.append(Paragraph(f"<b>End Date:</b> {end_date}", detail_style))
+    elements.append(Paragraph(f"<b>Generated:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", detail_style))
+    elements.append(Spacer(1, 0.3*inch))
+    
+    # Overall Statistics
+    elements.append(Paragraph("<b>Overall Statistics</b>", styles['Heading2']))
+    elements.append(Spacer(1, 0.1*inch))
+    
+    if overall_stats:
+        stats_data = [
+            ['Metric', 'Value'],
+            ['Total Orders', str(overall_stats.get('total_orders', 0))],
+            ['Total Revenue', f"${overall_stats.get('total_revenue', 0):,.2f}"],
+            ['Average Order Value', f"${overall_stats.get('average_order_value', 0):,.2f}"],
+            ['Unique Customers', str(overall_stats.get('unique_customers', 0))],
+            ['Delivered Orders', str(overall_stats.get('delivered_orders', 0))],
+            ['Delivered Revenue', f"${overall_stats.get('delivered_revenue', 0):,.2f}"],
+        ]
+        
+        stats_table = Table(stats_data, colWidths=[3*inch, 2*inch])
+        stats_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        elements.append(stats_table)
+        elements.append(Spacer(1, 0.3*inch))
+    
+    # Sales Data by Period
+    if sales_data:
+        elements.append(Paragraph(f"<b>Sales Data by {period.capitalize()}</b>", styles['Heading2']))
+        elements.append(Spacer(1, 0.1*inch))
+        
+        sales_table_data = [['Period', 'Orders', 'Revenue', 'Avg Order', 'Customers']]
+        for item in sales_data:
+            sales_table_data.append([
+                str(item.get('period_label', '')),
+                str(item.get('total_orders', 0)),
+                f"${item.get('total_revenue', 0):,.2f}",
+                f"${item.get('average_order_value', 0):,.2f}",
+                str(item.get('unique_customers', 0))
+            ])
+        
+        # repeatRows keeps the header on every page the table flows onto
+        sales_table = Table(sales_table_data, colWidths=[1.5*inch, 1*inch, 1.2*inch, 1.2*inch, 1*inch], repeatRows=1)
+        sales_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        elements.append(sales_table)
+        elements.append(Spacer(1, 0.3*inch))
+    
+    # Top Products
+    if top_products:
+        elements.append(Paragraph("<b>Top 10 Selling Products</b>", styles['Heading2']))
+        elements.append(Spacer(1, 0.1*inch))
+        
+        products_table_data = [['Rank', 'Product Name', 'Quantity Sold', 'Revenue']]
+        for idx, product in enumerate(top_products, 1):
+            products_table_data.append([
+                str(idx),
+                str(product.get('name', ''))[:30],  # Truncate long names
+                str(product.get('total_quantity_sold', 0)),
+                f"${product.get('total_revenue', 0):,.2f}"
+            ])
+        
+        products_table = Table(products_table_data, colWidths=[0.7*inch, 2.5*inch, 1.3*inch, 1.5*inch])
+        products_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        elements.append(products_table)
+    
+    # Build PDF
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+def generate_docx_report(period, start_date, end_date, sales_data, overall_stats, top_products):
+    """Generate DOCX sales report using python-docx"""
+    from docx import Document
+    from docx.shared import Inches, Pt, RGBColor
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    
+    doc = Document()
+    
+    # Title
+    title = doc.add_heading('E-Commerce Sales Report', 0)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    # Report details
+    doc.add_paragraph(f"Period: {period.capitalize()}")
+    if start_date:
+        doc.add_paragraph(f"Start Date: {start_date}")
+    if end_date:
+        doc.add_paragraph(f"End Date: {end_date}")
+    doc.add_paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    doc.add_paragraph()
+    
+    # Overall Statistics
+    doc.add_heading('Overall Statistics', level=1)
+    if overall_stats:
+        stats_table = doc.add_table(rows=7, cols=2)
+        stats_table.style = 'Light Grid Accent 1'
+        
+        stats_table.rows[0].cells[0].text = 'Metric'
+        stats_table.rows[0].cells[1].text = 'Value'
+        stats_table.rows[1].cells[0].text = 'Total Orders'
+        stats_table.rows[1].cells[1].text = str(overall_stats.get('total_orders', 0))
+        stats_table.rows[2].cells[0].text = 'Total Revenue'
+        stats_table.rows[2].cells[1].text = f"${overall_stats.get('total_revenue', 0):,.2f}"
+        stats_table.rows[3].cells[0].text = 'Average Order Value'
+        stats_table.rows[3].cells[1].text = f"${overall_stats.get('average_order_value', 0):,.2f}"
+        stats_table.rows[4].cells[0].text = 'Unique Customers'
+        stats_table.rows[4].cells[1].text = str(overall_stats.get('unique_customers', 0))
+        stats_table.rows[5].cells[0].text = 'Delivered Orders'
+        stats_table.rows[5].cells[1].text = str(overall_stats.get('delivered_orders', 0))
+        stats_table.rows[6].cells[0].text = 'Delivered Revenue'
+        stats_table.rows[6].cells[1].text = f"${overall_stats.get('delivered_revenue', 0):,.2f}"
+    
+    doc.add_paragraph()
+    
+    # Sales Data by Period
+    if sales_data:
+        doc.add_heading(f'Sales Data by {period.capitalize()}', level=1)
+        sales_table = doc.add_table(rows=len(sales_data) + 1, cols=5)
+        sales_table.style = 'Light Grid Accent 1'
+        
+        # Headers
+        headers = sales_table.rows[0].cells
+        headers[0].text = 'Period'
+        headers[1].text = 'Orders'
+        headers[2].text = 'Revenue'
+        headers[3].text = 'Avg Order'
+        headers[4].text = 'Customers'
+        
+        # Data rows
+        for idx, item in enumerate(sales_data, 1):
+            cells = sales_table.rows[idx].cells
+            cells[0].text = str(item.get('period_label', ''))
+            cells[1].text = str(item.get('total_orders', 0))
+            cells[2].text = f"${item.get('total_revenue', 0):,.2f}"
+            cells[3].text = f"${item.get('average_order_value', 0):,.2f}"
+            cells[4].text = str(item.get('unique_customers', 0))
+    
+    doc.add_paragraph()
+    
+    # Top Products
+    if top_products:
+        doc.add_heading('Top 10 Selling Products', level=1)
+        products_table = doc.add_table(rows=len(top_products) + 1, cols=4)
+        products_table.style = 'Light Grid Accent 1'
+        
+        # Headers
+        headers = products_table.rows[0].cells
+        headers[0].text = 'Rank'
+        headers[1].text = 'Product Name'
+        headers[2].text = 'Quantity Sold'
+        headers[3].text = 'Revenue'
+        
+        # Data rows
+        for idx, product in enumerate(top_products, 1):
+            cells = products_table.rows[idx].cells
+            cells[0].text = str(idx)
+            cells[1].text = str(product.get('name', ''))
+            cells[2].text = str(product.get('total_quantity_sold', 0))
+            cells[3].text = f"${product.get('total_revenue', 0):,.2f}"
+    
+    # Save to buffer
+    buffer = BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+RENDERERS = {
+    'pdf': generate_pdf_report,
+    'docx': generate_docx_report
+}
+
+
+def render_report_file(format_type, period, start_date, end_date, report, path):
+    """Render a report to ``path`` (written atomically); returns the file size in bytes"""
+    buffer = RENDERERS[format_type](period, start_date, end_date,
+                                    report['sales_data'], report['overall_stats'], report['top_products'])
+    tmp_path = f'{path}.part'
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getbuffer())
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+# ========== STREAMING EXPORT ==========
+# Period row fields written by the streaming exports, in column order
+EXPORT_COLUMNS = [
+    ('period_label', 'Period'),
+    ('total_orders', 'Orders'),
+    ('total_revenue', 'Revenue'),
+    ('average_order_value', 'Avg Order'),
+    ('unique_customers', 'Customers'),
+    ('completed_orders', 'Completed'),
+    ('cancelled_orders', 'Cancelled'),
+    ('declined_orders', 'Declined')
+]
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(rows):
+    """CSV text for period rows: a header line, then one chunk per row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([key for key, _ in EXPORT_COLUMNS])
+    yield buffer.getvalue()
+
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(['' if row.get(key) is None else row[key] for key, _ in EXPORT_COLUMNS])
+        yield buffer.getvalue()
+
+
+def iter_ndjson(rows):
+    """One JSON object per line for period rows"""
+    for row in rows:
+        yield json.dumps({key: _json_value(value) for key, value in row.items()}) + '\n'
+
+
+def write_paged_pdf(rows, out, period, start_date=None, end_date=None):
+    """
+    Draw period rows onto as many PDF pages as they need, one page at a time.
+    
+    Unlike generate_pdf_report no Table of every row is built, and rows are
+    consumed as they are drawn. The canvas still keeps each finished page (as a
+    compressed content stream) until save(), so memory grows with the page count;
+    report_jobs runs this in a worker process.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.pdfgen import canvas
+    
+    width, height = letter
+    margin = 0.6*inch
+    line_height = 14
+    column_x = [margin + offset*inch for offset in (0, 1.6, 2.4, 3.5, 4.6, 5.5, 6.2, 6.9)]
+    
+    pdf = canvas.Canvas(out, pagesize=letter, pageCompression=1)
+    page_number = 0
+    
+    def start_page():
+        pdf.setFont('Helvetica-Bold', 14)
+        pdf.drawString(margin, height - margin, f"E-Commerce Sales Report ({period.capitalize()})")
+        pdf.setFont('Helvetica', 9)
+        range_label = f"{start_date or 'beginning'} to {end_date or 'today'}"
+        pdf.drawString(margin, height - margin - 16,
+                       f"Range: {range_label}    Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        pdf.drawRightString(width - margin, margin / 2, f"Page {page_number}")
+        
+        y = height - margin - 40
+        pdf.setFont('Helvetica-Bold', 9)
+        for x, (_, title) in zip(column_x, EXPORT_COLUMNS):
+            pdf.drawString(x, y, title)
+        pdf.line(margin, y - 4, width - margin, y - 4)
+        pdf.setFont('Helvetica', 9)
+        return y - line_height - 4
+    
+    y = None
+    for row in rows:
+        if y is None or y < margin:
+            if y is not None:
+                pdf.showPage()
+            page_number += 1
+            y = start_page()
+        
+        for x, (key, _) in zip(column_x, EXPORT_COLUMNS):
+            value = row.get(key)
+            if key in ('total_revenue', 'average_order_value'):
+                text = f"${float(value or 0):,.2f}"
+            else:
+                text = '' if value is None else str(value)
+            pdf.drawString(x, y, text)
+        y -= line_height
+    
+    if y is None:
+        page_number += 1
+        y = start_page()
+        pdf.drawString(margin, y, 'No sales in this range')
+    
+    pdf.showPage()
+    pdf.save()
+    return page_number
@@ -0,0 +1,92 @@
+"""
+Sales report engine shared by the report endpoints.
+
+GET /api/admin/reports/sales and the PDF/DOCX export both call
+get_sales_report_data(), so an admin who views a report and then exports it
+only pays for the queries once. Results are memoized per
+(period, start_date, end_date) for REPORT_CACHE_TTL seconds; order writes
+call invalidate_sales_reports() after they commit.
+
+The returned dict is shared between callers and must not be mutated.
+"""
+
+import threading
+from decimal import Decimal
+
+from config import Config
+from cache import TTLCache
+from database import get_db
+import sales_rollup
+
+report_cache = TTLCache(maxsize=Config.REPORT_CACHE_SIZE, ttl=Config.REPORT_CACHE_TTL)
+
+# Bumped on every invalidation so a load that raced with an order write is not cached
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def _to_float(row, *keys):
+    """Convert Decimal values of the given keys to float in place"""
+    for key in keys:
+        if isinstance(row.get(key), Decimal):
+            row[key] = float(row[key])
+
+
+def build_sales_report(cursor, period, start_date=None, end_date=None):
+    """Period breakdown, overall stats and top products for a date range"""
+    sales_data = sales_rollup.period_totals(cursor, period, start_date, end_date)
+    overall_stats = sales_rollup.overall_totals(cursor, start_date, end_date)
+    top_products = sales_rollup.top_products(cursor, start_date, end_date)
+
+    for item in sales_data:
+        _to_float(item, 'total_revenue', 'average_order_value')
+    if overall_stats:
+        _to_float(overall_stats, 'total_revenue', 'average_order_value', 'delivered_revenue')
+    for product in top_products:
+        _to_float(product, 'total_revenue')
+
+    return {
+        'sales_data': sales_data,
+        'overall_stats': overall_stats,
+        'top_products': top_products
+    }
+
+
+def load_sales_report(period, start_date=None, end_date=None):
+    """Run the report queries on a fresh connection; None if the DB is unavailable"""
+    conn = get_db()
+    if not conn:
+        return None
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        return build_sales_report(cursor, period, start_date, end_date)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def get_sales_report_data(period, start_date=None, end_date=None):
+    """Memoized report data; None if the DB is unavailable. Raises ValueError on a bad date."""
+    sales_rollup.date_range_filter(start_date, end_date)
+
+    key = (period, start_date or None, end_date or None)
+    report = report_cache.get(key)
+    if report is not None:
+        return report
+
+    generation = _generation
+    report = load_sales_report(period, start_date, end_date)
+    if report is not None:
+        with _generation_lock:
+            if generation == _generation:
+                report_cache.set(key, report)
+    return report
+
+
+def invalidate_sales_reports():
+    """Drop every memoized report (call after an order write commits)"""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        report_cache.clear()
@@ -4,6 +4,9 @@ Registers all blueprint routes
 """
 
 from flask import Blueprint
+from app_logging import get_logger
+
+logger = get_logger('routes')
 
 def register_blueprints(app):
     """Register all blueprints with the Flask app"""
@@ -19,4 +22,4 @@ def register_blueprints(app):
     app.register_blueprint(orders_bp, url_prefix='/api/orders')
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
     
-    print("✅ All blueprints registered successfully")
+    logger.info("All blueprints registered successfully")
@@ -1,108 +1,151 @@
-from flask import Blueprint, request, jsonify, send_file
-import mysql.connector
-from mysql.connector import Error
+from flask import Blueprint, request, jsonify, send_file, Response
+from app_logging import get_logger
+from config import Config
+from database import get_db, escape_like, get_date_range_filter, close_streaming_cursor
+import inventory
+import sales_rollup
+import user_stats
+import analytics
+import passwords
+import sessions
+from passwords import PasswordHasherBusy
+from reports import get_sales_report_data, invalidate_sales_reports
+from report_render import iter_csv, iter_ndjson
+from report_jobs import (submit_report_job, submit_export_job, wait_for_job,
+                         get_job as get_report_job, file_path as report_file_path,
+                         MIMETYPES as REPORT_MIMETYPES)
+from models.user import User
+from pagination import (encode_cursor, decode_cursor, get_limit, InvalidCursorError,
+                        cursor_timestamp, cursor_int, cursor_decimal)
+from .orders import attach_order_items
+from .products import (invalidate_featured_products, invalidate_categories,
+                       invalidate_product, invalidate_products, product_cache)
 from decimal import Decimal
-import bcrypt
-from io import BytesIO
 from datetime import datetime
 import os
 import uuid
 from werkzeug.utils import secure_filename
 
 admin_bp = Blueprint('admin', __name__)
+logger = get_logger('routes.admin')
 
 # Configuration
 BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 UPLOAD_DIR = os.path.join(BACKEND_DIR, 'static', 'uploads', 'products')
 
-def get_db():
-    """Get database connection"""
-    try:
-        DB_CONFIG = {
-            'host': 'localhost',
-            'user': 'root',
-            'password': '', 
-            'database': 'ecommerce_db'
-        }
-        return mysql.connector.connect(**DB_CONFIG)
-    except Error as e:
-        print(f"❌ Database error: {e}")
-        return None
+ORDER_STATUSES = ['pending', 'processing', 'shipped', 'in_transit', 'delivered', 'cancelled', 'declined']
 
-def get_date_grouping(period):
+# ========== ADMIN ORDER ENDPOINTS ==========
+def build_admin_orders_query(statuses=(), start_date=None, end_date=None, search='', after=None, limit=None):
     """
-    Get SQL date grouping and formatting based on period.
-    Returns a tuple of (date_group, date_format).
+    SQL and params of the admin order listing (also checked by explain_check.py).
     
-    This function uses a whitelist approach to prevent SQL injection.
-    Only pre-defined, hardcoded values are returned.
+    statuses must be valid ORDER_STATUSES; after is the (created_at, id) of the
+    previous page's last row. Raises ValueError for a malformed date.
     """
-    # Whitelist of allowed period values with their corresponding SQL expressions
-    period_config = {
-        'daily': ("DATE(o.created_at)", "%Y-%m-%d"),
-        'weekly': ("YEARWEEK(o.created_at, 1)", "Week %v, %Y"),
-        'monthly': ("DATE_FORMAT(o.created_at, '%Y-%m')", "%Y-%m")
-    }
+    where = []
+    params = []
+    
+    if statuses:
+        where.append(f"o.status IN ({','.join(['%s'] * len(statuses))})")
+        params.extend(statuses)
+    
+    date_filter, date_params = get_date_range_filter('o.created_at', start_date, end_date)
+    
+    if search:
+        # Prefix matches so idx_order_number and idx_email can be used
+        pattern = escape_like(search) + '%'
+        where.append("(o.order_number LIKE %s OR u.email LIKE %s)")
+        params.extend([pattern, pattern])
+    
+    if after:
+        where.append("(o.created_at < %s OR (o.created_at = %s AND o.id < %s))")
+        params.extend([after[0], after[0], after[1]])
+    
+    where_sql = ''.join(f" AND {condition}" for condition in where) + date_filter
+    params.extend(date_params)
     
-    # If period is not in whitelist, default to daily
-    return period_config.get(period, period_config['daily'])
+    # Per-order totals come from one grouped join instead of two correlated subqueries.
+    # Safe to use f-string here: where_sql only holds fixed conditions with placeholders
+    query = f"""
+        SELECT 
+            o.*, 
+            u.first_name, 
+            u.last_name, 
+            u.email,
+            COALESCE(SUM(oi.quantity), 0) as total_quantity,
+            COUNT(oi.id) as item_count
+        FROM orders o
+        LEFT JOIN users u ON o.user_id = u.id
+        LEFT JOIN order_items oi ON oi.order_id = o.id
+        WHERE 1=1 {where_sql}
+        GROUP BY o.id, u.first_name, u.last_name, u.email
+        ORDER BY o.created_at DESC, o.id DESC
+    """
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
 
-# ========== ADMIN ORDER ENDPOINTS ==========
 @admin_bp.route('/orders', methods=['GET'])
 def get_all_orders():
-    """Get all orders (admin view)"""
+    """
+    Get orders (admin view), newest first.
+    
+    Optional filters: status (comma-separated), start_date / end_date (YYYY-MM-DD),
+    search (order number or customer email prefix).
+    Passing limit and/or cursor switches to keyset pagination on (created_at, id)
+    and wraps the result as {orders, next_cursor, has_more}; without them the
+    plain list is returned as before.
+    """
     try:
+        args = request.args
+        paginate = 'limit' in args or 'cursor' in args
+        limit = get_limit(args)
+        
+        statuses = [s.strip() for s in args.get('status', '').split(',') if s.strip()]
+        invalid = [s for s in statuses if s not in ORDER_STATUSES]
+        if invalid:
+            return jsonify({'error': f'Invalid status: {", ".join(invalid)}'}), 400
+        
+        after = None
+        cursor_token = args.get('cursor')
+        if cursor_token:
+            try:
+                created_at, order_id = decode_cursor(cursor_token, 2)
+                after = (cursor_timestamp(created_at), cursor_int(order_id))
+            except InvalidCursorError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        try:
+            # When paginating, fetch one extra row to know whether another page exists
+            query, params = build_admin_orders_query(
+                statuses, args.get('start_date'), args.get('end_date'),
+                search=args.get('search', '').strip(), after=after,
+                limit=limit + 1 if paginate else None)
+        except ValueError:
+            return jsonify({'error': 'Invalid date. Use YYYY-MM-DD'}), 400
+        
         conn = get_db()
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
         cursor = conn.cursor(dictionary=True)
-        
-        # FIXED: Calculate total quantity, not just row count
-        cursor.execute("""
-            SELECT 
-                o.*, 
-                u.first_name, 
-                u.last_name, 
-                u.email,
-                (SELECT SUM(quantity) FROM order_items WHERE order_id = o.id) as total_quantity,
-                (SELECT COUNT(*) FROM order_items WHERE order_id = o.id) as item_count
-            FROM orders o
-            LEFT JOIN users u ON o.user_id = u.id
-            ORDER BY o.created_at DESC
-        """)
-        
+        cursor.execute(query, params)
         orders = cursor.fetchall()
         
-        # Get order items for each order
-        for order in orders:
-            cursor.execute("""
-                SELECT 
-                    oi.*, 
-                    p.name, 
-                    p.image_url,
-                    p.description,
-                    oi.quantity  -- Make sure to get quantity from order_items
-                FROM order_items oi
-                JOIN products p ON oi.product_id = p.id
-                WHERE oi.order_id = %s
-            """, (order['id'],))
-            
-            items = cursor.fetchall()
-            
-            # Convert Decimal to float
-            for item in items:
-                if 'price_at_time' in item and isinstance(item['price_at_time'], Decimal):
-                    item['price_at_time'] = float(item['price_at_time'])
-                # Ensure quantity is integer
-                if 'quantity' in item:
-                    item['quantity'] = int(item['quantity'])
-            
-            order['items'] = items
+        has_more = paginate and len(orders) > limit
+        if has_more:
+            orders = orders[:limit]
+        
+        # Get order items for all orders in batched queries
+        attach_order_items(cursor, orders, include_description=True)
         
         cursor.close()
         conn.close()
         
+        next_cursor = encode_cursor(orders[-1]['created_at'], orders[-1]['id']) if has_more else None
+        
         # Convert Decimal to float and ensure integer counts
         for order in orders:
             if 'total_amount' in order and isinstance(order['total_amount'], Decimal):
@@ -112,10 +155,18 @@ def get_all_orders():
             if 'item_count' in order:
                 order['item_count'] = int(order['item_count']) if order['item_count'] else 0
         
-        return jsonify(orders), 200
+        if not paginate:
+            return jsonify(orders), 200
+        
+        return jsonify({
+            'orders': orders,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'limit': limit
+        }), 200
         
     except Exception as e:
-        print(f"❌ Get all orders error: {e}")
+        logger.exception("Get all orders error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/orders/<int:order_id>/approve', methods=['PUT'])
@@ -128,8 +179,8 @@ def approve_order(order_id):
         
         cursor = conn.cursor(dictionary=True)
         
-        # Check if order exists and is pending
-        cursor.execute("SELECT status FROM orders WHERE id = %s", (order_id,))
+        # Check if order exists and is pending (locked until the status change commits)
+        cursor.execute("SELECT status FROM orders WHERE id = %s FOR UPDATE", (order_id,))
         order = cursor.fetchone()
         
         if not order:
@@ -144,15 +195,19 @@ def approve_order(order_id):
         
         # Update order status to processing
         cursor.execute("UPDATE orders SET status = 'processing' WHERE id = %s", (order_id,))
+        sales_rollup.record_status_change(cursor, order_id, 'pending', 'processing')
+        user_stats.record_status_change(cursor, order_id, 'pending', 'processing')
         
         conn.commit()
         cursor.close()
         conn.close()
         
+        invalidate_sales_reports()
+        
         return jsonify({'message': 'Order approved successfully'}), 200
         
     except Exception as e:
-        print(f"❌ Approve order error: {e}")
+        logger.exception("Approve order error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/orders/<int:order_id>/decline', methods=['PUT'])
@@ -171,8 +226,8 @@ def decline_order(order_id):
         
         cursor = conn.cursor(dictionary=True)
         
-        # Check if order exists and is pending
-        cursor.execute("SELECT status FROM orders WHERE id = %s", (order_id,))
+        # Check if order exists and is pending (locked until the status change commits)
+        cursor.execute("SELECT status FROM orders WHERE id = %s FOR UPDATE", (order_id,))
         order = cursor.fetchone()
         
         if not order:
@@ -193,13 +248,11 @@ def decline_order(order_id):
         """, (order_id,))
         order_items = cursor.fetchall()
         
-        # Replenish stock for each item
+        # Replenish stock for each item (into its slots if the product is on the inventory ledger)
+        quantities = {}
         for item in order_items:
-            cursor.execute("""
-                UPDATE products 
-                SET stock_quantity = stock_quantity + %s 
-                WHERE id = %s
-            """, (item['quantity'], item['product_id']))
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+        inventory.restock(cursor, quantities)
         
         # Update order status to declined with reason
         cursor.execute("""
@@ -207,15 +260,21 @@ def decline_order(order_id):
             SET status = 'declined', decline_reason = %s 
             WHERE id = %s
         """, (decline_reason, order_id))
+        sales_rollup.record_status_change(cursor, order_id, 'pending', 'declined')
+        user_stats.record_status_change(cursor, order_id, 'pending', 'declined')
         
         conn.commit()
         cursor.close()
         conn.close()
         
+        # Stock went back up for every declined item
+        invalidate_products(item['product_id'] for item in order_items)
+        invalidate_sales_reports()
+        
         return jsonify({'message': 'Order declined successfully'}), 200
         
     except Exception as e:
-        print(f"❌ Decline order error: {e}")
+        logger.exception("Decline order error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # ========== ADMIN PRODUCT MANAGEMENT ENDPOINTS ==========
@@ -254,13 +313,15 @@ def create_product():
         cursor.close()
         conn.close()
         
+        invalidate_featured_products()
+        
         return jsonify({
             'message': 'Product created successfully',
             'product_id': product_id
         }), 201
         
     except Exception as e:
-        print(f"❌ Create product error: {e}")
+        logger.exception("Create product error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/products/<int:product_id>', methods=['PUT'])
@@ -318,14 +379,21 @@ def update_product(product_id):
             conn.close()
             return jsonify({'error': 'Product not found'}), 404
         
+        # Ledger products keep their stock in slots: spread the new total over them
+        if 'stock_quantity' in data:
+            inventory.set_stock(cursor, product_id, int(data['stock_quantity']))
+        
         conn.commit()
         cursor.close()
         conn.close()
         
+        invalidate_product(product_id)
+        invalidate_featured_products()
+        
         return jsonify({'message': 'Product updated successfully'}), 200
         
     except Exception as e:
-        print(f"❌ Update product error: {e}")
+        logger.exception("Update product error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/products/<int:product_id>', methods=['DELETE'])
@@ -350,10 +418,138 @@ def delete_product(product_id):
         cursor.close()
         conn.close()
         
+        invalidate_product(product_id)
+        invalidate_featured_products()
+        
         return jsonify({'message': 'Product deleted successfully'}), 200
         
     except Exception as e:
-        print(f"❌ Delete product error: {e}")
+        logger.exception("Delete product error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+# ========== ADMIN INVENTORY LEDGER ENDPOINTS ==========
+@admin_bp.route('/inventory/hot', methods=['GET'])
+def get_hot_products():
+    """List products whose stock is split into inventory slots"""
+    try:
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT s.product_id, p.name, p.stock_quantity, s.slot_no, s.quantity
+            FROM inventory_slots s
+            JOIN products p ON p.id = s.product_id
+            ORDER BY s.product_id, s.slot_no
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        
+        products = {}
+        for row in rows:
+            product = products.setdefault(row['product_id'], {
+                'product_id': row['product_id'],
+                'name': row['name'],
+                'stock_quantity': row['stock_quantity'],
+                'slot_total': 0,
+                'slots': []
+            })
+            product['slot_total'] += row['quantity']
+            product['slots'].append({'slot_no': row['slot_no'], 'quantity': row['quantity']})
+        
+        return jsonify(list(products.values())), 200
+        
+    except Exception as e:
+        logger.exception("Get hot products error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/products/<int:product_id>/inventory-slots', methods=['PUT'])
+def split_product_stock(product_id):
+    """Put a product on the inventory ledger, splitting its stock into slots"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            slots = int(data.get('slots', Config.INVENTORY_DEFAULT_SLOTS))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'slots must be an integer'}), 400
+        
+        if not 2 <= slots <= inventory.MAX_SLOTS:
+            return jsonify({'error': f'slots must be between 2 and {inventory.MAX_SLOTS}'}), 400
+        
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        cursor = conn.cursor(dictionary=True)
+        total = inventory.split_stock(cursor, product_id, slots)
+        
+        if total is None:
+            conn.rollback()
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Product not found'}), 404
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        invalidate_product(product_id)
+        
+        return jsonify({
+            'message': 'Product stock split into inventory slots',
+            'product_id': product_id,
+            'slots': slots,
+            'stock_quantity': total
+        }), 200
+        
+    except Exception as e:
+        logger.exception("Split product stock error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/products/<int:product_id>/inventory-slots', methods=['DELETE'])
+def merge_product_stock(product_id):
+    """Take a product off the inventory ledger, folding its slots back into stock_quantity"""
+    try:
+        conn = get_db()
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        cursor = conn.cursor(dictionary=True)
+        total = inventory.merge_stock(cursor, product_id)
+        
+        if total is None:
+            conn.rollback()
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Product is not on the inventory ledger'}), 404
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        invalidate_product(product_id)
+        
+        return jsonify({
+            'message': 'Inventory slots merged into product stock',
+            'product_id': product_id,
+            'stock_quantity': total
+        }), 200
+        
+    except Exception as e:
+        logger.exception("Merge product stock error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/inventory/reconcile', methods=['POST'])
+def reconcile_inventory():
+    """Rebalance inventory slots and copy their totals into products.stock_quantity now"""
+    try:
+        rebalanced, reconciled = inventory.run_maintenance()
+        return jsonify({'rebalanced': rebalanced, 'reconciled': reconciled}), 200
+        
+    except Exception as e:
+        logger.exception("Reconcile inventory error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # ========== ADMIN CATEGORY MANAGEMENT ENDPOINTS ==========
@@ -383,13 +579,15 @@ def create_category():
         cursor.close()
         conn.close()
         
+        invalidate_categories()
+        
         return jsonify({
             'message': 'Category created successfully',
             'category_id': category_id
         }), 201
         
     except Exception as e:
-        print(f"❌ Create category error: {e}")
+        logger.exception("Create category error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/categories/<int:category_id>', methods=['PUT'])
@@ -435,10 +633,15 @@ def update_category(category_id):
         cursor.close()
         conn.close()
         
+        invalidate_categories()
+        # Cached product rows carry the category name
+        product_cache.clear()
+        invalidate_featured_products()
+        
         return jsonify({'message': 'Category updated successfully'}), 200
         
     except Exception as e:
-        print(f"❌ Update category error: {e}")
+        logger.exception("Update category error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/categories/<int:category_id>', methods=['DELETE'])
@@ -471,10 +674,12 @@ def delete_category(category_id):
         cursor.close()
         conn.close()
         
+        invalidate_categories()
+        
         return jsonify({'message': 'Category deleted successfully'}), 200
         
     except Exception as e:
-        print(f"❌ Delete category error: {e}")
+        logger.exception("Delete category error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # ========== ADMIN SALES REPORTS ENDPOINTS ==========
@@ -489,524 +694,411 @@ def get_sales_report():
         if period not in ['daily', 'weekly', 'monthly']:
             return jsonify({'error': 'Invalid period. Use daily, weekly, or monthly'}), 400
         
-        conn = get_db()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
-        
-        cursor = conn.cursor(dictionary=True)
+        try:
+            report = get_sales_report_data(period, start_date, end_date)
+        except ValueError:
+            return jsonify({'error': 'Invalid date. Use YYYY-MM-DD'}), 400
         
-        # Build date filter
-        date_filter = ""
-        params = []
-        
-        if start_date:
-            date_filter += " AND DATE(o.created_at) >= %s"
-            params.append(start_date)
-        if end_date:
-            date_filter += " AND DATE(o.created_at) <= %s"
-            params.append(end_date)
-        
-        # Get date grouping configuration from helper function (prevents SQL injection)
-        date_group, date_format = get_date_grouping(period)
-        
-        # Dito rin Safe to use f-string here: date_group and date_format come from a validated whitelist
-        query = f"""
-            SELECT 
-                {date_group} as period,
-                DATE_FORMAT(o.created_at, '{date_format}') as period_label,
-                COUNT(DISTINCT o.id) as total_orders,
-                SUM(o.total_amount) as total_revenue,
-                AVG(o.total_amount) as average_order_value,
-                COUNT(DISTINCT o.user_id) as unique_customers,
-                SUM(CASE WHEN o.status = 'delivered' THEN 1 ELSE 0 END) as completed_orders,
-                SUM(CASE WHEN o.status = 'cancelled' THEN 1 ELSE 0 END) as cancelled_orders,
-                SUM(CASE WHEN o.status = 'declined' THEN 1 ELSE 0 END) as declined_orders
-            FROM orders o
-            WHERE o.status IN ('pending', 'processing', 'shipped', 'in_transit', 'delivered', 'cancelled', 'declined')
-            {date_filter}
-            GROUP BY {date_group}
-            ORDER BY period DESC
-            LIMIT 50
-        """
-        
-        cursor.execute(query, params)
-        sales_data = cursor.fetchall()
-        
-        # Get overall statistics
-        stats_query = f"""
-            SELECT 
-                COUNT(DISTINCT o.id) as total_orders,
-                SUM(o.total_amount) as total_revenue,
-                AVG(o.total_amount) as average_order_value,
-                COUNT(DISTINCT o.user_id) as unique_customers,
-                SUM(CASE WHEN o.status = 'delivered' THEN o.total_amount ELSE 0 END) as delivered_revenue,
-                COUNT(CASE WHEN o.status = 'delivered' THEN 1 END) as delivered_orders
-            FROM orders o
-            WHERE 1=1 {date_filter}
-        """
-        
-        cursor.execute(stats_query, params)
-        overall_stats = cursor.fetchone()
-        
-        # Get top selling products
-        top_products_query = f"""
-            SELECT 
-                p.id,
-                p.name,
-                p.image_url,
-                SUM(oi.quantity) as total_quantity_sold,
-                SUM(oi.quantity * oi.price_at_time) as total_revenue
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            JOIN orders o ON oi.order_id = o.id
-            WHERE o.status IN ('delivered', 'shipped', 'in_transit', 'processing')
-            {date_filter}
-            GROUP BY p.id, p.name, p.image_url
-            ORDER BY total_quantity_sold DESC
-            LIMIT 10
-        """
-        
-        cursor.execute(top_products_query, params)
-        top_products = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        # Convert Decimal to float
-        for item in sales_data:
-            if 'total_revenue' in item and item['total_revenue'] is not None:
-                item['total_revenue'] = float(item['total_revenue'])
-            if 'average_order_value' in item and item['average_order_value'] is not None:
-                item['average_order_value'] = float(item['average_order_value'])
-        
-        if overall_stats:
-            if 'total_revenue' in overall_stats and overall_stats['total_revenue'] is not None:
-                overall_stats['total_revenue'] = float(overall_stats['total_revenue'])
-            if 'average_order_value' in overall_stats and overall_stats['average_order_value'] is not None:
-                overall_stats['average_order_value'] = float(overall_stats['average_order_value'])
-            if 'delivered_revenue' in overall_stats and overall_stats['delivered_revenue'] is not None:
-                overall_stats['delivered_revenue'] = float(overall_stats['delivered_revenue'])
-        
-        for product in top_products:
-            if 'total_revenue' in product and product['total_revenue'] is not None:
-                product['total_revenue'] = float(product['total_revenue'])
+        if report is None:
+            return jsonify({'error': 'Database connection failed'}), 500
         
         return jsonify({
             'period': period,
             'start_date': start_date,
             'end_date': end_date,
-            'sales_data': sales_data,
-            'overall_stats': overall_stats,
-            'top_products': top_products
+            'sales_data': report['sales_data'],
+            'overall_stats': report['overall_stats'],
+            'top_products': report['top_products']
         }), 200
         
     except Exception as e:
-        print(f"❌ Get sales report error: {e}")
+        logger.exception("Get sales report error: %s", e)
         return jsonify({'error': str(e)}), 500
 
+def submit_sales_report_job(data):
+    """
+    Validate a report export request and queue it on the render pool.
+    Returns (job, None) or (None, error response).
+    """
+    format_type = data.get('format', 'pdf')  # pdf or docx
+    period = data.get('period', 'daily')
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    
+    if format_type not in ['pdf', 'docx']:
+        return None, (jsonify({'error': 'Invalid format. Use pdf or docx'}), 400)
+    
+    if period not in ['daily', 'weekly', 'monthly']:
+        return None, (jsonify({'error': 'Invalid period. Use daily, weekly, or monthly'}), 400)
+    
+    # Same memoized dataset the JSON report endpoint serves
+    try:
+        report = get_sales_report_data(period, start_date, end_date)
+    except ValueError:
+        return None, (jsonify({'error': 'Invalid date. Use YYYY-MM-DD'}), 400)
+    
+    if report is None:
+        return None, (jsonify({'error': 'Database connection failed'}), 500)
+    
+    return submit_report_job(format_type, period, start_date, end_date, report), None
+
+def report_job_response(job, status_code=200):
+    """Job metadata plus the URLs to poll and download it"""
+    body = dict(job)
+    body['status_url'] = f"/api/admin/reports/sales/jobs/{job['id']}"
+    body['download_url'] = f"/api/admin/reports/sales/jobs/{job['id']}/download"
+    return jsonify(body), status_code
+
+def send_report_file(job):
+    return send_file(
+        report_file_path(job),
+        mimetype=REPORT_MIMETYPES[job['format']],
+        as_attachment=True,
+        download_name=job['filename']
+    )
+
+def finished_job_response(job):
+    """The file of a done job, 500 for a failed one, else 202 with the job to poll"""
+    if job['status'] == 'done':
+        return send_report_file(job)
+    if job['status'] == 'failed':
+        return jsonify({'error': f"Report generation failed: {job['error']}"}), 500
+    return report_job_response(job, 202)
+
 @admin_bp.route('/reports/sales/generate', methods=['POST'])
 def generate_sales_report():
-    """Generate PDF or DOCX sales report"""
+    """Generate PDF or DOCX sales report (rendered on the report process pool)"""
     try:
-        data = request.get_json()
-        format_type = data.get('format', 'pdf')  # pdf or docx
-        period = data.get('period', 'daily')
-        start_date = data.get('start_date')
-        end_date = data.get('end_date')
+        job, error = submit_sales_report_job(request.get_json() or {})
+        if error:
+            return error
         
-        if format_type not in ['pdf', 'docx']:
-            return jsonify({'error': 'Invalid format. Use pdf or docx'}), 400
+        # Wait for the worker; slow renders answer 202 with the job to poll instead
+        job = wait_for_job(job, Config.REPORT_JOB_SYNC_TIMEOUT)
+        return finished_job_response(job)
         
-        if period not in ['daily', 'weekly', 'monthly']:
-            return jsonify({'error': 'Invalid period. Use daily, weekly, or monthly'}), 400
+    except Exception as e:
+        logger.exception("Generate sales report error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/reports/sales/jobs', methods=['POST'])
+def create_sales_report_job():
+    """Queue a PDF or DOCX sales report; poll the returned job and download it when done"""
+    try:
+        job, error = submit_sales_report_job(request.get_json() or {})
+        if error:
+            return error
         
-        # Get sales data using existing report logic
-        conn = get_db()
-        if not conn:
-            return jsonify({'error': 'Database connection failed'}), 500
+        return report_job_response(job, 202)
         
-        cursor = conn.cursor(dictionary=True)
-        
-        # Build date filter
-        date_filter = ""
-        params = []
+    except Exception as e:
+        logger.exception("Create sales report job error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/reports/sales/jobs/<job_id>', methods=['GET'])
+def get_sales_report_job(job_id):
+    """Status of a sales report job"""
+    job = get_report_job(job_id)
+    if not job:
+        return jsonify({'error': 'Report job not found'}), 404
+    
+    return report_job_response(job)
+
+@admin_bp.route('/reports/sales/jobs/<job_id>/download', methods=['GET'])
+def download_sales_report_job(job_id):
+    """Download the rendered file of a finished sales report job"""
+    job = get_report_job(job_id)
+    if not job:
+        return jsonify({'error': 'Report job not found'}), 404
+    
+    if job['status'] != 'done':
+        return jsonify({
+            'error': 'Report is not ready' if job['status'] != 'failed' else f"Report generation failed: {job['error']}",
+            'status': job['status']
+        }), 409
+    
+    return send_report_file(job)
+
+# Streaming exports: generator over period rows and response mimetype
+EXPORT_STREAMS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson')
+}
+
+@admin_bp.route('/reports/sales/export', methods=['GET'])
+def export_sales_report():
+    """
+    Every period of the sales report as streamed CSV or NDJSON, or a paged PDF.
+    
+    The PDF is rendered by a report job like /reports/sales/generate: sent when it
+    finishes within REPORT_JOB_SYNC_TIMEOUT, otherwise 202 with the job to poll.
+    """
+    try:
+        format_type = request.args.get('format', 'csv')  # csv, ndjson or pdf
+        period = request.args.get('period', 'daily')
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
         
-        if start_date:
-            date_filter += " AND DATE(o.created_at) >= %s"
-            params.append(start_date)
-        if end_date:
-            date_filter += " AND DATE(o.created_at) <= %s"
-            params.append(end_date)
-        
-        # Get date grouping configuration from helper function (prevents SQL injection)
-        date_group, date_format = get_date_grouping(period)
-        
-        # Dito rin Safe to use f-string here: date_group and date_format come from a validated whitelist
-        query = f"""
-            SELECT 
-                {date_group} as period,
-                DATE_FORMAT(o.created_at, '{date_format}') as period_label,
-                COUNT(DISTINCT o.id) as total_orders,
-                SUM(o.total_amount) as total_revenue,
-                AVG(o.total_amount) as average_order_value,
-                COUNT(DISTINCT o.user_id) as unique_customers,
-                SUM(CASE WHEN o.status = 'delivered' THEN 1 ELSE 0 END) as completed_orders,
-                SUM(CASE WHEN o.status = 'cancelled' THEN 1 ELSE 0 END) as cancelled_orders,
-                SUM(CASE WHEN o.status = 'declined' THEN 1 ELSE 0 END) as declined_orders
-            FROM orders o
-            WHERE o.status IN ('pending', 'processing', 'shipped', 'in_transit', 'delivered', 'cancelled', 'declined')
-            {date_filter}
-            GROUP BY {date_group}
-            ORDER BY period DESC
-            LIMIT 50
-        """
+        if format_type not in ['csv', 'ndjson', 'pdf']:
+            return jsonify({'error': 'Invalid format. Use csv, ndjson or pdf'}), 400
         
-        cursor.execute(query, params)
-        sales_data = cursor.fetchall()
-        
-        # Get overall statistics
-        stats_query = f"""
-            SELECT 
-                COUNT(DISTINCT o.id) as total_orders,
-                SUM(o.total_amount) as total_revenue,
-                AVG(o.total_amount) as average_order_value,
-                COUNT(DISTINCT o.user_id) as unique_customers,
-                SUM(CASE WHEN o.status = 'delivered' THEN o.total_amount ELSE 0 END) as delivered_revenue,
-                COUNT(CASE WHEN o.status = 'delivered' THEN 1 END) as delivered_orders
-            FROM orders o
-            WHERE 1=1 {date_filter}
-        """
-        
-        cursor.execute(stats_query, params)
-        overall_stats = cursor.fetchone()
-        
-        # Get top selling products
-        top_products_query = f"""
-            SELECT 
-                p.id,
-                p.name,
-                p.image_url,
-                SUM(oi.quantity) as total_quantity_sold,
-                SUM(oi.quantity * oi.price_at_time) as total_revenue
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            JOIN orders o ON oi.order_id = o.id
-            WHERE o.status IN ('delivered', 'shipped', 'in_transit', 'processing')
-            {date_filter}
-            GROUP BY p.id, p.name, p.image_url
-            ORDER BY total_quantity_sold DESC
-            LIMIT 10
-        """
-        
-        cursor.execute(top_products_query, params)
-        top_products = cursor.fetchall()
+        if period not in ['daily', 'weekly', 'monthly']:
+            return jsonify({'error': 'Invalid period. Use daily, weekly, or monthly'}), 400
         
-        cursor.close()
-        conn.close()
+        try:
+            sales_rollup.date_range_filter(start_date, end_date)
+        except ValueError:
+            return jsonify({'error': 'Invalid date. Use YYYY-MM-DD'}), 400
         
-        # Convert Decimal to float
-        for item in sales_data:
-            if 'total_revenue' in item and item['total_revenue'] is not None:
-                item['total_revenue'] = float(item['total_revenue'])
-            if 'average_order_value' in item and item['average_order_value'] is not None:
-                item['average_order_value'] = float(item['average_order_value'])
-        
-        if overall_stats:
-            if 'total_revenue' in overall_stats and overall_stats['total_revenue'] is not None:
-                overall_stats['total_revenue'] = float(overall_stats['total_revenue'])
-            if 'average_order_value' in overall_stats and overall_stats['average_order_value'] is not None:
-                overall_stats['average_order_value'] = float(overall_stats['average_order_value'])
-            if 'delivered_revenue' in overall_stats and overall_stats['delivered_revenue'] is not None:
-                overall_stats['delivered_revenue'] = float(overall_stats['delivered_revenue'])
-        
-        for product in top_products:
-            if 'total_revenue' in product and product['total_revenue'] is not None:
-                product['total_revenue'] = float(product['total_revenue'])
-        
-        # Generate report based on format
         if format_type == 'pdf':
-            file_buffer = generate_pdf_report(period, start_date, end_date, sales_data, overall_stats, top_products)
-            filename = f"sales_report_{period}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            mimetype = 'application/pdf'
-        else:  # docx
-            file_buffer = generate_docx_report(period, start_date, end_date, sales_data, overall_stats, top_products)
-            filename = f"sales_report_{period}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
-            mimetype = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        
-        return send_file(
-            file_buffer,
+            # Drawn straight from the database by a report worker process, off the request thread
+            job = wait_for_job(submit_export_job(period, start_date, end_date), Config.REPORT_JOB_SYNC_TIMEOUT)
+            return finished_job_response(job)
+        
+        # Not request-scoped: the teardown hook runs before the streamed body is
+        # read, so the connection is returned only once the response closes
+        conn = get_db(request_scoped=False)
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        try:
+            # Unbuffered: rows stay on the server until the writer asks for them
+            cursor = conn.cursor(dictionary=True)
+        except Exception:
+            conn.close()
+            raise
+        try:
+            rows = sales_rollup.iter_period_totals(cursor, period, start_date, end_date)
+        except Exception:
+            close_streaming_cursor(cursor, conn)
+            raise
+        filename = f"sales_report_{period}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format_type}"
+        
+        writer, mimetype = EXPORT_STREAMS[format_type]
+        response = Response(
+            writer(rows),
             mimetype=mimetype,
-            as_attachment=True,
-            download_name=filename
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
+        # Runs once the body is sent or the client goes away, even before the first row
+        response.call_on_close(lambda: close_streaming_cursor(cursor, conn))
+        return response
         
     except Exception as e:
-        print(f"❌ Generate sales report error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Export sales report error: %s", e)
         return jsonify({'error': str(e)}), 500
 
-def generate_pdf_report(period, start_date, end_date, sales_data, overall_stats, top_products):
-    """Generate PDF sales report using reportlab"""
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib import colors
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#2c3e50'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    elements.append(Paragraph("E-Commerce Sales Report", title_style))
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Report details
-    detail_style = styles['Normal']
-    elements.append(Paragraph(f"<b>Period:</b> {period.capitalize()}", detail_style))
-    if start_date:
-        elements.append(Paragraph(f"<b>Start Date:</b> {start_date}", detail_style))
-    if end_date:
-        elements.append(Paragraph(f"<b>End Date:</b> {end_date}", detail_style))
-    elements.append(Paragraph(f"<b>Generated:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", detail_style))
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Overall Statistics
-    elements.append(Paragraph("<b>Overall Statistics</b>", styles['Heading2']))
-    elements.append(Spacer(1, 0.1*inch))
+# ========== ANALYTICS REPORTS ==========
+def analytics_report(builder, **options):
+    """Run one analytics report over the cached snapshot for the request's date range"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
     
-    if overall_stats:
-        stats_data = [
-            ['Metric', 'Value'],
-            ['Total Orders', str(overall_stats.get('total_orders', 0))],
-            ['Total Revenue', f"${overall_stats.get('total_revenue', 0):,.2f}"],
-            ['Average Order Value', f"${overall_stats.get('average_order_value', 0):,.2f}"],
-            ['Unique Customers', str(overall_stats.get('unique_customers', 0))],
-            ['Delivered Orders', str(overall_stats.get('delivered_orders', 0))],
-            ['Delivered Revenue', f"${overall_stats.get('delivered_revenue', 0):,.2f}"],
-        ]
-        
-        stats_table = Table(stats_data, colWidths=[3*inch, 2*inch])
-        stats_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(stats_table)
-        elements.append(Spacer(1, 0.3*inch))
-    
-    # Sales Data by Period
-    if sales_data:
-        elements.append(Paragraph(f"<b>Sales Data by {period.capitalize()}</b>", styles['Heading2']))
-        elements.append(Spacer(1, 0.1*inch))
-        
-        sales_table_data = [['Period', 'Orders', 'Revenue', 'Avg Order', 'Customers']]
-        for item in sales_data[:20]:  # Limit to 20 rows for space
-            sales_table_data.append([
-                str(item.get('period_label', '')),
-                str(item.get('total_orders', 0)),
-                f"${item.get('total_revenue', 0):,.2f}",
-                f"${item.get('average_order_value', 0):,.2f}",
-                str(item.get('unique_customers', 0))
-            ])
-        
-        sales_table = Table(sales_table_data, colWidths=[1.5*inch, 1*inch, 1.2*inch, 1.2*inch, 1*inch])
-        sales_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(sales_table)
-        elements.append(Spacer(1, 0.3*inch))
+    try:
+        analytics.validate_dates(start_date, end_date)
+    except ValueError:
+        return jsonify({'error': 'Invalid date. Use YYYY-MM-DD'}), 400
     
-    # Top Products
-    if top_products:
-        elements.append(Paragraph("<b>Top 10 Selling Products</b>", styles['Heading2']))
-        elements.append(Spacer(1, 0.1*inch))
-        
-        products_table_data = [['Rank', 'Product Name', 'Quantity Sold', 'Revenue']]
-        for idx, product in enumerate(top_products, 1):
-            products_table_data.append([
-                str(idx),
-                str(product.get('name', ''))[:30],  # Truncate long names
-                str(product.get('total_quantity_sold', 0)),
-                f"${product.get('total_revenue', 0):,.2f}"
-            ])
-        
-        products_table = Table(products_table_data, colWidths=[0.7*inch, 2.5*inch, 1.3*inch, 1.5*inch])
-        products_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(products_table)
+    data = analytics.get_dataset()
+    if data is None:
+        return jsonify({'error': 'Database connection failed'}), 500
     
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+    report = builder(data, start_date, end_date, **options)
+    report.update({
+        'start_date': start_date,
+        'end_date': end_date,
+        'data_as_of': data['loaded_at']
+    })
+    return jsonify(report), 200
 
-def generate_docx_report(period, start_date, end_date, sales_data, overall_stats, top_products):
-    """Generate DOCX sales report using python-docx"""
-    from docx import Document
-    from docx.shared import Inches, Pt, RGBColor
-    from docx.enum.text import WD_ALIGN_PARAGRAPH
-    
-    doc = Document()
-    
-    # Title
-    title = doc.add_heading('E-Commerce Sales Report', 0)
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+@admin_bp.route('/reports/rfm', methods=['GET'])
+def get_rfm_report():
+    """Customer RFM segments (recency, frequency, monetary quintiles)"""
+    try:
+        return analytics_report(analytics.rfm_segments)
+    except Exception as e:
+        logger.exception("RFM report error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/reports/cohorts', methods=['GET'])
+def get_cohort_report():
+    """Monthly cohort retention; ?months= sets how many months to follow each cohort (1-36)"""
+    try:
+        months = request.args.get('months', 12, type=int)
+        if not months or not 1 <= months <= 36:
+            return jsonify({'error': 'months must be between 1 and 36'}), 400
+        
+        return analytics_report(analytics.cohort_retention, months=months)
+    except Exception as e:
+        logger.exception("Cohort report error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/reports/basket-size', methods=['GET'])
+def get_basket_size_report():
+    """Units per order distribution and order value percentiles"""
+    try:
+        return analytics_report(analytics.basket_sizes)
+    except Exception as e:
+        logger.exception("Basket size report error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/reports/category-revenue', methods=['GET'])
+def get_category_revenue_report():
+    """Revenue, units and orders per category"""
+    try:
+        return analytics_report(analytics.category_revenue)
+    except Exception as e:
+        logger.exception("Category revenue report error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+# ========== ADMIN USER MANAGEMENT ENDPOINTS ==========
+# sort -> (column, tie-breaker); always newest / highest first so pages resume on (column, id)
+USER_SORT_OPTIONS = {
+    'newest': ('u.created_at', 'u.id'),
+    'spent': ('s.total_spent', 's.user_id'),
+    'orders': ('s.total_orders', 's.user_id')
+}
+
+# sort_by -> check of the sort value carried in a keyset cursor
+USER_CURSOR_VALUES = {
+    'newest': cursor_timestamp,
+    'spent': cursor_decimal,
+    'orders': cursor_int
+}
+
+def build_user_directory_query(sort_by='newest', search='', after=None, limit=None):
+    """
+    SQL and params of the admin user directory (also checked by explain_check.py).
     
-    # Report details
-    doc.add_paragraph(f"Period: {period.capitalize()}")
-    if start_date:
-        doc.add_paragraph(f"Start Date: {start_date}")
-    if end_date:
-        doc.add_paragraph(f"End Date: {end_date}")
-    doc.add_paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    doc.add_paragraph()
+    sort_by is a USER_SORT_OPTIONS key; search is a username/email prefix;
+    after is the (sort value, id) of the previous page's last row.
+    """
+    sort_column, tie_column = USER_SORT_OPTIONS[sort_by]
     
-    # Overall Statistics
-    doc.add_heading('Overall Statistics', level=1)
-    if overall_stats:
-        stats_table = doc.add_table(rows=7, cols=2)
-        stats_table.style = 'Light Grid Accent 1'
-        
-        stats_table.rows[0].cells[0].text = 'Metric'
-        stats_table.rows[0].cells[1].text = 'Value'
-        stats_table.rows[1].cells[0].text = 'Total Orders'
-        stats_table.rows[1].cells[1].text = str(overall_stats.get('total_orders', 0))
-        stats_table.rows[2].cells[0].text = 'Total Revenue'
-        stats_table.rows[2].cells[1].text = f"${overall_stats.get('total_revenue', 0):,.2f}"
-        stats_table.rows[3].cells[0].text = 'Average Order Value'
-        stats_table.rows[3].cells[1].text = f"${overall_stats.get('average_order_value', 0):,.2f}"
-        stats_table.rows[4].cells[0].text = 'Unique Customers'
-        stats_table.rows[4].cells[1].text = str(overall_stats.get('unique_customers', 0))
-        stats_table.rows[5].cells[0].text = 'Delivered Orders'
-        stats_table.rows[5].cells[1].text = str(overall_stats.get('delivered_orders', 0))
-        stats_table.rows[6].cells[0].text = 'Delivered Revenue'
-        stats_table.rows[6].cells[1].text = f"${overall_stats.get('delivered_revenue', 0):,.2f}"
+    search_join = ""
+    where = []
+    params = []
     
-    doc.add_paragraph()
+    if search:
+        # A username OR email prefix on one scan of users can only use both indexes
+        # through index merge, so each prefix gets its own range scan and the ids are joined
+        pattern = escape_like(search) + '%'
+        search_join = """
+        JOIN (
+            SELECT id FROM users WHERE username LIKE %s
+            UNION
+            SELECT id FROM users WHERE email LIKE %s
+        ) m ON m.id = u.id"""
+        params.extend([pattern, pattern])
     
-    # Sales Data by Period
-    if sales_data:
-        doc.add_heading(f'Sales Data by {period.capitalize()}', level=1)
-        sales_table = doc.add_table(rows=min(len(sales_data) + 1, 21), cols=5)
-        sales_table.style = 'Light Grid Accent 1'
-        
-        # Headers
-        headers = sales_table.rows[0].cells
-        headers[0].text = 'Period'
-        headers[1].text = 'Orders'
-        headers[2].text = 'Revenue'
-        headers[3].text = 'Avg Order'
-        headers[4].text = 'Customers'
-        
-        # Data rows (limit to 20)
-        for idx, item in enumerate(sales_data[:20], 1):
-            cells = sales_table.rows[idx].cells
-            cells[0].text = str(item.get('period_label', ''))
-            cells[1].text = str(item.get('total_orders', 0))
-            cells[2].text = f"${item.get('total_revenue', 0):,.2f}"
-            cells[3].text = f"${item.get('average_order_value', 0):,.2f}"
-            cells[4].text = str(item.get('unique_customers', 0))
+    if after:
+        where.append(f"({sort_column} < %s OR ({sort_column} = %s AND {tie_column} < %s))")
+        params.extend([after[0], after[0], after[1]])
     
-    doc.add_paragraph()
+    where_sql = ''.join(f" AND {condition}" for condition in where)
     
-    # Top Products
-    if top_products:
-        doc.add_heading('Top 10 Selling Products', level=1)
-        products_table = doc.add_table(rows=len(top_products) + 1, cols=4)
-        products_table.style = 'Light Grid Accent 1'
-        
-        # Headers
-        headers = products_table.rows[0].cells
-        headers[0].text = 'Rank'
-        headers[1].text = 'Product Name'
-        headers[2].text = 'Quantity Sold'
-        headers[3].text = 'Revenue'
-        
-        # Data rows
-        for idx, product in enumerate(top_products, 1):
-            cells = products_table.rows[idx].cells
-            cells[0].text = str(idx)
-            cells[1].text = str(product.get('name', ''))
-            cells[2].text = str(product.get('total_quantity_sold', 0))
-            cells[3].text = f"${product.get('total_revenue', 0):,.2f}"
+    # Every user has a stats row (created with the user, see user_stats.py), so the
+    # counter sorts inner join and MySQL can walk idx_total_spent / idx_total_orders;
+    # the default listing keeps a LEFT JOIN so it never hides a user
+    join_sql = "LEFT JOIN" if sort_by == 'newest' else "JOIN"
     
-    # Save to buffer
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
+    # Safe to use f-string here: columns come from USER_SORT_OPTIONS and search_join /
+    # where_sql only hold fixed SQL with placeholders
+    query = f"""
+        SELECT 
+            u.id, u.username, u.email, u.first_name, u.last_name, 
+            u.phone, u.address, u.is_active, u.is_admin, u.created_at,
+            COALESCE(s.total_orders, 0) as total_orders,
+            COALESCE(s.delivered_orders, 0) as delivered_orders,
+            COALESCE(s.cancelled_orders, 0) as cancelled_orders,
+            COALESCE(s.declined_orders, 0) as declined_orders,
+            COALESCE(s.total_spent, 0) as total_spent
+        FROM users u{search_join}
+        {join_sql} user_order_stats s ON s.user_id = u.id
+        WHERE 1=1 {where_sql}
+        ORDER BY {sort_column} DESC, {tie_column} DESC
+    """
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
 
-# ========== ADMIN USER MANAGEMENT ENDPOINTS ==========
 @admin_bp.route('/users', methods=['GET'])
 def get_all_users():
-    """Get all users (admin view)"""
+    """
+    Get users (admin view) with their order counters from user_order_stats.
+    
+    Optional: sort (newest, spent, orders), search (username or email prefix).
+    Passing limit and/or cursor switches to keyset pagination on the sort
+    column and id and wraps the result as {users, next_cursor, has_more};
+    without them the plain list is returned as before.
+    """
     try:
+        args = request.args
+        paginate = 'limit' in args or 'cursor' in args
+        limit = get_limit(args)
+        
+        sort_by = args.get('sort', 'newest')
+        if sort_by not in USER_SORT_OPTIONS:
+            return jsonify({'error': 'Invalid sort. Use newest, spent or orders'}), 400
+        sort_column = USER_SORT_OPTIONS[sort_by][0]
+        
+        after = None
+        cursor_token = args.get('cursor')
+        if cursor_token:
+            try:
+                cursor_sort, cursor_value, cursor_id = decode_cursor(cursor_token, 3)
+            except InvalidCursorError as e:
+                return jsonify({'error': str(e)}), 400
+            if cursor_sort != sort_by:
+                return jsonify({'error': 'Cursor does not match sort'}), 400
+            try:
+                after = (USER_CURSOR_VALUES[sort_by](cursor_value), cursor_int(cursor_id))
+            except InvalidCursorError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        # When paginating, fetch one extra row to know whether another page exists
+        query, params = build_user_directory_query(
+            sort_by, search=args.get('search', '').strip(), after=after,
+            limit=limit + 1 if paginate else None)
+        
         conn = get_db()
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
         cursor = conn.cursor(dictionary=True)
-        
-        # Get all users with order statistics
-        cursor.execute("""
-            SELECT 
-                u.id, u.username, u.email, u.first_name, u.last_name, 
-                u.phone, u.address, u.is_active, u.is_admin, u.created_at,
-                COUNT(DISTINCT o.id) as total_orders,
-                SUM(CASE WHEN o.status = 'delivered' THEN o.total_amount ELSE 0 END) as total_spent
-            FROM users u
-            LEFT JOIN orders o ON u.id = o.user_id
-            GROUP BY u.id
-            ORDER BY u.created_at DESC
-        """)
-        
+        cursor.execute(query, params)
         users = cursor.fetchall()
         
         cursor.close()
         conn.close()
         
+        has_more = paginate and len(users) > limit
+        if has_more:
+            users = users[:limit]
+        
+        next_cursor = None
+        if has_more:
+            sort_key = sort_column.split('.', 1)[1]
+            next_cursor = encode_cursor(sort_by, users[-1][sort_key], users[-1]['id'])
+        
         # Convert Decimal to float
         for user in users:
-            if 'total_spent' in user and user['total_spent'] is not None:
+            if isinstance(user.get('total_spent'), Decimal):
                 user['total_spent'] = float(user['total_spent'])
         
-        return jsonify(users), 200
+        if not paginate:
+            return jsonify(users), 200
+        
+        return jsonify({
+            'users': users,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'limit': limit
+        }), 200
         
     except Exception as e:
-        print(f"❌ Get all users error: {e}")
+        logger.exception("Get all users error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/users/<int:user_id>/reset-password', methods=['PUT'])
@@ -1019,6 +1111,9 @@ def reset_user_password(user_id):
         if not new_password or len(new_password) < 6:
             return jsonify({'error': 'Password must be at least 6 characters'}), 400
         
+        # Hash before borrowing a connection so it is not held for the bcrypt round
+        hashed = passwords.hash_password(new_password)
+        
         conn = get_db()
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
@@ -1034,20 +1129,21 @@ def reset_user_password(user_id):
             conn.close()
             return jsonify({'error': 'User not found'}), 404
         
-        # Hash the new password
-        hashed = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt())
-        
         # Update password
         cursor.execute("""
             UPDATE users 
             SET password_hash = %s, updated_at = NOW()
             WHERE id = %s
-        """, (hashed.decode('utf-8'), user_id))
+        """, (hashed, user_id))
         
         conn.commit()
         cursor.close()
         conn.close()
         
+        # Log the user out everywhere
+        sessions.revoke_user(user_id)
+        User.invalidate(user_id)
+        
         return jsonify({
             'message': 'Password reset successfully',
             'user': {
@@ -1057,8 +1153,10 @@ def reset_user_password(user_id):
             }
         }), 200
         
+    except PasswordHasherBusy:
+        return passwords.busy_response()
     except Exception as e:
-        print(f"❌ Reset password error: {e}")
+        logger.exception("Reset password error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/users/<int:user_id>/deactivate', methods=['PUT'])
@@ -1096,6 +1194,9 @@ def deactivate_user(user_id):
         cursor.close()
         conn.close()
         
+        sessions.revoke_user(user_id)
+        User.invalidate(user_id)
+        
         return jsonify({
             'message': 'User deactivated successfully',
             'user': {
@@ -1107,7 +1208,7 @@ def deactivate_user(user_id):
         }), 200
         
     except Exception as e:
-        print(f"❌ Deactivate user error: {e}")
+        logger.exception("Deactivate user error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/users/<int:user_id>/activate', methods=['PUT'])
@@ -1145,6 +1246,9 @@ def activate_user(user_id):
         cursor.close()
         conn.close()
         
+        sessions.forget_principal(user_id)
+        User.invalidate(user_id)
+        
         return jsonify({
             'message': 'User activated successfully',
             'user': {
@@ -1156,7 +1260,7 @@ def activate_user(user_id):
         }), 200
         
     except Exception as e:
-        print(f"❌ Activate user error: {e}")
+        logger.exception("Activate user error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # ========== PRODUCT IMAGE UPLOAD ENDPOINT ==========
@@ -1214,13 +1318,14 @@ def upload_product_image(product_id):
         cursor.close()
         conn.close()
         
+        invalidate_product(product_id)
+        invalidate_featured_products()
+        
         return jsonify({
             'message': 'Image uploaded successfully',
             'image_url': image_url
         }), 200
         
     except Exception as e:
-        print(f"❌ Upload product image error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Upload product image error: %s", e)
         return jsonify({'error': str(e)}), 500
@@ -1,9 +1,14 @@
 from flask import Blueprint, request, jsonify
-from flask_login import login_user, logout_user, login_required, current_user
 from models.user import User
+import passwords
+import availability
+import sessions
+from passwords import PasswordHasherBusy
+from app_logging import get_logger
 import re
 
 auth_bp = Blueprint('auth', __name__)
+logger = get_logger('routes.auth')
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -11,7 +16,8 @@ def register():
     try:
         # Get JSON data
         data = request.get_json()
-        print(f"📝 Registration data: {data}")
+        logger.info("Registration request", extra={'fields': {
+            'username': data.get('username'), 'email': data.get('email')}})
         
         # Validate required fields
         required_fields = ['username', 'email', 'password', 'first_name', 'last_name']
@@ -35,7 +41,7 @@ def register():
         if len(data['password']) < 6:
             return jsonify({'error': 'Password must be at least 6 characters'}), 400
         
-        print(f"🔧 Creating user: {data['username']}")
+        logger.debug("Creating user %s", data['username'])
         
         # Create new user
         user = User.create(
@@ -49,22 +55,25 @@ def register():
         )
         
         if not user:
-            print(" User creation returned None")
+            logger.error("User creation returned None")
             return jsonify({'error': 'Failed to create user in database'}), 500
         
-        print(f"✅ User created: {user.id}")
+        logger.info("User created", extra={'fields': {'user_id': user.id}})
         
-        login_user(user, remember=True)
+        user_data = user.to_dict()
+        token = sessions.issue(user_data)
         
-        return jsonify({
+        response = jsonify({
             'message': 'Registration successful',
-            'user': user.to_dict()
-        }), 201
+            'user': user_data,
+            'token': token
+        })
+        return sessions.set_cookie(response, token), 201
         
+    except PasswordHasherBusy:
+        return passwords.busy_response()
     except Exception as e:
-        print(f" Registration error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Registration error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/login', methods=['POST'])
@@ -87,39 +96,52 @@ def login():
             return jsonify({'error': 'Account is deactivated. Contact admin.'}), 403
         
     
-        login_user(user, remember=data.get('remember', False))
+        user_data = user.to_dict()
+        token = sessions.issue(user_data)
         
-        return jsonify({
+        response = jsonify({
             'message': 'Login successful',
-            'user': user.to_dict()
-        }), 200
+            'user': user_data,
+            'token': token
+        })
+        return sessions.set_cookie(response, token), 200
         
+    except PasswordHasherBusy:
+        return passwords.busy_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/logout', methods=['POST'])
-@login_required
+@sessions.require_session()
 def logout():
-    """Logout user"""
-    logout_user()
-    return jsonify({'message': 'Logged out successfully'}), 200
+    """Logout user (revokes the session token)"""
+    sessions.revoke(sessions.current_session())
+    response = jsonify({'message': 'Logged out successfully'})
+    return sessions.clear_cookie(response), 200
 
 @auth_bp.route('/me', methods=['GET'])
-@login_required
+@sessions.require_session()
 def get_current_user():
-    """Get current user info"""
+    """Get current user info (from the principal cache, not a users lookup per request)"""
+    user = sessions.principal(sessions.current_session())
+    if not user:
+        return jsonify({'error': 'Authentication required'}), 401
     return jsonify({
-        'user': current_user.to_dict()
+        'user': user
     }), 200
 
 @auth_bp.route('/check-username/<username>', methods=['GET'])
 def check_username(username):
     """Check if username is available"""
+    if availability.definitely_available('username', username):
+        return jsonify({'available': True}), 200
     user = User.get_by_username(username)
     return jsonify({'available': user is None}), 200
 
 @auth_bp.route('/check-email/<email>', methods=['GET'])
 def check_email(email):
     """Check if email is available"""
+    if availability.definitely_available('email', email):
+        return jsonify({'available': True}), 200
     user = User.get_by_email(email)
     return jsonify({'available': user is None}), 200
\ No newline at end of file
@@ -1,25 +1,26 @@
 from flask import Blueprint, request, jsonify
-import mysql.connector
-from mysql.connector import Error
+from app_logging import get_logger
+from database import get_db
+import inventory
 from decimal import Decimal
 
 cart_bp = Blueprint('cart', __name__)
-
-def get_db():
-    """Get database connection"""
-    try:
-        DB_CONFIG = {
-            'host': 'localhost',
-            'user': 'root',
-            'password': '', 
-            'database': 'ecommerce_db'
-        }
-        return mysql.connector.connect(**DB_CONFIG)
-    except Error as e:
-        print(f"❌ Database error: {e}")
-        return None
+logger = get_logger('routes.cart')
 
 # ========== CART ENDPOINTS ==========
+def cart_items_query(user_id):
+    """SQL and params of a user's cart lines with product details (also checked by explain_check.py)"""
+    query = """
+        SELECT c.*, p.name, p.price, p.image_url, p.stock_quantity,
+               (p.price * c.quantity) as item_total,
+               c.quantity > p.stock_quantity as exceeds_stock
+        FROM cart c
+        JOIN products p ON c.product_id = p.id
+        WHERE c.user_id = %s
+        ORDER BY c.added_at DESC
+    """
+    return query, [user_id]
+
 @cart_bp.route('', methods=['GET'])
 def get_cart():
     """Get user's cart items"""
@@ -36,15 +37,7 @@ def get_cart():
         cursor = conn.cursor(dictionary=True)
         
         # Get cart items with product details
-        cursor.execute("""
-            SELECT c.*, p.name, p.price, p.image_url, p.stock_quantity,
-                   (p.price * c.quantity) as item_total,
-                   c.quantity > p.stock_quantity as exceeds_stock
-            FROM cart c
-            JOIN products p ON c.product_id = p.id
-            WHERE c.user_id = %s
-            ORDER BY c.added_at DESC
-        """, (user_id,))
+        cursor.execute(*cart_items_query(user_id))
         
         cart_items = cursor.fetchall()
         
@@ -78,7 +71,7 @@ def get_cart():
         }), 200
         
     except Exception as e:
-        print(f"❌ Get cart error: {e}")
+        logger.exception("Get cart error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/add', methods=['POST'])
@@ -117,12 +110,13 @@ def add_to_cart():
         if existing_item:
             new_quantity = existing_item['quantity'] + quantity
         
-        # Check stock availability
-        if new_quantity > product['stock_quantity']:
+        # Check stock availability (ledger products are read from their slots, without locking)
+        available = inventory.available_stock(cursor, int(product_id), product['stock_quantity'])
+        if new_quantity > available:
             cursor.close()
             conn.close()
             return jsonify({
-                'error': f'Not enough stock available. Maximum: {product["stock_quantity"]}'
+                'error': f'Not enough stock available. Maximum: {available}'
             }), 400
         
         if existing_item:
@@ -143,7 +137,7 @@ def add_to_cart():
         return jsonify({'message': message}), 200
         
     except Exception as e:
-        print(f"❌ Add to cart error: {e}")
+        logger.exception("Add to cart error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/update/<int:item_id>', methods=['PUT'])
@@ -178,11 +172,12 @@ def update_cart_item(item_id):
             return jsonify({'error': 'Cart item not found'}), 404
         
         # Check stock availability
-        if quantity > cart_item['stock_quantity']:
+        available = inventory.available_stock(cursor, cart_item['product_id'], cart_item['stock_quantity'])
+        if quantity > available:
             cursor.close()
             conn.close()
             return jsonify({
-                'error': f'Not enough stock available. Maximum: {cart_item["stock_quantity"]}'
+                'error': f'Not enough stock available. Maximum: {available}'
             }), 400
         
         if quantity == 0:
@@ -200,7 +195,7 @@ def update_cart_item(item_id):
         return jsonify({'message': message}), 200
         
     except Exception as e:
-        print(f"❌ Update cart error: {e}")
+        logger.exception("Update cart error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/validate-stock', methods=['GET'])
@@ -218,14 +213,21 @@ def validate_cart_stock():
         
         cursor = conn.cursor(dictionary=True)
         
-        # Check for items with insufficient stock
+        # Check for items with insufficient stock; for products on the inventory
+        # ledger the slot total is current, products.stock_quantity only a mirror
         cursor.execute("""
-            SELECT p.name, c.quantity, p.stock_quantity
+            SELECT p.name, c.quantity, COALESCE(s.total, p.stock_quantity) as stock_quantity
             FROM cart c
             JOIN products p ON c.product_id = p.id
+            LEFT JOIN (
+                SELECT product_id, CAST(SUM(quantity) AS SIGNED) as total
+                FROM inventory_slots
+                WHERE product_id IN (SELECT product_id FROM cart WHERE user_id = %s)
+                GROUP BY product_id
+            ) s ON s.product_id = p.id
             WHERE c.user_id = %s 
-            AND c.quantity > p.stock_quantity
-        """, (user_id,))
+            AND c.quantity > COALESCE(s.total, p.stock_quantity)
+        """, (user_id, user_id))
         
         out_of_stock_items = cursor.fetchall()
         
@@ -246,7 +248,7 @@ def validate_cart_stock():
         }), 200
         
     except Exception as e:
-        print(f"❌ Validate stock error: {e}")
+        logger.exception("Validate stock error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/remove/<int:item_id>', methods=['DELETE'])
@@ -272,7 +274,7 @@ def remove_cart_item(item_id):
         return jsonify({'message': 'Item removed from cart'}), 200
         
     except Exception as e:
-        print(f"❌ Remove cart item error: {e}")
+        logger.exception("Remove cart item error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @cart_bp.route('/clear/<int:user_id>', methods=['DELETE'])
@@ -293,5 +295,5 @@ def clear_cart(user_id):
         return jsonify({'message': 'Cart cleared'}), 200
         
     except Exception as e:
-        print(f"❌ Clear cart error: {e}")
+        logger.exception("Clear cart error: %s", e)
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -1,29 +1,95 @@
 from flask import Blueprint, request, jsonify
-import mysql.connector
-from mysql.connector import Error
+from app_logging import get_logger
+from database import get_db
+import inventory
+import sales_rollup
+import user_stats
+from reports import invalidate_sales_reports
+from idempotency import idempotent
+from .products import invalidate_products
 from decimal import Decimal
 import uuid
 import os
 from werkzeug.utils import secure_filename
 
 orders_bp = Blueprint('orders', __name__)
+logger = get_logger('routes.orders')
 
-def get_db():
-    """Get database connection"""
-    try:
-        DB_CONFIG = {
-            'host': 'localhost',
-            'user': 'root',
-            'password': '', 
-            'database': 'ecommerce_db'
-        }
-        return mysql.connector.connect(**DB_CONFIG)
-    except Error as e:
-        print(f"❌ Database error: {e}")
-        return None
+# Max order ids per IN (...) list when eager-loading order items
+ORDER_ITEMS_BATCH_SIZE = 500
+
+def order_items_query(order_ids, include_description=False):
+    """SQL and params for the items of a batch of orders (also checked by explain_check.py)"""
+    description_column = ", p.description" if include_description else ""
+    in_clause = ','.join(['%s'] * len(order_ids))
+    # Safe to use f-string: in_clause is only placeholders and the column comes from a fixed string
+    query = f"""
+        SELECT oi.*, p.name, p.image_url{description_column}
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.id
+        WHERE oi.order_id IN ({in_clause})
+        ORDER BY oi.order_id, oi.id
+    """
+    return query, list(order_ids)
+
+def user_orders_query(user_id):
+    """SQL and params of a customer's order list (also checked by explain_check.py)"""
+    query = """
+        SELECT o.id, o.user_id, o.order_number, o.total_amount, 
+               o.shipping_address, o.payment_method, o.status, 
+               o.decline_reason, o.payment_proof_url, o.payment_proof_filename,
+               o.created_at, o.updated_at,
+               COUNT(oi.id) as item_count
+        FROM orders o
+        LEFT JOIN order_items oi ON o.id = oi.order_id
+        WHERE o.user_id = %s
+        GROUP BY o.id
+        ORDER BY o.created_at DESC
+    """
+    return query, [user_id]
+
+def attach_order_items(cursor, orders, include_description=False):
+    """Load the items of all given orders in batched queries and set order['items']
+
+    Runs ceil(len(orders) / ORDER_ITEMS_BATCH_SIZE) queries instead of one per order.
+    """
+    items_by_order = {order['id']: [] for order in orders}
+    order_ids = list(items_by_order)
+    
+    for start in range(0, len(order_ids), ORDER_ITEMS_BATCH_SIZE):
+        batch = order_ids[start:start + ORDER_ITEMS_BATCH_SIZE]
+        cursor.execute(*order_items_query(batch, include_description))
+        
+        for item in cursor.fetchall():
+            # Convert Decimal to float
+            if 'price_at_time' in item and isinstance(item['price_at_time'], Decimal):
+                item['price_at_time'] = float(item['price_at_time'])
+            item['quantity'] = int(item['quantity'])
+            items_by_order[item['order_id']].append(item)
+    
+    for order in orders:
+        order['items'] = items_by_order[order['id']]
+    
+    return orders
+
+def get_failed_items(quantities, products):
+    """List the requested items that the locked product rows cannot cover"""
+    failed_items = []
+    for product_id, quantity in sorted(quantities.items()):
+        product = products.get(product_id)
+        available = product['stock_quantity'] if product else 0
+        if quantity > available:
+            failed_items.append({
+                'product_id': product_id,
+                'name': product['name'] if product else f'Product #{product_id}',
+                'requested': quantity,
+                'available': available
+            })
+    return failed_items
 
 # ========== ORDER ENDPOINTS ==========
 @orders_bp.route('', methods=['POST'])
+@idempotent
 def create_order():
     """Create a new order from cart"""
     try:
@@ -79,24 +145,82 @@ def create_order():
             conn.close()
             return jsonify({'error': 'No items selected or cart is empty'}), 400
         
-        # Validate stock and calculate total
-        total_amount = 0
-        order_items_data = []
+        quantities = {item['product_id']: item['quantity'] for item in cart_items}
+        product_ids = sorted(quantities)
         
-        for item in cart_items:
-            if item['quantity'] > item['stock_quantity']:
+        # Products on the inventory ledger are claimed from their slots below;
+        # the rest are decremented on the products row as usual
+        hot = inventory.hot_products(cursor)
+        hot_ids = [product_id for product_id in product_ids if product_id in hot]
+        regular_ids = [product_id for product_id in product_ids if product_id not in hot]
+        products = {item['product_id']: {'id': item['product_id'], 'name': item['name'], 'price': item['price']}
+                    for item in cart_items if item['product_id'] in hot}
+        
+        failed_items = []
+        if regular_ids:
+            in_clause = ','.join(['%s'] * len(regular_ids))
+            
+            # Lock the product rows in id order so concurrent checkouts queue up
+            # instead of deadlocking, then validate stock against the locked values
+            cursor.execute(f"""
+                SELECT id, name, price, stock_quantity
+                FROM products
+                WHERE id IN ({in_clause})
+                ORDER BY id
+                FOR UPDATE
+            """, regular_ids)
+            locked = {row['id']: row for row in cursor.fetchall()}
+            products.update(locked)
+            failed_items = get_failed_items({product_id: quantities[product_id] for product_id in regular_ids}, locked)
+        
+        # Claim ledger products after the row locks, in id order, so lock order stays consistent
+        for product_id in hot_ids:
+            claimed = inventory.claim(cursor, product_id, quantities[product_id])
+            if claimed is None:
+                # Taken off the ledger since we loaded the hot set
+                inventory.invalidate_hot()
+                conn.rollback()
                 cursor.close()
                 conn.close()
-                return jsonify({'error': f'Not enough stock for {item["name"]}'}), 400
-            
-            item_total = float(item['price']) * item['quantity']
-            total_amount += item_total
+                return jsonify({'error': 'Stock changed during checkout, please try again'}), 409
+            if not claimed:
+                failed_items.append({
+                    'product_id': product_id,
+                    'name': products[product_id]['name'],
+                    'requested': quantities[product_id],
+                    'available': inventory.available_stock(cursor, product_id, 0)
+                })
+        
+        if failed_items:
+            conn.rollback()
+            cursor.close()
+            conn.close()
+            return jsonify({
+                'error': f'Not enough stock for {", ".join(item["name"] for item in failed_items)}',
+                'failed_items': failed_items
+            }), 400
+        
+        if regular_ids:
+            # Decrement all stock in one statement; the WHERE guard makes it a no-op
+            # for any row that would go negative (or was moved onto the ledger meanwhile),
+            # so overselling is impossible
+            case_sql = ' '.join(['WHEN %s THEN %s'] * len(regular_ids))
+            case_params = [value for product_id in regular_ids for value in (product_id, quantities[product_id])]
+            cursor.execute(f"""
+                UPDATE products 
+                SET stock_quantity = stock_quantity - CASE id {case_sql} END 
+                WHERE id IN ({in_clause}) AND stock_quantity >= CASE id {case_sql} END
+                  AND NOT EXISTS (SELECT 1 FROM inventory_slots s WHERE s.product_id = products.id)
+            """, case_params + regular_ids + case_params)
             
-            order_items_data.append({
-                'product_id': item['product_id'],
-                'quantity': item['quantity'],
-                'price': item['price']
-            })
+            if cursor.rowcount != len(regular_ids):
+                inventory.invalidate_hot()
+                conn.rollback()
+                cursor.close()
+                conn.close()
+                return jsonify({'error': 'Stock changed during checkout, please try again'}), 409
+        
+        total_amount = sum(products[product_id]['price'] * quantities[product_id] for product_id in product_ids)
         
         # Generate order number
         order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
@@ -109,19 +233,16 @@ def create_order():
         
         order_id = cursor.lastrowid
         
-        # Create order items
-        for item_data in order_items_data:
-            cursor.execute("""
-                INSERT INTO order_items (order_id, product_id, quantity, price_at_time)
-                VALUES (%s, %s, %s, %s)
-            """, (order_id, item_data['product_id'], item_data['quantity'], item_data['price']))
-            
-            # Update product stock
-            cursor.execute("""
-                UPDATE products 
-                SET stock_quantity = stock_quantity - %s 
-                WHERE id = %s
-            """, (item_data['quantity'], item_data['product_id']))
+        # Create all order items with one multi-row insert
+        values_sql = ', '.join(['(%s, %s, %s, %s)'] * len(product_ids))
+        cursor.execute(f"""
+            INSERT INTO order_items (order_id, product_id, quantity, price_at_time)
+            VALUES {values_sql}
+        """, [value for product_id in product_ids
+              for value in (order_id, product_id, quantities[product_id], products[product_id]['price'])])
+        
+        sales_rollup.record_order_created(cursor, order_id)
+        user_stats.record_order_created(cursor, order_id)
         
         # Remove only the checked out items from the cart
         if selected_product_ids:
@@ -134,6 +255,10 @@ def create_order():
         
         conn.commit()
         
+        # Stock changed for every ordered product, and the sales reports gained an order
+        invalidate_products(product_ids)
+        invalidate_sales_reports()
+        
         # Get order details
         cursor.execute("""
             SELECT o.*, 
@@ -160,7 +285,7 @@ def create_order():
         }), 201
         
     except Exception as e:
-        print(f"❌ Create order error: {e}")
+        logger.exception("Create order error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/user/<int:user_id>', methods=['GET'])
@@ -173,38 +298,12 @@ def get_user_orders(user_id):
         
         cursor = conn.cursor(dictionary=True)
         
-        cursor.execute("""
-            SELECT o.id, o.user_id, o.order_number, o.total_amount, 
-                   o.shipping_address, o.payment_method, o.status, 
-                   o.decline_reason, o.payment_proof_url, o.payment_proof_filename,
-                   o.created_at, o.updated_at,
-                   COUNT(oi.id) as item_count
-            FROM orders o
-            LEFT JOIN order_items oi ON o.id = oi.order_id
-            WHERE o.user_id = %s
-            GROUP BY o.id
-            ORDER BY o.created_at DESC
-        """, (user_id,))
+        cursor.execute(*user_orders_query(user_id))
         
         orders = cursor.fetchall()
         
-        # Get order items for each order
-        for order in orders:
-            cursor.execute("""
-                SELECT oi.*, p.name, p.image_url
-                FROM order_items oi
-                JOIN products p ON oi.product_id = p.id
-                WHERE oi.order_id = %s
-            """, (order['id'],))
-            
-            items = cursor.fetchall()
-            
-            # Convert Decimal to float
-            for item in items:
-                if 'price_at_time' in item and isinstance(item['price_at_time'], Decimal):
-                    item['price_at_time'] = float(item['price_at_time'])
-            
-            order['items'] = items
+        # Get order items for all orders in batched queries
+        attach_order_items(cursor, orders)
         
         cursor.close()
         conn.close()
@@ -217,7 +316,7 @@ def get_user_orders(user_id):
         return jsonify(orders), 200
         
     except Exception as e:
-        print(f"❌ Get user orders error: {e}")
+        logger.exception("Get user orders error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/<int:order_id>', methods=['GET'])
@@ -265,7 +364,7 @@ def get_order(order_id):
         return jsonify(order), 200
         
     except Exception as e:
-        print(f"❌ Get order error: {e}")
+        logger.exception("Get order error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/<int:order_id>/status', methods=['PUT'])
@@ -284,25 +383,36 @@ def update_order_status(order_id):
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = conn.cursor()
-        cursor.execute("UPDATE orders SET status = %s WHERE id = %s", (status, order_id))
+        cursor = conn.cursor(dictionary=True)
         
-        if cursor.rowcount == 0:
+        # Lock the order so the sales rollup sees the status it is moving from
+        cursor.execute("SELECT status FROM orders WHERE id = %s FOR UPDATE", (order_id,))
+        order = cursor.fetchone()
+        
+        if not order:
+            conn.rollback()
             cursor.close()
             conn.close()
             return jsonify({'error': 'Order not found'}), 404
         
+        cursor.execute("UPDATE orders SET status = %s WHERE id = %s", (status, order_id))
+        sales_rollup.record_status_change(cursor, order_id, order['status'], status)
+        user_stats.record_status_change(cursor, order_id, order['status'], status)
+        
         conn.commit()
         cursor.close()
         conn.close()
         
+        invalidate_sales_reports()
+        
         return jsonify({'message': 'Order status updated'}), 200
         
     except Exception as e:
-        print(f"❌ Update order status error: {e}")
+        logger.exception("Update order status error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/<int:order_id>/payment-proof', methods=['POST'])
+@idempotent
 def upload_payment_proof(order_id):
     """Upload payment proof for online payment"""
     try:
@@ -357,14 +467,16 @@ def upload_payment_proof(order_id):
                 os.remove(file_path)
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         cursor.execute("""
-            UPDATE orders 
-            SET payment_proof_url = %s, payment_proof_filename = %s, status = 'processing'
+            SELECT status FROM orders 
             WHERE id = %s AND payment_method = 'online_payment'
-        """, (payment_proof_url, original_filename, order_id))
+            FOR UPDATE
+        """, (order_id,))
+        order = cursor.fetchone()
         
-        if cursor.rowcount == 0:
+        if not order:
+            conn.rollback()
             cursor.close()
             conn.close()
             # Clean up uploaded file if order not found
@@ -372,10 +484,20 @@ def upload_payment_proof(order_id):
                 os.remove(file_path)
             return jsonify({'error': 'Order not found or not online payment'}), 404
         
+        cursor.execute("""
+            UPDATE orders 
+            SET payment_proof_url = %s, payment_proof_filename = %s, status = 'processing'
+            WHERE id = %s
+        """, (payment_proof_url, original_filename, order_id))
+        sales_rollup.record_status_change(cursor, order_id, order['status'], 'processing')
+        user_stats.record_status_change(cursor, order_id, order['status'], 'processing')
+        
         conn.commit()
         cursor.close()
         conn.close()
         
+        invalidate_sales_reports()
+        
         return jsonify({
             'message': 'Payment proof uploaded successfully',
             'payment_proof_url': payment_proof_url,
@@ -383,7 +505,7 @@ def upload_payment_proof(order_id):
         }), 200
         
     except Exception as e:
-        print(f"❌ Upload payment proof error: {e}")
+        logger.exception("Upload payment proof error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # ========== ORDER MANAGEMENT ENDPOINTS (CUSTOMER) ==========
@@ -397,8 +519,8 @@ def cancel_order(order_id):
         
         cursor = conn.cursor(dictionary=True)
         
-        # Check if order exists and is pending
-        cursor.execute("SELECT status FROM orders WHERE id = %s", (order_id,))
+        # Check if order exists and is pending (locked until the status change commits)
+        cursor.execute("SELECT status FROM orders WHERE id = %s FOR UPDATE", (order_id,))
         order = cursor.fetchone()
         
         if not order:
@@ -419,23 +541,27 @@ def cancel_order(order_id):
         """, (order_id,))
         order_items = cursor.fetchall()
         
-        # Replenish stock for each item
+        # Replenish stock for each item (into its slots if the product is on the inventory ledger)
+        quantities = {}
         for item in order_items:
-            cursor.execute("""
-                UPDATE products 
-                SET stock_quantity = stock_quantity + %s 
-                WHERE id = %s
-            """, (item['quantity'], item['product_id']))
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+        inventory.restock(cursor, quantities)
         
         # Update order status to cancelled
         cursor.execute("UPDATE orders SET status = 'cancelled' WHERE id = %s", (order_id,))
+        sales_rollup.record_status_change(cursor, order_id, 'pending', 'cancelled')
+        user_stats.record_status_change(cursor, order_id, 'pending', 'cancelled')
         
         conn.commit()
         cursor.close()
         conn.close()
         
+        # Stock went back up for every cancelled item
+        invalidate_products(item['product_id'] for item in order_items)
+        invalidate_sales_reports()
+        
         return jsonify({'message': 'Order cancelled successfully'}), 200
         
     except Exception as e:
-        print(f"❌ Cancel order error: {e}")
+        logger.exception("Cancel order error: %s", e)
         return jsonify({'error': str(e)}), 500
@@ -1,146 +1,394 @@
 from flask import Blueprint, request, jsonify
-import mysql.connector
-from mysql.connector import Error
+from app_logging import get_logger
+from database import get_db, escape_like
+from pagination import (encode_cursor, decode_cursor, get_limit, InvalidCursorError,
+                        cursor_timestamp, cursor_decimal, cursor_string, cursor_int)
+from config import Config
+from cache import TTLCache
 from decimal import Decimal
+from operator import itemgetter
+import hashlib
+import heapq
+import json
+import random
+import re
 
 products_bp = Blueprint('products', __name__)
+logger = get_logger('routes.products')
 
-def get_db():
-    """Get database connection"""
-    try:
-        DB_CONFIG = {
-            'host': 'localhost',
-            'user': 'root',
-            'password': '', 
-            'database': 'ecommerce_db'
-        }
-        return mysql.connector.connect(**DB_CONFIG)
-    except Error as e:
-        print(f"❌ Database error: {e}")
+# sort_by -> (column, direction); p.id breaks ties in the same direction
+# so every ordering is total and can be resumed from a keyset cursor
+PRODUCT_SORT_OPTIONS = {
+    'newest': ('p.created_at', 'DESC'),
+    'price_low': ('p.price', 'ASC'),
+    'price_high': ('p.price', 'DESC'),
+    'name': ('p.name', 'ASC')
+}
+
+# sort_by -> check of the sort value carried in a keyset cursor
+PRODUCT_CURSOR_VALUES = {
+    'newest': cursor_timestamp,
+    'price_low': cursor_decimal,
+    'price_high': cursor_decimal,
+    'name': cursor_string
+}
+
+# InnoDB ignores shorter words in FULLTEXT indexes (innodb_ft_min_token_size)
+FULLTEXT_MIN_TOKEN_SIZE = 3
+FULLTEXT_MATCH = "MATCH(p.name, p.description) AGAINST (%s IN {mode})"
+
+def build_search_filter(search, search_mode='boolean'):
+    """
+    Turn the search box text into a WHERE condition backed by the ft_search FULLTEXT index.
+    Returns a tuple of (condition, params, relevance_expr, relevance_params);
+    relevance_expr is None when the search cannot be ranked.
+    
+    - boolean (default): every word is required and prefix-matched, for search-as-you-type
+    - natural: MySQL natural language mode, ranked but without prefix matching
+    Words shorter than the FULLTEXT minimum are dropped; if nothing is left the
+    text is matched as a name prefix instead (idx_name).
+    """
+    words = re.findall(r'\w+', search)
+    long_words = [w for w in words if len(w) >= FULLTEXT_MIN_TOKEN_SIZE]
+    
+    if not long_words:
+        return "p.name LIKE %s", [escape_like(search.strip()) + '%'], None, []
+    
+    if search_mode == 'natural':
+        mode, against = 'NATURAL LANGUAGE MODE', ' '.join(long_words)
+    else:
+        mode, against = 'BOOLEAN MODE', ' '.join(f'+{w}*' for w in long_words)
+    
+    match = FULLTEXT_MATCH.format(mode=mode)
+    return match, [against], match, [against]
+
+# Homepage featured products are sampled in memory from a pool that is reloaded
+# every FEATURED_POOL_TTL seconds or after an admin product change
+FEATURED_COUNT = 8
+featured_cache = TTLCache(maxsize=1, ttl=Config.FEATURED_POOL_TTL)
+
+# FEATURED_WEIGHTING -> (weight expression, pool ordering, extra join)
+FEATURED_POOL_OPTIONS = {
+    'none': ("1", "RAND()", ""),
+    'stock': ("p.stock_quantity", "weight DESC, p.id DESC", ""),
+    'sales': ("COALESCE(s.units_sold, 0)", "weight DESC, p.id DESC", """
+            LEFT JOIN (
+                SELECT product_id, SUM(quantity) as units_sold
+                FROM order_items
+                GROUP BY product_id
+            ) s ON s.product_id = p.id""")
+}
+
+def load_featured_pool():
+    """Load up to FEATURED_POOL_SIZE (weight, product) candidates; None if the DB is unavailable"""
+    conn = get_db()
+    if not conn:
+        return None
+    
+    cursor = conn.cursor(dictionary=True)
+    
+    weight_sql, order_sql, join_sql = FEATURED_POOL_OPTIONS.get(
+        Config.FEATURED_WEIGHTING, FEATURED_POOL_OPTIONS['none'])
+    
+    # Safe to use f-string: all fragments come from FEATURED_POOL_OPTIONS
+    cursor.execute(f"""
+        SELECT p.*, c.name as category_name, {weight_sql} as weight
+        FROM products p 
+        LEFT JOIN categories c ON p.category_id = c.id {join_sql}
+        WHERE p.is_active = TRUE 
+        ORDER BY {order_sql} 
+        LIMIT %s
+    """, (Config.FEATURED_POOL_SIZE,))
+    
+    rows = cursor.fetchall()
+    
+    cursor.close()
+    conn.close()
+    
+    pool = []
+    for product in rows:
+        weight = float(product.pop('weight') or 0)
+        # Convert Decimal to float
+        if 'price' in product and isinstance(product['price'], Decimal):
+            product['price'] = float(product['price'])
+        pool.append((max(weight, 0.0), product))
+    
+    return pool
+
+def sample_featured(pool, count=FEATURED_COUNT):
+    """Pick ``count`` distinct products from the pool, favouring heavier ones when weighted"""
+    if Config.FEATURED_WEIGHTING not in ('stock', 'sales'):
+        return [product for _, product in random.sample(pool, min(count, len(pool)))]
+    
+    # Weighted sampling without replacement (Efraimidis-Spirakis): key = u ** (1 / w)
+    keyed = [(random.random() ** (1.0 / (weight + 1.0)), product) for weight, product in pool]
+    return [product for _, product in heapq.nlargest(count, keyed, key=itemgetter(0))]
+
+def invalidate_featured_products():
+    """Force the featured pool to reload on the next homepage request"""
+    featured_cache.clear()
+
+# Category list is cached with its ETag until an admin category change or the TTL
+categories_cache = TTLCache(maxsize=1, ttl=Config.CATEGORY_CACHE_TTL)
+
+def load_categories():
+    """Load all categories with an ETag for their content; None if the DB is unavailable"""
+    conn = get_db()
+    if not conn:
         return None
+    
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM categories ORDER BY name")
+    categories = cursor.fetchall()
+    
+    cursor.close()
+    conn.close()
+    
+    body = json.dumps(categories, default=str, sort_keys=True)
+    etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+    return categories, etag
+
+def invalidate_categories():
+    """Force the category list to reload on the next request"""
+    categories_cache.clear()
+
+# Product detail rows keyed by id; dropped by admin product edits and stock changes
+product_cache = TTLCache(maxsize=Config.PRODUCT_CACHE_SIZE, ttl=Config.PRODUCT_CACHE_TTL)
+
+def invalidate_product(product_id):
+    """Drop one product from the detail cache after its row changed"""
+    product_cache.invalidate(int(product_id))
+
+def invalidate_products(product_ids):
+    """Drop several products from the detail cache (e.g. after an order changed stock)"""
+    for product_id in product_ids:
+        invalidate_product(product_id)
+
+def cache_stats():
+    """Hit/miss counters of the catalog caches"""
+    return {
+        'products': product_cache.stats(),
+        'categories': categories_cache.stats(),
+        'featured': featured_cache.stats()
+    }
+
+def build_product_filters(category_id=None, search_sql=None, search_params=(), min_price=None, max_price=None):
+    """Conditions (appended after p.is_active) and params of the product listing"""
+    filter_sql = ""
+    filter_params = []
+    
+    if category_id:
+        filter_sql += " AND p.category_id = %s"
+        filter_params.append(category_id)
+    
+    if search_sql:
+        filter_sql += f" AND {search_sql}"
+        filter_params.extend(search_params)
+    
+    if min_price is not None:
+        filter_sql += " AND p.price >= %s"
+        filter_params.append(min_price)
+    
+    if max_price is not None:
+        filter_sql += " AND p.price <= %s"
+        filter_params.append(max_price)
+    
+    return filter_sql, filter_params
+
+def build_product_list_query(filter_sql, filter_params, sort_by, limit, offset=0, after=None,
+                             relevance_sql=None, relevance_params=(), count_total=False):
+    """
+    SQL and params for one page of the product listing (also checked by explain_check.py).
+    
+    sort_by is a PRODUCT_SORT_OPTIONS key or 'relevance' (needs relevance_sql);
+    after is the (sort value, id) of the previous page's last row.
+    """
+    by_relevance = sort_by == 'relevance' and relevance_sql is not None
+    sort_column, sort_direction = PRODUCT_SORT_OPTIONS.get(sort_by, PRODUCT_SORT_OPTIONS['newest'])
+    
+    relevance_column = f", {relevance_sql} as relevance" if relevance_sql else ""
+    # The total comes from the same pass as a window count over the filtered rows
+    total_column = ", COUNT(*) OVER () as total_count" if count_total else ""
+    query = f"""
+        SELECT p.*, c.name as category_name{relevance_column}{total_column} 
+        FROM products p 
+        LEFT JOIN categories c ON p.category_id = c.id 
+        WHERE p.is_active = TRUE {filter_sql}
+    """
+    params = list(relevance_params) + list(filter_params)
+    
+    # Resume after the last row of the previous page
+    if after:
+        comparison = '<' if sort_direction == 'DESC' else '>'
+        query += f" AND ({sort_column} {comparison} %s OR ({sort_column} = %s AND p.id {comparison} %s))"
+        params.extend([after[0], after[0], after[1]])
+    
+    # Add sorting (safe to use f-string: column and direction come from PRODUCT_SORT_OPTIONS)
+    if by_relevance:
+        query += " ORDER BY relevance DESC, p.id DESC"
+    else:
+        query += f" ORDER BY {sort_column} {sort_direction}, p.id {sort_direction}"
+    
+    query += " LIMIT %s OFFSET %s"
+    params.extend([limit, offset])
+    return query, params
 
 # ========== PRODUCT CATALOG ENDPOINTS ==========
 @products_bp.route('/categories', methods=['GET'])
 def get_categories():
-    """Get all product categories"""
+    """Get all product categories (cached; supports If-None-Match revalidation)"""
     try:
-        conn = get_db()
-        if not conn:
+        cached = categories_cache.get_or_load('all', load_categories)
+        if cached is None:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM categories ORDER BY name")
-        categories = cursor.fetchall()
+        categories, etag = cached
         
-        cursor.close()
-        conn.close()
-        
-        return jsonify(categories), 200
+        response = jsonify(categories)
+        response.set_etag(etag)
+        # Let browsers keep a copy but revalidate it every time (answered with 304)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
         
     except Exception as e:
-        print(f"❌ Get categories error: {e}")
+        logger.exception("Get categories error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('', methods=['GET'])
 def get_products():
-    """Get products with filtering and pagination"""
+    """
+    Get products with filtering and pagination.
+    
+    Two pagination modes:
+    - page/per_page (default): LIMIT/OFFSET with total and total_pages, counted
+      in the same query; include_total=false returns has_more instead
+    - cursor: pass cursor (empty for the first page) to page by keyset on the
+      sort column plus id; returns next_cursor/has_more and never counts
+    
+    search uses the FULLTEXT index (search_mode=boolean|natural) and enables
+    sort_by=relevance, which is only available in page/per_page mode.
+    """
     try:
         # Get query parameters
         category_id = request.args.get('category_id', type=int)
-        search = request.args.get('search', '')
+        search = request.args.get('search', '').strip()
+        search_mode = request.args.get('search_mode', 'boolean')  # boolean, natural
         min_price = request.args.get('min_price', type=float)
         max_price = request.args.get('max_price', type=float)
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 12, type=int)
-        sort_by = request.args.get('sort_by', 'newest')  # newest, price_low, price_high, name
+        page = max(1, request.args.get('page', 1, type=int))
+        # The admin categories page still asks for per_page=1000 to count products
+        per_page = get_limit(request.args, default=12, maximum=1000, name='per_page')
+        sort_by = request.args.get('sort_by', 'newest')  # newest, price_low, price_high, name, relevance
+        cursor_mode = 'cursor' in request.args
+        cursor_token = request.args.get('cursor', '')
+        include_total = request.args.get('include_total', 'true').lower() not in ('0', 'false', 'no')
+        
+        search_sql, search_params, relevance_sql, relevance_params = (
+            build_search_filter(search, search_mode) if search else (None, [], None, [])
+        )
+        
+        by_relevance = sort_by == 'relevance' and relevance_sql is not None
+        if by_relevance and cursor_mode:
+            return jsonify({'error': 'sort_by=relevance is only supported with page/per_page'}), 400
+        
+        if sort_by not in PRODUCT_SORT_OPTIONS:
+            sort_by = 'newest'
+        sort_column = PRODUCT_SORT_OPTIONS[sort_by][0]
         
         # Calculate offset for pagination
         offset = (page - 1) * per_page
         
+        after = None
+        if cursor_token:
+            try:
+                cursor_sort, after_value, after_id = decode_cursor(cursor_token, 3)
+            except InvalidCursorError as e:
+                return jsonify({'error': str(e)}), 400
+            if cursor_sort != sort_by:
+                return jsonify({'error': 'Cursor does not match sort_by'}), 400
+            try:
+                after = (PRODUCT_CURSOR_VALUES[sort_by](after_value), cursor_int(after_id))
+            except InvalidCursorError as e:
+                return jsonify({'error': str(e)}), 400
+        
         conn = get_db()
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
         
         cursor = conn.cursor(dictionary=True)
         
-        # Build base query
-        query = """
-            SELECT p.*, c.name as category_name 
-            FROM products p 
-            LEFT JOIN categories c ON p.category_id = c.id 
-            WHERE p.is_active = TRUE
-        """
-        params = []
-        
-        # Add filters
-        if category_id:
-            query += " AND p.category_id = %s"
-            params.append(category_id)
-        
-        if search:
-            query += " AND (p.name LIKE %s OR p.description LIKE %s)"
-            params.extend([f"%{search}%", f"%{search}%"])
-        
-        if min_price is not None:
-            query += " AND p.price >= %s"
-            params.append(min_price)
-        
-        if max_price is not None:
-            query += " AND p.price <= %s"
-            params.append(max_price)
-        
-        # Add sorting
-        sort_options = {
-            'newest': 'p.created_at DESC',
-            'price_low': 'p.price ASC',
-            'price_high': 'p.price DESC',
-            'name': 'p.name ASC'
-        }
-        query += f" ORDER BY {sort_options.get(sort_by, 'p.created_at DESC')}"
-        
-        # Add pagination
-        query += " LIMIT %s OFFSET %s"
-        params.extend([per_page, offset])
+        # Build filters once; the page query and the (rare) fallback count share them
+        filter_sql, filter_params = build_product_filters(
+            category_id, search_sql, search_params, min_price, max_price)
+        
+        count_total = not cursor_mode and include_total
+        
+        # Without a total, one extra row tells whether another page exists
+        query, params = build_product_list_query(
+            filter_sql, filter_params, 'relevance' if by_relevance else sort_by,
+            limit=per_page if count_total else per_page + 1,
+            offset=0 if cursor_mode else offset,
+            after=after,
+            relevance_sql=relevance_sql, relevance_params=relevance_params,
+            count_total=count_total)
         
         # Execute main query
         cursor.execute(query, params)
         products = cursor.fetchall()
         
+        has_more = None
+        if not count_total:
+            has_more = len(products) > per_page
+            products = products[:per_page]
+        
+        next_cursor = None
+        if cursor_mode and has_more:
+            sort_key = sort_column.split('.', 1)[1]
+            next_cursor = encode_cursor(sort_by, products[-1][sort_key], products[-1]['id'])
+        
+        total = None
+        if count_total:
+            if products:
+                total = products[0]['total_count']
+            elif offset > 0:
+                # Page past the end returns no rows to carry the window count
+                cursor.execute(f"""
+                    SELECT COUNT(*) as total 
+                    FROM products p 
+                    WHERE p.is_active = TRUE {filter_sql}
+                """, filter_params)
+                total_result = cursor.fetchone()
+                total = total_result['total'] if total_result else 0
+            else:
+                total = 0
+        
+        cursor.close()
+        conn.close()
+        
         # Convert Decimal to float for JSON serialization
         for product in products:
+            product.pop('total_count', None)
             if 'price' in product and isinstance(product['price'], Decimal):
                 product['price'] = float(product['price'])
-        
-        # Get total count for pagination
-        count_query = """
-            SELECT COUNT(*) as total 
-            FROM products p 
-            WHERE p.is_active = TRUE
-        """
-        count_params = []
-        
-        if category_id:
-            count_query += " AND p.category_id = %s"
-            count_params.append(category_id)
-        
-        if search:
-            count_query += " AND (p.name LIKE %s OR p.description LIKE %s)"
-            count_params.extend([f"%{search}%", f"%{search}%"])
-        
-        if min_price is not None:
-            count_query += " AND p.price >= %s"
-            count_params.append(min_price)
-        
-        if max_price is not None:
-            count_query += " AND p.price <= %s"
-            count_params.append(max_price)
-        
-        cursor.execute(count_query, count_params)
-        total_result = cursor.fetchone()
-        total = total_result['total'] if total_result else 0
-        
-        cursor.close()
-        conn.close()
+            if 'relevance' in product:
+                product['relevance'] = float(product['relevance'])
+        
+        if cursor_mode:
+            return jsonify({
+                'products': products,
+                'per_page': per_page,
+                'sort_by': sort_by,
+                'next_cursor': next_cursor,
+                'has_more': has_more
+            }), 200
+        
+        if not count_total:
+            return jsonify({
+                'products': products,
+                'page': page,
+                'per_page': per_page,
+                'has_more': has_more
+            }), 200
         
         return jsonify({
             'products': products,
@@ -151,13 +399,17 @@ def get_products():
         }), 200
         
     except Exception as e:
-        print(f"❌ Get products error: {e}")
+        logger.exception("Get products error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/<int:product_id>', methods=['GET'])
 def get_product(product_id):
-    """Get single product by ID"""
+    """Get single product by ID (read-through product_cache)"""
     try:
+        product = product_cache.get(product_id)
+        if product is not None:
+            return jsonify(product), 200
+        
         conn = get_db()
         if not conn:
             return jsonify({'error': 'Database connection failed'}), 500
@@ -183,44 +435,25 @@ def get_product(product_id):
         if 'price' in product and isinstance(product['price'], Decimal):
             product['price'] = float(product['price'])
         
+        product_cache.set(product_id, product)
+        
         return jsonify(product), 200
         
     except Exception as e:
-        print(f"❌ Get product error: {e}")
+        logger.exception("Get product error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/featured', methods=['GET'])
 def get_featured_products():
     """Get featured products (for homepage)"""
     try:
-        conn = get_db()
-        if not conn:
+        # Get 8 random products from the cached pool; no query unless the pool expired
+        pool = featured_cache.get_or_load('pool', load_featured_pool)
+        if pool is None:
             return jsonify({'error': 'Database connection failed'}), 500
         
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get 8 random active products as featured
-        cursor.execute("""
-            SELECT p.*, c.name as category_name 
-            FROM products p 
-            LEFT JOIN categories c ON p.category_id = c.id 
-            WHERE p.is_active = TRUE 
-            ORDER BY RAND() 
-            LIMIT 8
-        """)
-        
-        products = cursor.fetchall()
-        
-        # Convert Decimal to float
-        for product in products:
-            if 'price' in product and isinstance(product['price'], Decimal):
-                product['price'] = float(product['price'])
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(products), 200
+        return jsonify(sample_featured(pool)), 200
         
     except Exception as e:
-        print(f"❌ Get featured products error: {e}")
+        logger.exception("Get featured products error: %s", e)
         return jsonify({'error': str(e)}), 500
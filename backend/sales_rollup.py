@@ -0,0 +1,310 @@
+"""
+Daily sales rollups behind the admin sales reports.
+
+Three tables are kept up to date in the same transaction as the order write:
+
+- sales_daily: orders, revenue and per-status counts per day. Each day is
+  split into ROLLUP_SHARDS rows (order_id % ROLLUP_SHARDS) so concurrent
+  checkouts do not queue on a single row.
+- sales_product_daily: quantity and revenue per product per day, counting
+  only orders in SOLD_STATUSES.
+- sales_customer_daily: which customers ordered on which day, for exact
+  unique-customer counts over any range.
+
+Days are DATE(orders.created_at), so reports group exactly as before.
+Rebuild from the raw tables with:
+
+    python sales_rollup.py rebuild [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+"""
+
+import argparse
+from datetime import datetime
+
+from database import get_db, get_date_range_filter
+from app_logging import get_logger
+
+logger = get_logger('sales_rollup')
+
+ROLLUP_SHARDS = 8
+
+ORDER_STATUSES = ['pending', 'processing', 'shipped', 'in_transit', 'delivered', 'cancelled', 'declined']
+
+# Orders whose items count towards product sales (top products)
+SOLD_STATUSES = {'processing', 'shipped', 'in_transit', 'delivered'}
+
+# Whitelisted GROUP BY expressions over sales_date and their label formats
+PERIOD_GROUPING = {
+    'daily': ("sales_date", "%Y-%m-%d"),
+    'weekly': ("YEARWEEK(sales_date, 1)", "Week %v, %Y"),
+    'monthly': ("DATE_FORMAT(sales_date, '%Y-%m')", "%Y-%m")
+}
+
+# Newest periods kept by the JSON report, its cache and the PDF/DOCX jobs (exports stream every period)
+REPORT_PERIOD_LIMIT = 50
+
+
+def status_column(status):
+    """Per-status counter column of sales_daily (whitelisted)"""
+    if status not in ORDER_STATUSES:
+        raise ValueError(f'Unknown order status: {status}')
+    return f'{status}_orders'
+
+
+def date_range_filter(start_date, end_date):
+    """Filter on sales_date for an inclusive YYYY-MM-DD range; raises ValueError on a bad date"""
+    sql = ""
+    params = []
+    if start_date:
+        sql += " AND sales_date >= %s"
+        params.append(datetime.strptime(start_date, '%Y-%m-%d').date())
+    if end_date:
+        sql += " AND sales_date <= %s"
+        params.append(datetime.strptime(end_date, '%Y-%m-%d').date())
+    return sql, params
+
+
+# ========== INCREMENTAL MAINTENANCE ==========
+def record_order_created(cursor, order_id):
+    """Add a new order (and its customer) to the rollups"""
+    cursor.execute(f"""
+        INSERT INTO sales_daily (sales_date, shard, total_orders, total_revenue, pending_orders)
+        SELECT DATE(created_at), id % {ROLLUP_SHARDS}, 1, total_amount, 1
+        FROM orders
+        WHERE id = %s
+        ON DUPLICATE KEY UPDATE
+            total_orders = total_orders + 1,
+            total_revenue = total_revenue + VALUES(total_revenue),
+            pending_orders = pending_orders + 1
+    """, (order_id,))
+    cursor.execute("""
+        INSERT INTO sales_customer_daily (sales_date, user_id, order_count)
+        SELECT DATE(created_at), user_id, 1
+        FROM orders
+        WHERE id = %s
+        ON DUPLICATE KEY UPDATE order_count = order_count + 1
+    """, (order_id,))
+
+
+def record_status_change(cursor, order_id, old_status, new_status):
+    """Move an order between status buckets (and in or out of product sales)"""
+    if old_status == new_status:
+        return
+
+    old_column = status_column(old_status)
+    new_column = status_column(new_status)
+    delivered_sign = (new_status == 'delivered') - (old_status == 'delivered')
+
+    # Safe to use f-string: column names come from the status whitelist and shards is a constant
+    cursor.execute(f"""
+        UPDATE sales_daily d
+        JOIN orders o ON d.sales_date = DATE(o.created_at) AND d.shard = o.id % {ROLLUP_SHARDS}
+        SET d.{old_column} = d.{old_column} - 1,
+            d.{new_column} = d.{new_column} + 1,
+            d.delivered_revenue = d.delivered_revenue + %s * o.total_amount
+        WHERE o.id = %s
+    """, (delivered_sign, order_id))
+
+    sold_sign = (new_status in SOLD_STATUSES) - (old_status in SOLD_STATUSES)
+    if sold_sign:
+        cursor.execute(*product_sales_query(order_id, sold_sign))
+
+
+def product_sales_query(order_id, sign):
+    """SQL and params adding (sign=1) or removing (-1) an order's items in sales_product_daily"""
+    query = """
+        INSERT INTO sales_product_daily (sales_date, product_id, quantity_sold, revenue)
+        SELECT DATE(o.created_at), oi.product_id,
+               %s * SUM(oi.quantity), %s * SUM(oi.quantity * oi.price_at_time)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.id = %s
+        GROUP BY DATE(o.created_at), oi.product_id
+        ON DUPLICATE KEY UPDATE
+            quantity_sold = quantity_sold + VALUES(quantity_sold),
+            revenue = revenue + VALUES(revenue)
+    """
+    return query, [sign, sign, order_id]
+
+
+# ========== REPORT QUERIES ==========
+def period_totals_query(period, start_date, end_date, limit=None):
+    """SQL and params for the newest ``limit`` periods in the range (all of them when None), newest first"""
+    date_group, date_format = PERIOD_GROUPING.get(period, PERIOD_GROUPING['daily'])
+    date_filter, params = date_range_filter(start_date, end_date)
+
+    # Distinct customers are not additive across days, so they are counted per period
+    # from sales_customer_daily and joined on.
+    # Safe to use f-string: date_group and date_format come from the PERIOD_GROUPING whitelist
+    query = f"""
+        SELECT t.*, COALESCE(c.unique_customers, 0) as unique_customers
+        FROM (
+            SELECT
+                {date_group} as period,
+                DATE_FORMAT(MIN(sales_date), '{date_format}') as period_label,
+                CAST(SUM(total_orders) AS SIGNED) as total_orders,
+                SUM(total_revenue) as total_revenue,
+                SUM(total_revenue) / NULLIF(SUM(total_orders), 0) as average_order_value,
+                CAST(SUM(delivered_orders) AS SIGNED) as completed_orders,
+                CAST(SUM(cancelled_orders) AS SIGNED) as cancelled_orders,
+                CAST(SUM(declined_orders) AS SIGNED) as declined_orders
+            FROM sales_daily
+            WHERE 1=1 {date_filter}
+            GROUP BY {date_group}
+        ) t
+        LEFT JOIN (
+            SELECT {date_group} as period, COUNT(DISTINCT user_id) as unique_customers
+            FROM sales_customer_daily
+            WHERE 1=1 {date_filter}
+            GROUP BY {date_group}
+        ) c ON c.period = t.period
+        ORDER BY t.period DESC
+    """
+    params = params + params
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+
+def period_totals(cursor, period, start_date=None, end_date=None, limit=REPORT_PERIOD_LIMIT):
+    """Orders, revenue, customers and status counts per period in the range, newest first"""
+    query, params = period_totals_query(period, start_date, end_date, limit)
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+def _iter_rows(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def iter_period_totals(cursor, period, start_date=None, end_date=None, batch_size=1000, limit=None):
+    """
+    Same rows as period_totals() but every period by default, fetched ``batch_size`` at a time.
+    The query runs immediately; use an unbuffered cursor so rows stay on the
+    server until they are read and memory does not grow with the number of periods.
+    """
+    query, params = period_totals_query(period, start_date, end_date, limit)
+    cursor.execute(query, params)
+    return _iter_rows(cursor, batch_size)
+
+
+def overall_totals(cursor, start_date=None, end_date=None):
+    """Totals over the whole range"""
+    date_filter, params = date_range_filter(start_date, end_date)
+    cursor.execute(f"""
+        SELECT
+            CAST(COALESCE(SUM(total_orders), 0) AS SIGNED) as total_orders,
+            SUM(total_revenue) as total_revenue,
+            SUM(total_revenue) / NULLIF(SUM(total_orders), 0) as average_order_value,
+            SUM(delivered_revenue) as delivered_revenue,
+            CAST(COALESCE(SUM(delivered_orders), 0) AS SIGNED) as delivered_orders
+        FROM sales_daily
+        WHERE 1=1 {date_filter}
+    """, params)
+    stats = cursor.fetchone()
+
+    cursor.execute(f"""
+        SELECT COUNT(DISTINCT user_id) as unique_customers
+        FROM sales_customer_daily
+        WHERE 1=1 {date_filter}
+    """, params)
+    stats['unique_customers'] = cursor.fetchone()['unique_customers']
+    return stats
+
+
+def top_products(cursor, start_date=None, end_date=None, limit=10):
+    """Best selling products by quantity over the range"""
+    date_filter, params = date_range_filter(start_date, end_date)
+    cursor.execute(f"""
+        SELECT
+            p.id,
+            p.name,
+            p.image_url,
+            CAST(SUM(s.quantity_sold) AS SIGNED) as total_quantity_sold,
+            SUM(s.revenue) as total_revenue
+        FROM sales_product_daily s
+        JOIN products p ON s.product_id = p.id
+        WHERE 1=1 {date_filter}
+        GROUP BY p.id, p.name, p.image_url
+        HAVING SUM(s.quantity_sold) > 0
+        ORDER BY total_quantity_sold DESC
+        LIMIT %s
+    """, params + [limit])
+    return cursor.fetchall()
+
+
+# ========== REBUILD ==========
+def rebuild(cursor, start_date=None, end_date=None):
+    """Recompute the rollups for an inclusive date range (everything by default) from orders"""
+    rollup_filter, rollup_params = date_range_filter(start_date, end_date)
+
+    # Raw-table filter on the created_at index: [start 00:00, end + 1 day 00:00)
+    order_filter, order_params = get_date_range_filter('o.created_at', start_date, end_date)
+
+    for table in ('sales_daily', 'sales_product_daily', 'sales_customer_daily'):
+        cursor.execute(f"DELETE FROM {table} WHERE 1=1 {rollup_filter}", rollup_params)
+
+    status_columns = ', '.join(status_column(status) for status in ORDER_STATUSES)
+    status_sums = ',\n'.join(
+        f"SUM(o.status = '{status}')" for status in ORDER_STATUSES)
+    cursor.execute(f"""
+        INSERT INTO sales_daily
+            (sales_date, shard, total_orders, total_revenue, delivered_revenue, {status_columns})
+        SELECT
+            DATE(o.created_at), o.id % {ROLLUP_SHARDS}, COUNT(*), SUM(o.total_amount),
+            SUM(CASE WHEN o.status = 'delivered' THEN o.total_amount ELSE 0 END),
+            {status_sums}
+        FROM orders o
+        WHERE 1=1 {order_filter}
+        GROUP BY DATE(o.created_at), o.id % {ROLLUP_SHARDS}
+    """, order_params)
+
+    sold_list = ', '.join(f"'{status}'" for status in sorted(SOLD_STATUSES))
+    cursor.execute(f"""
+        INSERT INTO sales_product_daily (sales_date, product_id, quantity_sold, revenue)
+        SELECT DATE(o.created_at), oi.product_id, SUM(oi.quantity), SUM(oi.quantity * oi.price_at_time)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.status IN ({sold_list}) {order_filter}
+        GROUP BY DATE(o.created_at), oi.product_id
+    """, order_params)
+
+    cursor.execute(f"""
+        INSERT INTO sales_customer_daily (sales_date, user_id, order_count)
+        SELECT DATE(o.created_at), o.user_id, COUNT(*)
+        FROM orders o
+        WHERE 1=1 {order_filter}
+        GROUP BY DATE(o.created_at), o.user_id
+    """, order_params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the daily sales rollup tables')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = subcommands.add_parser('rebuild', help='Recompute the rollups from orders')
+    rebuild_parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD)')
+    rebuild_parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD)')
+    args = parser.parse_args()
+
+    conn = get_db()
+    if not conn:
+        raise SystemExit('Database connection failed')
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        rebuild(cursor, args.start, args.end)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    logger.info("Sales rollups rebuilt", extra={'fields': {'start': args.start, 'end': args.end}})
+    print(f"Sales rollups rebuilt ({args.start or 'beginning'} .. {args.end or 'today'})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Signed, stateless session tokens.
+
+Login issues a token signed with SECRET_KEY. It carries the user id and the
+is_admin/is_active claims, plus an issue time and a random token id. It is
+sent back both in the response body (for an ``Authorization: Bearer`` header)
+and as an HttpOnly cookie. Verifying a token needs no database access:
+require_session() checks the signature, the SESSION_TTL expiry and the deny
+list, and admin checks read the claims.
+
+Revocation is handled by an in-memory deny list. Logout adds the token id
+until the token would have expired anyway. revoke_user() (deactivate, password
+reset) rejects every token of that user issued before the call. Each worker
+process keeps its own list, like the caches in cache.py.
+
+Profile fields for /api/auth/me come from a TTL-bounded principal cache keyed
+by user id. Admin user changes invalidate an entry through revoke_user() or
+forget_principal().
+"""
+
+import secrets
+import threading
+import time
+from functools import wraps
+
+from flask import g, jsonify, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from cache import TTLCache
+from config import Config
+from database import get_db
+from app_logging import get_logger
+
+logger = get_logger('sessions')
+
+COOKIE_NAME = 'session_token'
+PRINCIPAL_COLUMNS = "id, username, email, first_name, last_name, is_active, is_admin"
+
+_serializer = URLSafeTimedSerializer(Config.SECRET_KEY, salt='session')
+
+if Config.SECRET_KEY == 'your-secret-key-here':
+    logger.warning("SECRET_KEY is the default value; session tokens can be forged. Set SECRET_KEY in the environment")
+
+principal_cache = TTLCache(maxsize=Config.SESSION_PRINCIPAL_CACHE_SIZE, ttl=Config.SESSION_PRINCIPAL_CACHE_TTL)
+
+# token id -> wall time after which the token is expired anyway
+_denied_tokens = {}
+# user id -> wall time; tokens of that user issued earlier are rejected
+_revoked_users = {}
+_deny_lock = threading.Lock()
+
+
+def _prune(now):
+    for jti in [jti for jti, expires_at in _denied_tokens.items() if expires_at <= now]:
+        del _denied_tokens[jti]
+    for user_id in [user_id for user_id, revoked_at in _revoked_users.items()
+                    if revoked_at + Config.SESSION_TTL <= now]:
+        del _revoked_users[user_id]
+
+
+def issue(user):
+    """Signed token for a user row/dict with id, is_admin and is_active"""
+    return _serializer.dumps({
+        'uid': user['id'],
+        'adm': bool(user.get('is_admin')),
+        'act': bool(user.get('is_active', True)),
+        'iat': time.time(),
+        'jti': secrets.token_urlsafe(12)
+    })
+
+
+def verify(token):
+    """Claims of a valid, unexpired and not revoked token, else None"""
+    try:
+        claims = _serializer.loads(token, max_age=Config.SESSION_TTL)
+    except BadSignature:
+        # Also covers SignatureExpired
+        return None
+
+    with _deny_lock:
+        if claims.get('jti') in _denied_tokens:
+            return None
+        revoked_at = _revoked_users.get(claims.get('uid'))
+    if revoked_at is not None and claims.get('iat', 0) <= revoked_at:
+        return None
+    if not claims.get('act'):
+        return None
+    return claims
+
+
+def _request_token():
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):].strip()
+    return request.cookies.get(COOKIE_NAME)
+
+
+def current_session():
+    """Claims of the token sent with this request (memoized on g), or None"""
+    if 'session_claims' not in g:
+        token = _request_token()
+        g.session_claims = verify(token) if token else None
+    return g.session_claims
+
+
+def require_session(admin=False):
+    """Route decorator: 401 without a valid token, 403 when admin is required and missing"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            claims = current_session()
+            if claims is None:
+                return jsonify({'error': 'Authentication required'}), 401
+            if admin and not claims.get('adm'):
+                return jsonify({'error': 'Admin access required'}), 403
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def set_cookie(response, token):
+    response.set_cookie(COOKIE_NAME, token, max_age=int(Config.SESSION_TTL), httponly=True,
+                        secure=Config.SESSION_COOKIE_SECURE, samesite='Lax')
+    return response
+
+
+def clear_cookie(response):
+    response.delete_cookie(COOKIE_NAME, httponly=True, secure=Config.SESSION_COOKIE_SECURE, samesite='Lax')
+    return response
+
+
+def revoke(claims):
+    """Deny one token (logout) until it would expire"""
+    now = time.time()
+    with _deny_lock:
+        _prune(now)
+        _denied_tokens[claims['jti']] = claims.get('iat', now) + Config.SESSION_TTL
+
+
+def revoke_user(user_id):
+    """Reject every token issued so far to a user and drop the cached principal"""
+    now = time.time()
+    with _deny_lock:
+        _prune(now)
+        _revoked_users[user_id] = now
+    principal_cache.invalidate(user_id)
+
+
+def forget_principal(user_id):
+    """Drop the cached profile of a user whose row changed"""
+    principal_cache.invalidate(user_id)
+
+
+def _load_principal(user_id):
+    conn = get_db()
+    if not conn:
+        return None
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # Safe to use f-string: PRINCIPAL_COLUMNS is a constant
+        cursor.execute(f"SELECT {PRINCIPAL_COLUMNS} FROM users WHERE id = %s", (user_id,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def principal(claims):
+    """Profile of the token's user (cached); None if the user no longer exists or is inactive"""
+    user = principal_cache.get_or_load(claims['uid'], lambda: _load_principal(claims['uid']))
+    if not user or not user['is_active']:
+        return None
+    return user
+
+
+def stats():
+    """Principal cache counters and deny list sizes for monitoring"""
+    with _deny_lock:
+        _prune(time.time())
+        result = {'denied_tokens': len(_denied_tokens), 'revoked_users': len(_revoked_users)}
+    result['principals'] = principal_cache.stats()
+    return result
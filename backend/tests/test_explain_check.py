@@ -0,0 +1,44 @@
+"""
+The hot queries must keep using an index (see explain_check.py).
+
+Needs a MySQL database with realistic data, configured through the usual
+MYSQL_* settings; the test is skipped when no connection can be made.
+EXPLAIN_MIN_ROWS (default 100) is the --min-rows threshold of the script.
+
+    cd backend && python -m unittest tests.test_explain_check
+"""
+
+import io
+import os
+import sys
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('INVENTORY_RECONCILE_INTERVAL', '0')
+
+from database import get_db
+import explain_check
+
+
+class ExplainCheckTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = get_db(request_scoped=False)
+        if not self.conn:
+            self.skipTest('No database configured')
+        self.cursor = self.conn.cursor(dictionary=True)
+
+    def tearDown(self):
+        self.cursor.close()
+        self.conn.close()
+
+    def test_hot_queries_use_an_index(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            failures = explain_check.check(self.cursor, int(os.getenv('EXPLAIN_MIN_ROWS', '100')))
+
+        self.assertEqual(failures, 0, output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+The streamed sales export must keep its pooled connection checked out until
+the response body has been read, not just until the view returns, and must not
+hand a connection with unread rows back to the pool.
+
+    cd backend && python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('INVENTORY_RECONCILE_INTERVAL', '0')
+
+from flask import Flask
+
+import database
+from database import ConnectionPool, release_request_connections
+import instrumentation
+from routes.admin import admin_bp
+
+ROWS = [
+    {'period': f'2024-01-{day:02d}', 'total_orders': day, 'total_revenue': day * 10,
+     'average_order_value': 10, 'unique_customers': 1, 'delivered_orders': 0,
+     'delivered_revenue': 0}
+    for day in range(1, 29)
+]
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+        self.position = 0
+
+    def execute(self, query, params=None):
+        self.position = 0
+
+    def fetchmany(self, size):
+        self.pool.in_use_at_fetch.append(self.pool.stats()['in_use'])
+        rows = ROWS[self.position:self.position + size]
+        self.position += size
+        return rows
+
+    def fetchall(self):
+        self.pool.fetchall_calls += 1
+        rows = ROWS[self.position:]
+        self.position = len(ROWS)
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    in_transaction = False
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.last_cursor = None
+
+    @property
+    def unread_result(self):
+        return self.last_cursor is not None and self.last_cursor.position < len(ROWS)
+
+    def cursor(self, *args, **kwargs):
+        self.last_cursor = FakeCursor(self.pool)
+        return self.last_cursor
+
+    def close(self):
+        pass
+
+
+class FakePool(ConnectionPool):
+    def __init__(self):
+        super().__init__({}, max_size=2, timeout=1)
+        self.in_use_at_fetch = []
+        self.fetchall_calls = 0
+
+    def _connect(self):
+        return FakeConnection(self)
+
+
+class ExportStreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = FakePool()
+        self.saved_pool, database._pool = database._pool, self.pool
+
+        app = Flask(__name__)
+        app.teardown_appcontext(release_request_connections)
+        instrumentation.init_app(app)
+        app.register_blueprint(admin_bp, url_prefix='/api/admin')
+        self.client = app.test_client()
+
+    def tearDown(self):
+        database._pool = self.saved_pool
+
+    def export(self, format_type):
+        response = self.client.get(
+            f'/api/admin/reports/sales/export?format={format_type}', buffered=False)
+        self.assertEqual(response.status_code, 200)
+        # The view has returned and the request context is gone; nothing is read yet
+        self.assertEqual(self.pool.stats()['in_use'], 1)
+        body = b''.join(response.response)
+        response.close()
+        return body
+
+    def test_csv_rows_stream_while_connection_is_held(self):
+        body = self.export('csv').decode()
+
+        self.assertEqual(len(body.strip().splitlines()), len(ROWS) + 1)
+        self.assertTrue(self.pool.in_use_at_fetch)
+        self.assertTrue(all(in_use == 1 for in_use in self.pool.in_use_at_fetch))
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+        self.assertEqual(self.pool.stats()['idle'], 1)
+
+    def test_ndjson_rows_stream_while_connection_is_held(self):
+        body = self.export('ndjson').decode()
+
+        self.assertEqual(len(body.strip().splitlines()), len(ROWS))
+        self.assertTrue(all(in_use == 1 for in_use in self.pool.in_use_at_fetch))
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+
+    def test_abandoned_export_discards_its_connection(self):
+        response = self.client.get('/api/admin/reports/sales/export?format=csv', buffered=False)
+        next(iter(response.response))
+        # The client goes away after the first chunk
+        response.close()
+
+        self.assertEqual(self.pool.fetchall_calls, 0)
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+        self.assertEqual(self.pool.stats()['idle'], 0)
+        self.assertEqual(self.pool.stats()['connections_discarded'], 1)
+
+    def test_pdf_export_worker_draws_every_period(self):
+        from report_jobs import render_export_pdf
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'export.pdf')
+            size = render_export_pdf('daily', None, None, path)
+            with open(path, 'rb') as f:
+                body = f.read()
+
+        self.assertEqual(size, len(body))
+        self.assertTrue(body.startswith(b'%PDF'))
+        self.assertGreater(len(self.pool.in_use_at_fetch), 1)
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+        self.assertEqual(self.pool.stats()['idle'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
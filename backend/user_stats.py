@@ -0,0 +1,123 @@
+"""
+Per-user order counters behind the admin user directory.
+
+user_order_stats holds one row per user with the number of orders placed,
+delivered, cancelled and declined and the total spent (sum of delivered
+orders). Rows are created with the user and updated in the same transaction
+as the order write, so GET /api/admin/users can sort and page on them through
+their indexes instead of grouping every user's orders on each call.
+
+Rebuild from the raw tables (also creates rows for users that lack one) with:
+
+    python user_stats.py rebuild
+"""
+
+import argparse
+
+from database import get_db
+from app_logging import get_logger
+
+logger = get_logger('user_stats')
+
+# Order statuses with their own counter column
+COUNTED_STATUSES = {
+    'delivered': 'delivered_orders',
+    'cancelled': 'cancelled_orders',
+    'declined': 'declined_orders'
+}
+
+
+def create_user_stats(cursor, user_id):
+    """Add the (zeroed) counters row of a new user"""
+    cursor.execute("INSERT IGNORE INTO user_order_stats (user_id) VALUES (%s)", (user_id,))
+
+
+def record_order_created(cursor, order_id):
+    """Count a new order against its customer"""
+    cursor.execute("""
+        INSERT INTO user_order_stats (user_id, total_orders)
+        SELECT user_id, 1
+        FROM orders
+        WHERE id = %s
+        ON DUPLICATE KEY UPDATE total_orders = total_orders + 1
+    """, (order_id,))
+
+
+def record_status_change(cursor, order_id, old_status, new_status):
+    """Move an order between the status counters (and in or out of total_spent)"""
+    if old_status == new_status:
+        return
+
+    assignments = []
+    if old_status in COUNTED_STATUSES:
+        column = COUNTED_STATUSES[old_status]
+        assignments.append(f"s.{column} = s.{column} - 1")
+    if new_status in COUNTED_STATUSES:
+        column = COUNTED_STATUSES[new_status]
+        assignments.append(f"s.{column} = s.{column} + 1")
+
+    params = []
+    spent_sign = (new_status == 'delivered') - (old_status == 'delivered')
+    if spent_sign:
+        assignments.append("s.total_spent = s.total_spent + %s * o.total_amount")
+        params.append(spent_sign)
+
+    if not assignments:
+        return
+
+    # Safe to use f-string: column names come from COUNTED_STATUSES
+    cursor.execute(f"""
+        UPDATE user_order_stats s
+        JOIN orders o ON o.user_id = s.user_id
+        SET {', '.join(assignments)}
+        WHERE o.id = %s
+    """, params + [order_id])
+
+
+def rebuild(cursor):
+    """Recompute every user's counters from orders"""
+    status_sums = ',\n'.join(
+        f"COALESCE(SUM(o.status = '{status}'), 0)" for status in COUNTED_STATUSES)
+    status_columns = ', '.join(COUNTED_STATUSES.values())
+    status_updates = ', '.join(f"{column} = VALUES({column})" for column in COUNTED_STATUSES.values())
+
+    cursor.execute(f"""
+        INSERT INTO user_order_stats (user_id, total_orders, {status_columns}, total_spent)
+        SELECT
+            u.id, COUNT(o.id),
+            {status_sums},
+            COALESCE(SUM(CASE WHEN o.status = 'delivered' THEN o.total_amount ELSE 0 END), 0)
+        FROM users u
+        LEFT JOIN orders o ON o.user_id = u.id
+        GROUP BY u.id
+        ON DUPLICATE KEY UPDATE
+            total_orders = VALUES(total_orders),
+            {status_updates},
+            total_spent = VALUES(total_spent)
+    """)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the per-user order counters')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    subcommands.add_parser('rebuild', help='Recompute the counters from orders')
+    parser.parse_args()
+
+    conn = get_db()
+    if not conn:
+        raise SystemExit('Database connection failed')
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        rebuild(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    logger.info("User order stats rebuilt")
+    print("User order stats rebuilt")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+-- Full-text index used by the product search box (GET /api/products?search=...)
+-- Apply to databases created from an older schema.sql
+
+USE ecommerce_db;
+
+ALTER TABLE products ADD FULLTEXT INDEX ft_search (name, description);
@@ -0,0 +1,13 @@
+-- Inventory slots for hot products (PUT /api/admin/products/<id>/inventory-slots)
+-- Apply to databases created from an older schema.sql
+
+USE ecommerce_db;
+
+CREATE TABLE IF NOT EXISTS inventory_slots (
+    product_id INT NOT NULL,
+    slot_no SMALLINT UNSIGNED NOT NULL,
+    quantity INT NOT NULL DEFAULT 0 CHECK (quantity >= 0),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (product_id, slot_no),
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
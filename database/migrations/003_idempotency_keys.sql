@@ -0,0 +1,17 @@
+-- Idempotency-Key store for POST /api/orders and POST /api/orders/<id>/payment-proof
+-- Apply to databases created from an older schema.sql
+
+USE ecommerce_db;
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope VARCHAR(200) NOT NULL,
+    idem_key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status ENUM('in_progress', 'completed') NOT NULL DEFAULT 'in_progress',
+    response_status SMALLINT,
+    response_body MEDIUMTEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (scope, idem_key),
+    INDEX idx_expires_at (expires_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
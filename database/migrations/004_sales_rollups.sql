@@ -0,0 +1,37 @@
+-- Daily sales rollups served by GET /api/admin/reports/sales and the PDF/DOCX export
+-- Apply to databases created from an older schema.sql, then backfill from the
+-- existing orders with (from backend/): python sales_rollup.py rebuild
+
+USE ecommerce_db;
+
+CREATE TABLE IF NOT EXISTS sales_daily (
+    sales_date DATE NOT NULL,
+    shard TINYINT UNSIGNED NOT NULL,
+    total_orders INT NOT NULL DEFAULT 0,
+    total_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    delivered_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    pending_orders INT NOT NULL DEFAULT 0,
+    processing_orders INT NOT NULL DEFAULT 0,
+    shipped_orders INT NOT NULL DEFAULT 0,
+    in_transit_orders INT NOT NULL DEFAULT 0,
+    delivered_orders INT NOT NULL DEFAULT 0,
+    cancelled_orders INT NOT NULL DEFAULT 0,
+    declined_orders INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (sales_date, shard)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS sales_product_daily (
+    sales_date DATE NOT NULL,
+    product_id INT NOT NULL,
+    quantity_sold INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (sales_date, product_id),
+    INDEX idx_product (product_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS sales_customer_daily (
+    sales_date DATE NOT NULL,
+    user_id INT NOT NULL,
+    order_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (sales_date, user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,28 @@
+-- Composite indexes for the hot queries
+-- Apply to databases created from an older schema.sql (or run: python migrate.py up)
+--
+-- orders(user_id, created_at)      GET /api/orders (a customer's orders, newest first)
+-- orders(status, created_at)       GET /api/admin/orders?status=... (newest first)
+-- order_items(order_id, product_id, quantity, price_at_time)
+--                                  covers the per-order item reads of cancel and the sales rollups
+-- products(is_active, category_id, price)
+--                                  GET /api/products?category_id=... with price range / price sort
+-- products(is_active, price), products(is_active, created_at)
+--                                  GET /api/products sorted by price / newest
+--
+-- The old single-column indexes they start with are dropped once the
+-- composite index exists (it also satisfies the foreign keys).
+
+USE ecommerce_db;
+
+ALTER TABLE orders ADD INDEX idx_user_created (user_id, created_at);
+ALTER TABLE orders DROP INDEX idx_user;
+ALTER TABLE orders ADD INDEX idx_status_created (status, created_at);
+ALTER TABLE orders DROP INDEX idx_status;
+
+ALTER TABLE order_items ADD INDEX idx_order_product (order_id, product_id, quantity, price_at_time);
+
+ALTER TABLE products ADD INDEX idx_active_category_price (is_active, category_id, price);
+ALTER TABLE products ADD INDEX idx_active_price (is_active, price);
+ALTER TABLE products ADD INDEX idx_active_created (is_active, created_at);
+ALTER TABLE products DROP INDEX idx_active;
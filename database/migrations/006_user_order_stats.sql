@@ -0,0 +1,33 @@
+-- Per-user order counters for GET /api/admin/users (see backend/user_stats.py)
+-- Apply to databases created from an older schema.sql (or run: python migrate.py up)
+
+USE ecommerce_db;
+
+CREATE TABLE IF NOT EXISTS user_order_stats (
+    user_id INT PRIMARY KEY,
+    total_orders INT NOT NULL DEFAULT 0,
+    delivered_orders INT NOT NULL DEFAULT 0,
+    cancelled_orders INT NOT NULL DEFAULT 0,
+    declined_orders INT NOT NULL DEFAULT 0,
+    total_spent DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_total_spent (total_spent, user_id),
+    INDEX idx_total_orders (total_orders, user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Newest-first keyset paging of the user directory
+ALTER TABLE users ADD INDEX idx_created_at (created_at);
+
+-- Backfill one row per existing user
+INSERT IGNORE INTO user_order_stats
+    (user_id, total_orders, delivered_orders, cancelled_orders, declined_orders, total_spent)
+SELECT
+    u.id, COUNT(o.id),
+    COALESCE(SUM(o.status = 'delivered'), 0),
+    COALESCE(SUM(o.status = 'cancelled'), 0),
+    COALESCE(SUM(o.status = 'declined'), 0),
+    COALESCE(SUM(CASE WHEN o.status = 'delivered' THEN o.total_amount ELSE 0 END), 0)
+FROM users u
+LEFT JOIN orders o ON o.user_id = u.id
+GROUP BY u.id;
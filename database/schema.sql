@@ -22,7 +22,8 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_username (username),
-    INDEX idx_email (email)
+    INDEX idx_email (email),
+    INDEX idx_created_at (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ========================================
@@ -55,7 +56,10 @@ CREATE TABLE IF NOT EXISTS products (
     INDEX idx_category (category_id),
     INDEX idx_name (name),
     INDEX idx_price (price),
-    INDEX idx_active (is_active)
+    INDEX idx_active_category_price (is_active, category_id, price),
+    INDEX idx_active_price (is_active, price),
+    INDEX idx_active_created (is_active, created_at),
+    FULLTEXT INDEX ft_search (name, description)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- ========================================
@@ -91,9 +95,9 @@ CREATE TABLE IF NOT EXISTS orders (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-    INDEX idx_user (user_id),
+    INDEX idx_user_created (user_id, created_at),
     INDEX idx_order_number (order_number),
-    INDEX idx_status (status),
+    INDEX idx_status_created (status, created_at),
     INDEX idx_created_at (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -110,9 +114,116 @@ CREATE TABLE IF NOT EXISTS order_items (
     FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
     FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE RESTRICT,
     INDEX idx_order (order_id),
+    INDEX idx_order_product (order_id, product_id, quantity, price_at_time),
     INDEX idx_product (product_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- ========================================
+-- Inventory Slots Table
+-- Stock of hot (flash-sale) products, split across rows so concurrent
+-- checkouts lock different rows; products.stock_quantity mirrors the sum
+-- ========================================
+CREATE TABLE IF NOT EXISTS inventory_slots (
+    product_id INT NOT NULL,
+    slot_no SMALLINT UNSIGNED NOT NULL,
+    quantity INT NOT NULL DEFAULT 0 CHECK (quantity >= 0),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (product_id, slot_no),
+    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ========================================
+-- Idempotency Keys Table
+-- Stored responses of POST /api/orders and payment-proof uploads, by Idempotency-Key
+-- ========================================
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope VARCHAR(200) NOT NULL,
+    idem_key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status ENUM('in_progress', 'completed') NOT NULL DEFAULT 'in_progress',
+    response_status SMALLINT,
+    response_body MEDIUMTEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (scope, idem_key),
+    INDEX idx_expires_at (expires_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ========================================
+-- Sales Rollup Tables
+-- Derived from orders/order_items for the admin sales reports; kept up to
+-- date on order writes and rebuilt with: python sales_rollup.py rebuild
+-- ========================================
+CREATE TABLE IF NOT EXISTS sales_daily (
+    sales_date DATE NOT NULL,
+    shard TINYINT UNSIGNED NOT NULL,
+    total_orders INT NOT NULL DEFAULT 0,
+    total_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    delivered_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    pending_orders INT NOT NULL DEFAULT 0,
+    processing_orders INT NOT NULL DEFAULT 0,
+    shipped_orders INT NOT NULL DEFAULT 0,
+    in_transit_orders INT NOT NULL DEFAULT 0,
+    delivered_orders INT NOT NULL DEFAULT 0,
+    cancelled_orders INT NOT NULL DEFAULT 0,
+    declined_orders INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (sales_date, shard)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS sales_product_daily (
+    sales_date DATE NOT NULL,
+    product_id INT NOT NULL,
+    quantity_sold INT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (sales_date, product_id),
+    INDEX idx_product (product_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS sales_customer_daily (
+    sales_date DATE NOT NULL,
+    user_id INT NOT NULL,
+    order_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (sales_date, user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ========================================
+-- User Order Stats Table
+-- One row per user (created with the user), maintained with every order
+-- write by backend/user_stats.py; backs the admin user directory sorting
+-- ========================================
+CREATE TABLE IF NOT EXISTS user_order_stats (
+    user_id INT PRIMARY KEY,
+    total_orders INT NOT NULL DEFAULT 0,
+    delivered_orders INT NOT NULL DEFAULT 0,
+    cancelled_orders INT NOT NULL DEFAULT 0,
+    declined_orders INT NOT NULL DEFAULT 0,
+    total_spent DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_total_spent (total_spent, user_id),
+    INDEX idx_total_orders (total_orders, user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ========================================
+-- Schema Migrations Table
+-- Versions from database/migrations already applied (see backend/migrate.py).
+-- This file includes every migration up to the last row inserted below.
+-- ========================================
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum CHAR(64),
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO schema_migrations (version, name) VALUES
+('001', '001_products_fulltext.sql'),
+('002', '002_inventory_slots.sql'),
+('003', '003_idempotency_keys.sql'),
+('004', '004_sales_rollups.sql'),
+('005', '005_composite_indexes.sql'),
+('006', '006_user_order_stats.sql');
+
 -- ========================================
 -- Sample Data (Optional - for development/testing)
 -- ========================================